@@ -20,6 +20,7 @@
 #Built-in modules
 import sys
 import os
+import multiprocessing
 
 #Third-party modules
 import sip
@@ -32,10 +33,14 @@ from core.config_manager import *
 from gui.gui_manager import *
 
 import warnings
-pyqtRemoveInputHook() #Allow debugger to be used
 
-warnings.simplefilter('ignore', RuntimeWarning) 
-project_manager = ProjectManager()
-config_manager = ConfigManager()
-gui_manager = GuiManager(project_manager, config_manager)
-gui_manager.start_gui()
\ No newline at end of file
+#Analysis worker processes re-import this module, only the main process starts the GUI
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    pyqtRemoveInputHook() #Allow debugger to be used
+
+    warnings.simplefilter('ignore', RuntimeWarning) 
+    project_manager = ProjectManager()
+    config_manager = ConfigManager()
+    gui_manager = GuiManager(project_manager, config_manager)
+    gui_manager.start_gui()
\ No newline at end of file
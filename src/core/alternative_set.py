@@ -91,12 +91,12 @@ class AlternativeSet(object):
 	def get_all_alternatives(self):
 		"""Returns all alternatives in set in list structure [[id, name], ...]
 		"""
-		return list(self.table.select(order_by=self.table.c.alternative_id).execute())
+		return list(self.table.select(order_by=[self.table.c.alternative_id]).execute())
 
 	def get_alternative_names(self):
 		"""Returns all alternatives in set in list structure [[id, name], ...]
 		"""
-		return list(self.table.select([self.table.c.name], order_by=self.table.c.alternative_id).execute())
+		return list(self.table.select([self.table.c.name], order_by=[self.table.c.alternative_id]).execute())
 
 	def get_alternative_id_by_name(self, name):
 		"""Returns alternative id given an alternative name"""
@@ -114,7 +114,7 @@ class AlternativeSet(object):
 		"""Returns list of IDs of alternatives currently loaded
 		"""
 		altern_id_list = []
-		for row in self.table.select(order_by=self.table.c.alternative_id).execute():
+		for row in self.table.select(order_by=[self.table.c.alternative_id]).execute():
 			altern_id_list.append(row.alternative_id)
 		return altern_id_list
 	
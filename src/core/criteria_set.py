@@ -117,8 +117,8 @@ class CriteriaSet(object):
     def get_all_criteria(self):
         """Returns criteria as a list
         """
-        #return list(self.table.select(order_by=self.table.c.criteria_id).execute())
-        criteria_rows = self.table.select(order_by=self.table.c.criteria_id).execute().fetchall()
+        #return list(self.table.select(order_by=[self.table.c.criteria_id]).execute())
+        criteria_rows = self.table.select(order_by=[self.table.c.criteria_id]).execute().fetchall()
         criteria_recs = []
         for row in criteria_rows:
             cur_row = list(row)
@@ -134,7 +134,7 @@ class CriteriaSet(object):
         """Returns list of IDs of criteria currently loaded
         """
         crit_id_list = []
-        for row in self.table.select(order_by=self.table.c.criteria_id).execute():
+        for row in self.table.select(order_by=[self.table.c.criteria_id]).execute():
             crit_id_list.append(row.criteria_id)
         return crit_id_list    
 
@@ -0,0 +1,329 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - lazily evaluated, instrumented stages of an Evamix analysis
+#===============================================================================
+
+import os
+import sys
+import time
+
+from delphos_exceptions import *
+
+try:
+    import resource
+except ImportError:
+    #Not available on Windows
+    resource = None
+
+def get_cpu_time():
+    """User plus system CPU time of this process in seconds"""
+    times = os.times()
+    return times[0] + times[1]
+
+def get_max_rss():
+    """Peak resident memory of this process in bytes, None where not available"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+def get_rss():
+    """Current resident memory of this process in bytes, None where not
+    available (read from /proc so only on Linux)
+    """
+    if resource is None:
+        return None
+    try:
+        statm = open('/proc/self/statm')
+    except IOError:
+        return None
+    try:
+        resident = int(statm.read().split()[1])
+    finally:
+        statm.close()
+    return resident * resource.getpagesize()
+
+def get_rss_change(start_rss):
+    """Change in resident memory since start_rss (from get_rss), None where not available"""
+    rss = get_rss()
+    if rss is None or start_rss is None:
+        return None
+    return rss - start_rss
+
+def get_memory_size(output):
+    """Approximate bytes of memory held by a stage output.  Arrays count their
+    data, memory mapped files count nothing, lists and tuples count their
+    items
+    """
+    if output is None:
+        return 0
+    if hasattr(output, 'get_memory_size'):
+        return output.get_memory_size()
+    if hasattr(output, 'nbytes'):
+        if getattr(output, 'filename', None):
+            return 0
+        return int(output.nbytes)
+    if isinstance(output, (list, tuple)):
+        return sys.getsizeof(output) + sum([get_memory_size(item) for item in output])
+    return sys.getsizeof(output)
+
+def get_shape(output):
+    """Shape of a stage output, a tuple for matrices and lists, a list of
+    shapes for a tuple of outputs and () for single values
+    """
+    if hasattr(output, 'shape'):
+        return tuple(output.shape)
+    if isinstance(output, tuple):
+        return [get_shape(item) for item in output]
+    if isinstance(output, list):
+        if output and isinstance(output[0], list):
+            return (len(output), len(output[0]))
+        return (len(output),)
+    return ()
+
+class StageInfo(object):
+    """Measurements of one run of an analysis stage, given to each StageHook.
+
+    The stage output is only held while the hooks are called, then it is
+    measured and released so that hooks which keep their StageInfos (eg. a
+    StageRecorder on Project.mca_hooks) do not keep the outputs of finished
+    runs alive.  No reference to the pipeline is kept.
+
+    rss_change is the change in resident memory over the stage (what it kept,
+    less what it freed) and is the measure of what the stage allocated,
+    max_rss the peak resident memory of the whole process when the stage
+    finished, which only grows from stage to stage.  Either is None where it
+    can not be measured.  get_output_bytes is only the size of the output.
+    """
+    def __init__(self, name, wall_time, cpu_time, rss_change, max_rss, output):
+        self.name = name
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.rss_change = rss_change
+        self.max_rss = max_rss
+        self.output = output
+        self.output_bytes = None
+        self.output_shapes = None
+
+    def get_output(self):
+        """The stage output, None once released"""
+        return self.output
+
+    def get_output_bytes(self):
+        """Bytes of memory held by the stage output, not counting anything the
+        stage allocated and freed or kept elsewhere, see rss_change"""
+        if self.output_bytes is None:
+            self.output_bytes = get_memory_size(self.output)
+        return self.output_bytes
+
+    def get_output_shapes(self):
+        if self.output_shapes is None:
+            self.output_shapes = get_shape(self.output)
+        return self.output_shapes
+
+    def release(self):
+        """Measures the output then drops it, called after the hooks have seen it"""
+        self.get_output_bytes()
+        self.get_output_shapes()
+        self.output = None
+
+    def __str__(self):
+        return "%s: %.4fs wall, %.4fs cpu, %d bytes, shape %s" % (self.name, self.wall_time, self.cpu_time,
+            self.get_output_bytes(), self.get_output_shapes())
+
+class StageHook(object):
+    """Receives a StageInfo as each analysis stage finishes, override stage_finished"""
+    def stage_finished(self, info):
+        pass
+
+class StageRecorder(StageHook):
+    """Keeps the StageInfo of every stage run, in the order they ran"""
+    def __init__(self):
+        self.infos = []
+
+    def stage_finished(self, info):
+        self.infos.append(info)
+
+    def get_info(self, name):
+        for info in self.infos:
+            if info.name == name:
+                return info
+        return None
+
+    def get_total_wall_time(self):
+        return sum([info.wall_time for info in self.infos])
+
+class DebugHook(StageHook):
+    """Prints a one line summary of each stage (used by Evamix.debug)"""
+    def stage_finished(self, info):
+        print str(info)
+
+class AnalysisProgress(object):
+    """Progress and cancel token for an analysis run (see Evamix.progress and
+    Project.run_mca).
+
+    The engine reports the start and end of each stage and, within the
+    pair-wise stages, each tile or row done.  Stages are weighted by their
+    expected cost (see Evamix.get_stage_costs) to give the fraction of the run
+    complete and an estimate of the time remaining, both passed to the
+    callback.  cancel may be called from another thread, the run raises
+    AnalysisCancelled at its next stage, tile or row and frees its buffers.
+    """
+    def __init__(self, callback=None):
+        """callback - called with (fraction, eta) as the run progresses, eta in
+        seconds or None until there is enough progress to estimate it
+        """
+        self.callback = callback
+        self.cancelled = False
+        self.fraction = 0.0
+        self.start_time = None
+        self.stage_costs = {}
+        self.total_cost = 0.0
+        self.done_cost = 0.0
+        self.stage_cost = 0.0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_cancelled(self):
+        return self.cancelled
+
+    def check(self):
+        """Raises AnalysisCancelled if the run has been cancelled"""
+        if self.cancelled:
+            raise AnalysisCancelled, "Analysis cancelled"
+
+    def start(self, stage_costs):
+        """Starts timing a run, stage_costs is a dict of the relative cost of each stage to be run"""
+        self.start_time = time.time()
+        self.stage_costs = stage_costs
+        self.total_cost = float(sum(stage_costs.values()))
+        self.done_cost = 0.0
+        self.stage_cost = 0.0
+        self.fraction = 0.0
+
+    def start_stage(self, name):
+        self.stage_cost = self.stage_costs.get(name, 0.0)
+        self.update(0.0)
+
+    def finish_stage(self, name):
+        self.done_cost += self.stage_cost
+        self.stage_cost = 0.0
+        self.update(0.0)
+
+    def update(self, stage_fraction):
+        """Reports the fraction of the current stage done, raises AnalysisCancelled if cancelled"""
+        self.check()
+        if self.total_cost > 0:
+            self.fraction = min(1.0, (self.done_cost + self.stage_cost*stage_fraction) / self.total_cost)
+        if self.callback is not None:
+            self.callback(self.fraction, self.get_eta())
+
+    def get_eta(self):
+        """Estimated seconds until the run completes, None if not yet known"""
+        if self.start_time is None or self.fraction <= 0:
+            return None
+        elapsed = time.time() - self.start_time
+        return elapsed / self.fraction * (1.0 - self.fraction)
+
+class AnalysisPipeline(object):
+    """Runs the named stages of an Evamix engine (see Evamix.analysis_stages)
+    on one analysis input.
+
+    A stage is run, after the stages it depends on, the first time its
+    output is asked for and then kept, so callers only pay for the stages
+    they use.  Each stage is a method stage_<name>(pipeline) of the engine
+    which reads the input from the pipeline and the output of earlier stages
+    with get_output.
+    """
+    def __init__(self, engine, in_matrix, crit_weights, crit_types, crit_bc, hooks=None, outputs=None, progress=None):
+        """hooks - list of StageHook
+        outputs - dict of stage outputs already known (eg. prepared input), these stages are not run
+        progress - AnalysisProgress to report to and check for cancellation
+        """
+        self.engine = engine
+        self.in_matrix = in_matrix
+        self.crit_weights = crit_weights
+        self.crit_types = crit_types
+        self.crit_bc = crit_bc
+        self.hooks = list(hooks or [])
+        self.stage_names = [name for (name, dependencies) in engine.analysis_stages]
+        self.dependencies = dict(engine.analysis_stages)
+        self.outputs = dict(outputs or {})
+        self.progress = progress
+        self.started = False
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def get_output(self, name):
+        """Returns the output of a stage, running it first if needed"""
+        if name not in self.outputs:
+            if name not in self.dependencies:
+                raise DelphosError, "Unknown analysis stage "+str(name)
+            for dependency in self.dependencies[name]:
+                self.get_output(dependency)
+            self.run_stage(name)
+        return self.outputs[name]
+
+    def run_stage(self, name):
+        stage = getattr(self.engine, 'stage_'+name)
+        if self.progress is not None and not self.started:
+            self.started = True
+            costs = self.engine.get_stage_costs(self)
+            for known_name in self.outputs.keys():
+                costs.pop(known_name, None)
+            self.progress.start(costs)
+        try:
+            if self.progress is not None:
+                self.progress.start_stage(name)
+            start_wall = time.time()
+            start_cpu = get_cpu_time()
+            start_rss = get_rss()
+            output = stage(self)
+            if self.progress is not None:
+                self.progress.finish_stage(name)
+        except AnalysisCancelled:
+            self.release()
+            raise
+        self.outputs[name] = output
+        if self.hooks:
+            info = StageInfo(name, time.time()-start_wall, get_cpu_time()-start_cpu, get_rss_change(start_rss), get_max_rss(), output)
+            for hook in self.hooks:
+                hook.stage_finished(info)
+            info.release()
+
+    def release(self):
+        """Drops all stage outputs and has the engine free the buffers of the
+        run, called when the run is cancelled
+        """
+        self.outputs.clear()
+        self.engine.release_buffers()
+
+    def run_all(self):
+        for name in self.stage_names:
+            self.get_output(name)
+
+    def get_results(self):
+        """Returns the results as given by do_analysis:
+        [final_scores, [crit_weights, quant_impact_matrix, qual_impact_matrix, final_matrix]]
+        """
+        final_scores = self.get_output('score')
+        return [final_scores, [self.get_output('standardize_weights'), self.get_output('quant_impact'),
+                               self.get_output('qual_impact'), self.get_output('combine')]]
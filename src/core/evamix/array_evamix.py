@@ -0,0 +1,619 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - array (numpy) implementation of the Evamix MCA algorithm
+#===============================================================================
+
+import os
+import tempfile
+import numpy
+
+from delphos_exceptions import *
+from evamix import Evamix
+from packed_matrix import *
+from evamix_input import EvamixInput
+from qual_kernels import QualKernels
+from input_validation import raise_same_values
+
+class ArrayEvamix(Evamix):
+    """Evamix implementation built on numpy arrays.
+
+    Produces the same results as Evamix.do_analysis (within float tolerance)
+    but computes each stage with broadcast array operations instead of nested
+    Python loops.  Evamix remains available as the reference implementation.
+
+    The quantitative impact of alternative i over j is sum(w*(Xi-Xj)) which
+    equals s[i]-s[j] where s is the weighted sum of each alternatives
+    standardized values, so the quantitative matrix costs O(n^2) instead of
+    O(n^2*k).  The qualitative matrix is built tile by tile with kernels
+    specialized for Binary and Ordinal criteria (see QualKernels) so no more
+    than one n x n array is held per stage.
+
+    The impact and final matrices are antisymmetric.  In packed mode only the
+    cells above the diagonal are computed and they are returned as
+    PackedAntisymmetricMatrix objects, halving the work and memory of each
+    matrix stage (and halving memory again when stored as float32).
+
+    Given a TiledExecutor the pair-wise stages (packed impact and final
+    matrices, qualitative absolute sums) are spread over a process pool.
+
+    Given a matrix_dir the packed matrices are written tile by tile into
+    memory mapped files in that directory (see MappedPackedMatrix) so the
+    intermediate output of runs too large for memory can still be produced.
+    """
+
+    def __init__(self, tile_cells=2**20, packed=False, dtype=numpy.float64, executor=None, matrix_dir=None):
+        """tile_cells - maximum number of matrix cells computed at once by the
+        tiled methods
+        packed - return the impact and final matrices as PackedAntisymmetricMatrix
+        dtype - value type of packed matrices, float32 halves their size
+        executor - TiledExecutor to run the pair-wise stages on, None runs them in this process
+        matrix_dir - directory to write packed matrices to as memory mapped files, None keeps them in memory
+        """
+        Evamix.__init__(self)
+        self.tile_cells = tile_cells
+        self.packed = packed
+        self.dtype = dtype
+        self.executor = executor
+        self.matrix_dir = matrix_dir
+        #Qualitative sign tensor of the input being analysed by do_prepared_analysis
+        self.prepared_qual_signs = None
+        #EvamixInput being analysed, the qualitative kernels are built from it
+        self.evamix_input = None
+        #Mapped matrices created by the current run, removed if it is cancelled
+        self.mapped_matrices = []
+        #Whether the executor has been started for the current run
+        self.executor_started = False
+
+    def do_analysis(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Performs multicriteria analysis using the Evamix algorithm
+
+        Same input and output as Evamix.do_analysis, results are returned as
+        lists so they can be stored and displayed like the reference results.
+        [final_scores, [crit_weights, quant_impact_matrix, qual_impact_matrix, final_matrix]]
+        """
+        return self.to_lists(self.do_array_analysis(in_matrix, crit_weights, crit_types, crit_bc))
+
+    def do_array_analysis(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Performs multicriteria analysis using the Evamix algorithm
+
+        Same as do_analysis but the final scores and the impact and final
+        matrices are returned as numpy arrays
+        """
+        try:
+            return self.gen_pipeline(in_matrix, crit_weights, crit_types, crit_bc).get_results()
+        finally:
+            self.stop_executor()
+
+    def do_prepared_analysis(self, in_matrix, crit_weights, crit_types, crit_bc, prepared):
+        """Same as do_analysis but skips preparation of the input values
+
+        prepared - (in_array, quant_cols, qual_cols, qual_signs) as returned by
+        prepare_values and gen_qual_sign_tensor for the same input
+        """
+        (in_array, quant_cols, qual_cols, qual_signs) = prepared
+        self.check_weights(in_matrix, crit_weights, crit_types, crit_bc)
+        #Qualitative columns are not transformed by preparation
+        self.evamix_input = EvamixInput(in_array, crit_types, crit_bc)
+        self.num_quant_criteria = len(quant_cols)
+        self.num_qual_criteria = len(qual_cols)
+        outputs = {'validate': (quant_cols, qual_cols, None), 'flip_cost': None, 'standardize_values': in_array}
+        self.prepared_qual_signs = qual_signs
+        try:
+            return self.to_lists(self.gen_pipeline(in_matrix, crit_weights, crit_types, crit_bc, outputs).get_results())
+        finally:
+            self.prepared_qual_signs = None
+            self.stop_executor()
+
+    def gen_pipeline(self, in_matrix, crit_weights, crit_types, crit_bc, outputs=None):
+        self.mapped_matrices = []
+        return Evamix.gen_pipeline(self, in_matrix, crit_weights, crit_types, crit_bc, outputs)
+
+    def release_buffers(self):
+        """Removes the files of the mapped matrices created by a cancelled run"""
+        self.stop_executor(True)
+        for matrix in self.mapped_matrices:
+            matrix.remove()
+        self.mapped_matrices = []
+
+    def stage_validate(self, stages):
+        """Checks the input and copies it into an EvamixInput.
+        Returns (quant_cols, qual_cols, evamix_input)
+        """
+        self.check_weights(stages.in_matrix, stages.crit_weights, stages.crit_types, stages.crit_bc)
+        evamix_input = self.load_input(stages.in_matrix, stages.crit_types, stages.crit_bc)
+        return (evamix_input.quant_cols, evamix_input.qual_cols, evamix_input)
+
+    def stage_flip_cost(self, stages):
+        """Flips the cost ratio columns of the EvamixInput in place"""
+        evamix_input = stages.get_output('validate')[2]
+        evamix_input.flip_cost_ratio_values()
+        return evamix_input
+
+    def stage_standardize_values(self, stages):
+        """Standardizes the quantitative columns in place, returns the n x k array"""
+        evamix_input = stages.get_output('flip_cost')
+        evamix_input.standardize_quantitative_values()
+        return evamix_input.get_array()
+
+    def stage_quant_impact(self, stages):
+        quant_cols = stages.get_output('validate')[0]
+        return self.gen_quant_impact_matrix(stages.get_output('standardize_values'), self.get_stage_weights(stages), quant_cols)
+
+    def stage_qual_impact(self, stages):
+        qual_cols = stages.get_output('validate')[1]
+        in_array = stages.get_output('standardize_values')
+        weights = self.get_stage_weights(stages)
+        if self.prepared_qual_signs is not None:
+            return self.gen_qual_impact_from_signs(self.prepared_qual_signs, weights, qual_cols, in_array.shape[0])
+        return self.gen_qual_impact_matrix(in_array, weights, qual_cols)
+
+    def stage_normalize(self, stages):
+        """In packed mode only the absolute sums are found, the impact matrices
+        are divided by them tile by tile when combined
+        """
+        if not self.packed:
+            return Evamix.stage_normalize(self, stages)
+        quant_abs_sum = self.absolute_sum(stages.get_output('quant_impact'))
+        qual_abs_sum = self.absolute_sum(stages.get_output('qual_impact'))
+        return (quant_abs_sum, qual_abs_sum, None, None)
+
+    def stage_combine(self, stages):
+        if not self.packed:
+            return Evamix.stage_combine(self, stages)
+        (quant_cols, qual_cols) = stages.get_output('validate')[:2]
+        (quant_abs_sum, qual_abs_sum) = stages.get_output('normalize')[:2]
+        return self.gen_packed_final_matrix(stages.get_output('quant_impact'), quant_abs_sum, stages.get_output('qual_impact'),
+                                            qual_abs_sum, self.get_stage_weights(stages), quant_cols, qual_cols)
+
+    def get_stage_weights(self, stages):
+        """Standardized weights of a pipeline as an array"""
+        return numpy.array(stages.get_output('standardize_weights'), dtype=float)
+
+    def gen_packed_final_matrix(self, quant_impact, quant_abs_sum, qual_impact, qual_abs_sum, weights, quant_cols, qual_cols):
+        """Packed mode version of the final matrix stages, combines the packed
+        impact matrices tile by tile into the final matrix:
+        quant/quant_abs_sum*sum_quant_weights + qual/qual_abs_sum*sum_qual_weights
+        """
+        dim = quant_impact.dim
+        quant_abs_sum = self.check_abs_sum(self.num_quant_criteria, quant_abs_sum)
+        qual_abs_sum = self.check_abs_sum(self.num_qual_criteria, qual_abs_sum)
+        sum_quant_weights = weights[quant_cols].sum()
+        sum_qual_weights = weights[qual_cols].sum()
+        if self.executor is not None:
+            self.start_executor(None, weights)
+            return self.executor.gen_final_matrix(quant_abs_sum, sum_quant_weights, qual_abs_sum, sum_qual_weights, self.progress)
+        final = self.new_packed_matrix(dim, 'final')
+        for (first_row, end_row) in gen_row_ranges(dim, self.tile_cells):
+            start = get_row_offset(dim, first_row)
+            end = get_row_offset(dim, end_row)
+            self.update_progress(start, len(final.values))
+            tile = numpy.zeros(end-start)
+            if quant_abs_sum is not None:
+                tile = tile + quant_impact.values[start:end]/quant_abs_sum*sum_quant_weights
+            if qual_abs_sum is not None:
+                tile = tile + qual_impact.values[start:end]/qual_abs_sum*sum_qual_weights
+            final.values[start:end] = tile
+        return final
+
+    def check_abs_sum(self, num_criteria, abs_sum):
+        """Returns the absolute sum to divide a criteria types impact matrix by,
+        None if there are no criteria of the type (the matrix is left out)
+        """
+        if num_criteria > 0:
+            if abs_sum == 0:
+                raise ZeroDivisionError, "float division"
+            return abs_sum
+        return None
+
+    def start_executor(self, in_array, weights):
+        """Starts the executor workers for the pair-wise stages of the current
+        run if not yet started, so that one pool serves all of them.  Output
+        matrices are only made for the criteria types present
+        """
+        if self.executor_started:
+            return
+        evamix_input = self.evamix_input
+        if in_array is None:
+            in_array = evamix_input.get_array()
+        dim = in_array.shape[0]
+        (quant_out, qual_out) = (None, None)
+        qual_types = []
+        if evamix_input.quant_cols:
+            quant_out = self.new_out_matrix(dim, 'quant')
+        if evamix_input.qual_cols:
+            qual_out = self.new_out_matrix(dim, 'qual')
+            qual_types = evamix_input.crit_types
+        out_matrices = (quant_out, qual_out, self.new_out_matrix(dim, 'final'))
+        self.executor.start_analysis(in_array, weights, evamix_input.quant_cols, qual_types, self.dtype, out_matrices)
+        self.executor_started = True
+
+    def stop_executor(self, terminate=False):
+        """Stops the executor workers of the current run, if started"""
+        if self.executor_started:
+            self.executor_started = False
+            self.executor.close_analysis(terminate)
+
+    def new_out_matrix(self, dim, name):
+        """Returns a new mapped matrix for the executor to write to if
+        matrix_dir is set, None to have it return a matrix in shared memory
+        """
+        if self.matrix_dir is not None:
+            return self.new_packed_matrix(dim, name)
+        return None
+
+    def new_packed_matrix(self, dim, name):
+        """Returns a new zero packed matrix, memory mapped if matrix_dir is set"""
+        if self.matrix_dir is not None:
+            (handle, filename) = tempfile.mkstemp('_'+name+'.dat', 'mca_', self.matrix_dir)
+            os.close(handle)
+            matrix = MappedPackedMatrix(dim, filename, self.dtype, 'w+')
+            self.mapped_matrices.append(matrix)
+            return matrix
+        return PackedAntisymmetricMatrix(dim, dtype=self.dtype)
+
+    def use_qual_signs(self):
+        """Whether the qualitative sign tensor is worth preparing (see McaCache),
+        not for runs large enough to use an executor or mapped matrices
+        """
+        return self.executor is None and self.matrix_dir is None
+
+    def to_lists(self, array_results):
+        """Converts array analysis results to the list structure returned by
+        do_analysis.  Packed matrices are left packed
+        """
+        [final_scores, int_data] = array_results
+        (std_weights, quant_impact, qual_impact, final) = int_data
+        if self.packed:
+            return [final_scores.tolist(), [std_weights, quant_impact, qual_impact, final]]
+        return [final_scores.tolist(), [std_weights, quant_impact.tolist(), qual_impact.tolist(), final.tolist()]]
+
+    def do_scores(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Performs the Evamix analysis returning only the list of final scores
+
+        None of the n x n matrices are built.  Row sums of the impact matrices
+        are computed directly from column totals (quantitative) and level
+        counts (qualitative).  Memory use beyond the input is O(n), time is
+        O(n*k*log(n)) plus the qualitative absolute sum, which is accumulated
+        tile by tile over the pairs of distinct qualitative profiles.
+        """
+        (in_array, weights, quant_cols, qual_cols) = self.prepare_input(in_matrix, crit_weights, crit_types, crit_bc)
+        return self.gen_scores(in_array, weights, quant_cols, qual_cols).tolist()
+
+    def do_batch_scores(self, in_matrix, weight_sets, crit_types, crit_bc):
+        """Performs the Evamix analysis once for each set of criteria weights
+
+        weight_sets - list of crit_weights lists (unstandardized, as given to
+        do_analysis).  The lists given are not modified.
+
+        Returns a list with one list of final scores per weight set.  Input
+        checks, cost flipping and standardization of the input are done once
+        for the whole batch.
+        """
+        if not weight_sets:
+            raise DelphosError, "No criteria weights given"
+        (in_array, weights, quant_cols, qual_cols) = self.prepare_input(in_matrix, list(weight_sets[0]), crit_types, crit_bc)
+        weight_array = self.gen_std_weight_array(weight_sets)
+        return self.gen_batch_scores(in_array, weight_array, quant_cols, qual_cols).tolist()
+
+    def gen_std_weight_array(self, weight_sets):
+        """Returns an m x k array of standardized weights, one row per weight set"""
+        std_sets = []
+        for crit_weights in weight_sets:
+            if type(crit_weights) is not type([]):
+                raise DelphosError, "Expected list of crit_weights"
+            if len(crit_weights) != self.num_criteria:
+                raise DelphosError, "Number of criteria in in_matrix ("+str(self.num_criteria)+") does not match number of criteria weights given ("+str(len(crit_weights))+")"
+            std_weights = list(crit_weights)
+            self.standardize_weights(std_weights)
+            std_sets.append(std_weights)
+        return numpy.array(std_sets, dtype=float)
+
+    def prepare_input(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Validates input, standardizes weights (crit_weights is modified as
+        in Evamix.standardize_weights) and flips/standardizes the quantitative
+        values by running the pipeline stages up to standardize_values.
+        Returns (in_array, weights, quant_cols, qual_cols)
+        """
+        stages = self.gen_pipeline(in_matrix, crit_weights, crit_types, crit_bc)
+        in_array = stages.get_output('standardize_values')
+        weights = self.get_stage_weights(stages)
+        (quant_cols, qual_cols) = stages.get_output('validate')[:2]
+        return (in_array, weights, quant_cols, qual_cols)
+
+    def check_weights(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Evamix.check_input plus checks that there is a weight for every
+        criterion and at least two alternatives
+        """
+        self.check_input(in_matrix, crit_weights, crit_types, crit_bc)
+        self.num_criteria = len(in_matrix[0])
+        self.num_alternatives = len(in_matrix)
+        num_crit_weights = len(crit_weights)
+        if self.num_criteria != num_crit_weights:
+            raise DelphosError, "Number of criteria in in_matrix ("+str(self.num_criteria)+") does not match number of criteria weights given ("+str(num_crit_weights)+")"
+        if self.num_alternatives < 2:
+            raise DelphosError, "First matrix has no dimension"
+
+    def prepare_values(self, in_matrix, crit_types, crit_bc):
+        """Checks the input values and flips/standardizes the quantitative
+        values, independent of weights.  Returns (in_array, quant_cols, qual_cols)
+
+        The values are copied once into an EvamixInput and transformed there in
+        place.  in_array is a view of its columns
+        """
+        evamix_input = self.load_input(in_matrix, crit_types, crit_bc)
+        evamix_input.flip_cost_ratio_values()
+        evamix_input.standardize_quantitative_values()
+        return (evamix_input.get_array(), evamix_input.quant_cols, evamix_input.qual_cols)
+
+    def load_input(self, in_matrix, crit_types, crit_bc):
+        """Copies the input values into an EvamixInput and checks them"""
+        evamix_input = EvamixInput(in_matrix, crit_types, crit_bc)
+        self.evamix_input = evamix_input
+        self.num_qual_criteria = len(evamix_input.qual_cols)
+        self.num_quant_criteria = len(evamix_input.quant_cols)
+        self.check_same_values(evamix_input, evamix_input.quant_cols, evamix_input.qual_cols)
+        return evamix_input
+
+    def check_same_values(self, in_array, quant_cols, qual_cols):
+        """Array version of Evamix.check_same_values, in_array may also be an EvamixInput"""
+        if isinstance(in_array, EvamixInput):
+            same = in_array.get_constant_columns()
+        else:
+            in_array = numpy.asarray(in_array)
+            same = (in_array == in_array[0]).all(axis=0)
+        raise_same_values(same, quant_cols, qual_cols)
+
+    def flip_cost_ratio_criteria_values(self, in_array, quant_cols, crit_bc):
+        """Flips cost ratio columns so lower values score better.  Returns a new array"""
+        new_array = in_array.copy()
+        cost_cols = [col for col in quant_cols if crit_bc[col] == 'C']
+        if cost_cols:
+            cols = new_array[:, cost_cols]
+            new_array[:, cost_cols] = cols.max(axis=0) - cols
+        return new_array
+
+    def standardize_quantitative_values(self, in_array, quant_cols):
+        """Standardizes all quantitative columns to the range [0,1].  Returns a new array"""
+        new_array = in_array.copy()
+        if quant_cols:
+            cols = new_array[:, quant_cols]
+            min_vals = cols.min(axis=0)
+            new_array[:, quant_cols] = (cols - min_vals) / (cols.max(axis=0) - min_vals)
+        return new_array
+
+    def gen_quant_impact_matrix(self, in_array, weights, quant_cols):
+        """Construct pair-wise quantitative impact matrix"""
+        dim = in_array.shape[0]
+        if not quant_cols:
+            return self.gen_zero_matrix(dim, 'quant')
+        if self.packed and self.executor is not None:
+            self.start_executor(in_array, weights)
+            return self.executor.gen_quant_impact_matrix(self.progress)
+        alt_sums = numpy.dot(in_array[:, quant_cols], weights[quant_cols])
+        if self.packed:
+            impact = self.new_packed_matrix(dim, 'quant')
+            for (start, end, rows, cols) in gen_pair_tiles(dim, self.tile_cells):
+                self.update_progress(start, len(impact.values))
+                impact.values[start:end] = alt_sums[rows] - alt_sums[cols]
+            return impact
+        return alt_sums[:, numpy.newaxis] - alt_sums[numpy.newaxis, :]
+
+    def gen_qual_impact_matrix(self, in_array, weights, qual_cols):
+        """Construct pair-wise qualitative impact matrix
+
+        Cell i,j is the sum of the weights of the criteria where i is better
+        than j less the sum of the weights where i is worse than j.  Computed
+        tile by tile with the Binary/Ordinal kernels, see QualKernels
+        """
+        dim = in_array.shape[0]
+        if not qual_cols:
+            return self.gen_zero_matrix(dim, 'qual')
+        if self.packed and self.executor is not None:
+            self.start_executor(in_array, weights)
+            return self.executor.gen_qual_impact_matrix(self.progress)
+        kernels = self.gen_qual_kernels()
+        if self.packed:
+            impact = self.new_packed_matrix(dim, 'qual')
+            for (start, end, rows, cols) in gen_pair_tiles(dim, self.tile_cells):
+                self.update_progress(start, len(impact.values))
+                impact.values[start:end] = kernels.gen_impact(weights, rows, cols)
+            return impact
+        impact = numpy.zeros((dim, dim))
+        all_cols = numpy.arange(dim)[numpy.newaxis, :]
+        for rows in self.gen_row_tiles(dim):
+            self.update_progress(rows.start, dim)
+            impact[rows] = kernels.gen_impact(weights, numpy.arange(dim)[rows, numpy.newaxis], all_cols)
+        return impact
+
+    def gen_qual_sign_tensor(self, in_array, qual_cols):
+        """Returns an n x n x len(qual_cols) int8 array, the sign of the
+        pair-wise difference for each qualitative criterion.  The weighted sum
+        over the last axis is the qualitative impact matrix.
+
+        In packed mode a num_pairs x len(qual_cols) array holding the pairs
+        above the diagonal in packed order is returned instead
+        """
+        qual_array = in_array[:, qual_cols]
+        if self.packed:
+            dim = in_array.shape[0]
+            signs = numpy.zeros((get_num_pairs(dim), len(qual_cols)), dtype=numpy.int8)
+            for (start, end, rows, cols) in gen_pair_tiles(dim, self.tile_cells / max(1, len(qual_cols))):
+                signs[start:end] = numpy.sign(qual_array[rows] - qual_array[cols])
+            return signs
+        return numpy.sign(qual_array[:, numpy.newaxis, :] - qual_array[numpy.newaxis, :, :]).astype(numpy.int8)
+
+    def gen_qual_impact_from_signs(self, qual_signs, weights, qual_cols, dim):
+        """Qualitative impact matrix from a sign tensor (see gen_qual_sign_tensor)"""
+        if not qual_cols:
+            return self.gen_zero_matrix(dim, 'qual')
+        impact = numpy.dot(qual_signs, weights[qual_cols])
+        if self.packed:
+            packed_impact = self.new_packed_matrix(dim, 'qual')
+            packed_impact.values[:] = impact
+            return packed_impact
+        return impact
+
+    def gen_zero_matrix(self, dim, name='zero'):
+        """Returns a dim x dim zero matrix, packed in packed mode"""
+        if self.packed:
+            return self.new_packed_matrix(dim, name)
+        return numpy.zeros((dim, dim))
+
+    def absolute_sum(self, matrix):
+        if isinstance(matrix, PackedAntisymmetricMatrix):
+            #Only the stored half is visited
+            return matrix.absolute_sum()
+        return float(numpy.abs(matrix).sum())
+
+    def gen_quant_final_matrix(self, quant_impact, quant_abs_sum):
+        if self.num_quant_criteria > 0:
+            if quant_abs_sum == 0:
+                raise ZeroDivisionError, "float division"
+            return quant_impact / quant_abs_sum
+        return self.gen_zero_matrix(quant_impact.shape[0])
+
+    def gen_qual_final_matrix(self, qual_impact, qual_abs_sum):
+        if self.num_qual_criteria > 0:
+            if qual_abs_sum == 0:
+                raise ZeroDivisionError, "float division"
+            return qual_impact / qual_abs_sum
+        return self.gen_zero_matrix(qual_impact.shape[0])
+
+    def gen_final_matrix(self, quant_matrix, qual_matrix, weights, quant_cols, qual_cols):
+        """Calculate final Evamix matrix, a weighted combination of the
+        quantitative and qualitative final matrices
+        """
+        if quant_matrix.shape != qual_matrix.shape:
+            raise DelphosError, "Matrices are not the same dimensions"
+        weights = numpy.asarray(weights, dtype=float)
+        sum_quant_weights = weights[quant_cols].sum()
+        sum_qual_weights = weights[qual_cols].sum()
+        return quant_matrix*sum_quant_weights + qual_matrix*sum_qual_weights
+
+    def gen_final_scores(self, final_matrix):
+        return final_matrix.sum(axis=1)
+
+    ######################## Scores only (no n x n matrices) ########################
+
+    def gen_scores(self, in_array, weights, quant_cols, qual_cols):
+        """Returns the final scores array given prepared input (see prepare_input)
+
+        The final score of an alternative is the row sum of the final matrix:
+        quant_row_sum/quant_abs_sum*sum_quant_weights + qual_row_sum/qual_abs_sum*sum_qual_weights
+        """
+        dim = in_array.shape[0]
+        scores = numpy.zeros(dim)
+        if quant_cols:
+            alt_sums = numpy.dot(in_array[:, quant_cols], weights[quant_cols])
+            quant_abs_sum = self.quant_absolute_sum(alt_sums)
+            if quant_abs_sum == 0:
+                raise ZeroDivisionError, "float division"
+            scores += self.quant_row_sums(alt_sums) / quant_abs_sum * weights[quant_cols].sum()
+        if qual_cols:
+            kernels = self.gen_qual_kernels()
+            qual_abs_sum = float(self.qual_batch_absolute_sums(kernels, in_array, weights[numpy.newaxis, :], qual_cols)[0])
+            if qual_abs_sum == 0:
+                raise ZeroDivisionError, "float division"
+            scores += kernels.row_sums(weights) / qual_abs_sum * weights[qual_cols].sum()
+        return scores
+
+    def quant_row_sums(self, alt_sums):
+        """Row sums of the quantitative impact matrix, sum over j of (s[i]-s[j])"""
+        return alt_sums*len(alt_sums) - alt_sums.sum()
+
+    def quant_absolute_sum(self, alt_sums):
+        """Absolute sum of the quantitative impact matrix, sum over i,j of |s[i]-s[j]|
+
+        With s sorted, each s[j] is greater than the j values before it and
+        less than the n-1-j values after it.
+        """
+        dim = len(alt_sums)
+        sorted_sums = numpy.sort(alt_sums)
+        return float(2.0 * numpy.dot(sorted_sums, 2.0*numpy.arange(dim) - dim + 1))
+
+    def gen_batch_scores(self, in_array, weight_array, quant_cols, qual_cols, kernels=None, zero_sum_nan=False):
+        """Returns an m x n array of final scores given prepared input and an
+        m x k array of standardized weights (see gen_std_weight_array).
+
+        Weights only multiply the per-criterion pairwise differences and signs
+        so the per-criterion row sums are computed once and combined with every
+        weight set.  The qualitative absolute sums of all weight sets are
+        accumulated in a single pass over the pairs.
+
+        kernels - QualKernels of in_array, by default those of the input
+        loaded by prepare_input (see gen_qual_kernels).  Callers scoring
+        other input, or several batches of the same input, give their own.
+        A weight set giving no weight to the quantitative
+        (or qualitative) criteria gets no score from them.
+        zero_sum_nan - a weight set whose quantitative or qualitative absolute
+        sum is 0 gets nan scores, by default ZeroDivisionError is raised
+        """
+        dim = in_array.shape[0]
+        num_sets = weight_array.shape[0]
+        scores = numpy.zeros((num_sets, dim))
+        if quant_cols:
+            quant_weights = weight_array[:, quant_cols]
+            #n x m weighted sums, one column per weight set
+            alt_sums = numpy.dot(in_array[:, quant_cols], quant_weights.T)
+            for m in range(num_sets):
+                if quant_weights[m].sum() == 0:
+                    continue
+                quant_abs_sum = self.quant_absolute_sum(alt_sums[:, m])
+                if quant_abs_sum == 0:
+                    if zero_sum_nan:
+                        scores[m] = numpy.nan
+                        continue
+                    raise ZeroDivisionError, "float division"
+                scores[m] += self.quant_row_sums(alt_sums[:, m]) / quant_abs_sum * quant_weights[m].sum()
+        if qual_cols:
+            qual_weights = weight_array[:, qual_cols]
+            if kernels is None:
+                kernels = self.gen_qual_kernels()
+            crit_row_sums = kernels.crit_row_sums()
+            qual_abs_sums = self.qual_batch_absolute_sums(kernels, in_array, weight_array, qual_cols)
+            for m in range(num_sets):
+                if qual_weights[m].sum() == 0:
+                    continue
+                if qual_abs_sums[m] == 0:
+                    if zero_sum_nan:
+                        scores[m] = numpy.nan
+                        continue
+                    raise ZeroDivisionError, "float division"
+                scores[m] += numpy.dot(crit_row_sums, qual_weights[m]) / qual_abs_sums[m] * qual_weights[m].sum()
+        return scores
+
+    def qual_batch_absolute_sums(self, kernels, in_array, weight_array, qual_cols):
+        """Qualitative absolute sum for each row of weight_array, on the executor if set"""
+        if self.executor is not None:
+            return self.executor.qual_batch_absolute_sums(in_array, weight_array, kernels)
+        return kernels.batch_absolute_sums(weight_array)
+
+    def gen_qual_kernels(self, evamix_input=None):
+        """Returns the QualKernels of an EvamixInput, by default of the input
+        being analysed (loaded by prepare_input or the validate stage)
+        """
+        if evamix_input is None:
+            evamix_input = self.evamix_input
+        return QualKernels(evamix_input, self.tile_cells)
+
+    def gen_row_tiles(self, dim):
+        """Yields slices of rows covering a dim x dim matrix, each holding at
+        most tile_cells cells (and at least one row)
+        """
+        tile_rows = max(1, self.tile_cells / max(1, dim))
+        for start in range(0, dim, tile_rows):
+            yield slice(start, min(dim, start+tile_rows))
@@ -0,0 +1,217 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - criteria subset robustness sweep, the ranking of the alternatives
+# with each leave-one-out (or size k) subset of the criteria
+#===============================================================================
+
+import itertools
+import multiprocessing
+import numpy
+
+from delphos_exceptions import *
+from array_evamix import ArrayEvamix
+from input_validation import find_same_values
+
+def gen_ranks(scores):
+    """Returns an m x n array of the rank of each alternative (0 is best) for
+    an m x n array of scores, ties keep alternative order
+    """
+    order = numpy.argsort(-scores, axis=1, kind='mergesort')
+    ranks = numpy.zeros(scores.shape, dtype=int)
+    for m in range(scores.shape[0]):
+        ranks[m, order[m]] = numpy.arange(scores.shape[1])
+    return ranks
+
+def run_subset_batch(batch_args):
+    """Scores one batch of criteria subsets, returns their m x n array of scores.
+
+    Module level so that it can be sent to a process pool.  Each subset is a
+    row of weight_array giving no weight to the criteria left out.
+    """
+    (in_array, weight_array, quant_cols, qual_cols, kernels, tile_cells) = batch_args
+    evamix = ArrayEvamix(tile_cells)
+    return evamix.gen_batch_scores(in_array, weight_array, quant_cols, qual_cols, kernels)
+
+class CriteriaSweep(object):
+    """Criteria subset robustness sweep.
+
+    Ranks the alternatives with every subset of the criteria of a given size,
+    by default every subset leaving one criterion out.  The weights of each
+    subset are standardized among themselves as if only those criteria had
+    been picked in the McaWizard.  Leaving a criterion out is the same as
+    giving it no weight, so the input is checked, flipped and standardized
+    once and each subset is a row of weights for
+    ArrayEvamix.gen_batch_scores, which re-aggregates the per-criterion
+    values, row sums and signs instead of running a new analysis.  Subsets
+    are scored in batches which are run on a process pool.
+
+    Reports how much the rank of each alternative moves across the subsets
+    (see get_rank_volatility) and which criteria move the ranking most when
+    left out (see get_criteria_influence).
+
+    A subset whose qualitative criteria all have the same value for every
+    alternative can not be analysed.  It is listed by get_skipped, gets nan
+    scores and is left out of the volatility and influence.
+    """
+
+    def __init__(self, subset_size=None, batch_size=64, max_subsets=100000, num_workers=None, tile_cells=2**20):
+        """subset_size - number of criteria in each subset, None leaves one out
+        max_subsets - DelphosError is raised if there are more subsets than this
+        num_workers - size of process pool, defaults to number of CPUs.  0 or 1 runs in this process
+        """
+        self.subset_size = subset_size
+        self.batch_size = batch_size
+        self.max_subsets = max_subsets
+        self.num_workers = num_workers
+        self.tile_cells = tile_cells
+
+        self.num_criteria = 0
+        self.subsets = None
+        self.skipped = None
+        self.analysed = None
+        self.scores = None
+        self.ranks = None
+        self.full_ranks = None
+
+    def do_analysis(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Runs the sweep, returns list with one list of final scores per
+        subset, in the order of get_subsets
+
+        crit_weights - weights as input by the user (eg. InputWeightSet.get_weights()), not modified
+        """
+        evamix = ArrayEvamix(self.tile_cells)
+        (in_array, weights, quant_cols, qual_cols) = evamix.prepare_input(in_matrix, list(crit_weights), crit_types, crit_bc)
+        num_crit = len(crit_types)
+        self.num_criteria = num_crit
+        subset_size = self.subset_size
+        if subset_size is None:
+            subset_size = num_crit - 1
+        if subset_size < 1 or subset_size > num_crit:
+            raise DelphosError, "Criteria subsets must have between 1 and "+str(num_crit)+" criteria"
+        num_subsets = self.count_subsets(num_crit, subset_size)
+        if num_subsets > self.max_subsets:
+            raise DelphosError, "Too many criteria subsets ("+str(num_subsets)+"), at most "+str(self.max_subsets)+" are swept"
+
+        self.subsets = list(itertools.combinations(range(num_crit), subset_size))
+        same = evamix.evamix_input.get_constant_columns()
+        self.skipped = [s for s in range(len(self.subsets)) if self.is_constant_subset(same, quant_cols, qual_cols, self.subsets[s])]
+        self.analysed = [s for s in range(len(self.subsets)) if s not in set(self.skipped)]
+        weight_array = numpy.array([self.gen_subset_weights(evamix, crit_weights, self.subsets[s]) for s in self.analysed])
+        kernels = None
+        if qual_cols:
+            kernels = evamix.gen_qual_kernels()
+        batch_args = []
+        for start in range(0, len(self.analysed), self.batch_size):
+            batch_args.append((in_array, weight_array[start:start+self.batch_size], quant_cols, qual_cols, kernels, self.tile_cells))
+
+        pool = None
+        if len(batch_args) > 1 and (self.num_workers is None or self.num_workers > 1):
+            pool = multiprocessing.Pool(self.num_workers)
+        try:
+            if pool:
+                batch_scores = pool.map(run_subset_batch, batch_args)
+            else:
+                batch_scores = map(run_subset_batch, batch_args)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        self.scores = numpy.empty((len(self.subsets), len(in_matrix)))
+        self.scores.fill(numpy.nan)
+        if batch_scores:
+            self.scores[self.analysed] = numpy.vstack(batch_scores)
+        self.ranks = gen_ranks(self.scores)
+        full_scores = evamix.gen_batch_scores(in_array, weights[numpy.newaxis, :], quant_cols, qual_cols, kernels)
+        self.full_ranks = gen_ranks(full_scores)[0]
+        return self.scores.tolist()
+
+    def count_subsets(self, num_crit, subset_size):
+        count = 1
+        for i in range(subset_size):
+            count = count * (num_crit - i) / (i + 1)
+        return count
+
+    def is_constant_subset(self, same, quant_cols, qual_cols, subset):
+        """True if the criteria of a subset fail find_same_values, same is
+        True for each criterion with a single value
+        """
+        subset_quant = [j for j in quant_cols if j in subset]
+        subset_qual = [j for j in qual_cols if j in subset]
+        return len(find_same_values(same, subset_quant, subset_qual)) > 0
+
+    def gen_subset_weights(self, evamix, crit_weights, subset):
+        """Returns the standardized weights of a subset, 0 for the criteria left out"""
+        subset_weights = [crit_weights[k] for k in subset]
+        evamix.standardize_weights(subset_weights)
+        weights = numpy.zeros(len(crit_weights))
+        weights[list(subset)] = subset_weights
+        return weights
+
+    def get_subsets(self):
+        """Returns list of the subsets swept, each a tuple of criteria indices"""
+        return self.subsets
+
+    def get_skipped(self):
+        """Returns list of the indices (in get_subsets) of the subsets that could not be analysed"""
+        return self.skipped
+
+    def get_ranks(self):
+        """Returns list where item [s][i] is the rank of alternative i (0 is
+        best) with subset s, None for a skipped subset
+        """
+        if self.ranks is None:
+            return None
+        skipped = set(self.skipped)
+        return [s not in skipped and self.ranks[s].tolist() or None for s in range(len(self.subsets))]
+
+    def get_rank_volatility(self):
+        """Returns list with one item per alternative:
+        [full_rank, best_rank, worst_rank, mean_shift, rank_std]
+        where full_rank is its rank with all criteria, best and worst its
+        ranks over the analysed subsets, mean_shift the mean distance of its
+        subset ranks from full_rank and rank_std their standard deviation
+        """
+        if self.ranks is None:
+            return None
+        analysed_ranks = self.ranks[self.analysed]
+        shifts = numpy.abs(analysed_ranks - self.full_ranks[numpy.newaxis, :])
+        volatility = []
+        for i in range(analysed_ranks.shape[1]):
+            ranks = analysed_ranks[:, i]
+            volatility.append([int(self.full_ranks[i]), int(ranks.min()), int(ranks.max()), float(shifts[:, i].mean()), float(ranks.std())])
+        return volatility
+
+    def get_criteria_influence(self):
+        """Returns list of (crit_index, influence) pairs, most influential
+        first.  The influence of a criterion is the mean over the subsets
+        leaving it out of the total distance the alternatives move from their
+        full ranking (the footrule distance), 0 if no analysed subset leaves
+        it out
+        """
+        if self.ranks is None:
+            return None
+        distances = numpy.abs(self.ranks - self.full_ranks[numpy.newaxis, :]).sum(axis=1)
+        influence = []
+        for k in range(self.num_criteria):
+            left_out = [s for s in self.analysed if k not in self.subsets[s]]
+            if left_out:
+                influence.append((k, float(distances[left_out].mean())))
+            else:
+                influence.append((k, 0.0))
+        influence.sort(key=lambda item: -item[1])
+        return influence
@@ -18,21 +18,150 @@
 #===============================================================================
 
 from delphos_exceptions import *
+from analysis_pipeline import AnalysisPipeline, DebugHook
+from input_errors import raise_same_values
 from util.common_functions import *
 import csv
 from copy import deepcopy
 
 class Evamix(object):
     
+    #The analysis stages in the order they run, each with the stages whose 
+    #output it uses.  Stage x is run by method stage_x, see AnalysisPipeline
+    analysis_stages = [
+        ('validate', []),
+        ('standardize_weights', ['validate']),
+        ('flip_cost', ['validate']),
+        ('standardize_values', ['flip_cost']),
+        ('quant_impact', ['standardize_weights', 'standardize_values']),
+        ('qual_impact', ['standardize_weights', 'standardize_values']),
+        ('normalize', ['quant_impact', 'qual_impact']),
+        ('combine', ['standardize_weights', 'normalize']),
+        ('score', ['combine']),
+    ]
+
+    #Stages visiting every pair of alternatives, for progress estimates
+    pair_stages = ['quant_impact', 'qual_impact', 'normalize', 'combine']
+
     def __init__(self):
         self.debug = False
+        #StageHook objects told about each analysis stage as it finishes
+        self.hooks = []
+        #AnalysisProgress of the current run, None for no progress reports or cancelling
+        self.progress = None
 
     def do_analysis(self, in_matrix, crit_weights, crit_types, crit_bc):
         """Performs multicriteria analysis using the Evamix algorithm
         
         Returns a list containing a list of final scores and a list of
         intermediate datasets generated during the analysis.
-        [final_scores, [quant_impact_matrix, qual_impact_matrix, final_matrix]]
+        [final_scores, [crit_weights, quant_impact_matrix, qual_impact_matrix, final_matrix]]
+        """
+        return self.gen_pipeline(in_matrix, crit_weights, crit_types, crit_bc).get_results()
+
+    def gen_pipeline(self, in_matrix, crit_weights, crit_types, crit_bc, outputs=None):
+        """Returns an AnalysisPipeline running the analysis stages on the given
+        input as their output is asked for.  The hooks are told about each 
+        stage, with a DebugHook printing a summary of each if debug is set.
+
+        outputs - dict of stage outputs that are already known
+        """
+        hooks = list(self.hooks)
+        if self.debug:
+            hooks.append(DebugHook())
+        return AnalysisPipeline(self, in_matrix, crit_weights, crit_types, crit_bc, hooks, outputs, self.progress)
+
+    def get_stage_costs(self, stages):
+        """Returns a dict of the relative cost of each stage, n*n for the 
+        pair-wise stages and n*k for the others
+        """
+        try:
+            num_alterns = len(stages.in_matrix)
+            num_crit = len(stages.crit_weights)
+        except TypeError:
+            (num_alterns, num_crit) = (1, 1)
+        costs = {}
+        for (name, dependencies) in self.analysis_stages:
+            if name in self.pair_stages:
+                costs[name] = float(num_alterns*num_alterns) + 1
+            else:
+                costs[name] = float(num_alterns*num_crit) + 1
+        return costs
+
+    def update_progress(self, done, total):
+        """Reports progress through the current stage, raises AnalysisCancelled if cancelled"""
+        if self.progress is not None:
+            self.progress.update(float(done)/max(1, total))
+
+    def release_buffers(self):
+        """Frees any buffers of a cancelled run not held by its stage outputs"""
+        pass
+
+    def stage_validate(self, stages):
+        """Checks the input.  Returns (quant_cols, qual_cols, in_matrix)"""
+        in_matrix = stages.in_matrix
+        crit_weights = stages.crit_weights
+        self.check_input(in_matrix, crit_weights, stages.crit_types, stages.crit_bc)
+
+        self.num_criteria = len(in_matrix[0])
+        self.num_alternatives = len(in_matrix)
+        num_crit_weights = len(crit_weights)
+        if self.num_criteria != num_crit_weights:
+            raise DelphosError, "Number of criteria in in_matrix ("+str(self.num_criteria)+") does not match number of criteria weights given ("+str(num_crit_weights)+")"
+  
+        #Get lists describing which columns (criteria) in in_matrix are quantitative and which are qualitative
+        (quant_cols, qual_cols) = self.gen_crit_type_lists(stages.crit_types)
+        self.num_qual_criteria = len(qual_cols)
+        self.num_quant_criteria = len(quant_cols)
+
+        self.check_same_values(in_matrix, quant_cols, qual_cols)
+        return (quant_cols, qual_cols, in_matrix)
+
+    def stage_standardize_weights(self, stages):
+        """Standardizes the criteria weights in place, returns them"""
+        self.standardize_weights(stages.crit_weights)
+        return stages.crit_weights
+
+    def stage_flip_cost(self, stages):
+        # If cost ratio criterion then values need to be 'flipped' so that lower 
+        # values will score better than higher values
+        (quant_cols, qual_cols, in_matrix) = stages.get_output('validate')
+        return self.flip_cost_ratio_criteria_values(in_matrix, quant_cols, stages.crit_bc)
+
+    def stage_standardize_values(self, stages):
+        quant_cols = stages.get_output('validate')[0]
+        return self.standardize_quantitative_values(stages.get_output('flip_cost'), quant_cols)
+
+    def stage_quant_impact(self, stages):
+        quant_cols = stages.get_output('validate')[0]
+        return self.gen_quant_impact_matrix(stages.get_output('standardize_values'), stages.get_output('standardize_weights'), quant_cols)
+
+    def stage_qual_impact(self, stages):
+        qual_cols = stages.get_output('validate')[1]
+        return self.gen_qual_impact_matrix(stages.get_output('standardize_values'), stages.get_output('standardize_weights'), qual_cols)
+
+    def stage_normalize(self, stages):
+        """Divides each impact matrix by its absolute sum.  Returns
+        (quant_abs_sum, qual_abs_sum, quant_final_matrix, qual_final_matrix)
+        """
+        quant_impact_matrix = stages.get_output('quant_impact')
+        qual_impact_matrix = stages.get_output('qual_impact')
+        quant_abs_sum = self.absolute_sum(quant_impact_matrix)
+        qual_abs_sum = self.absolute_sum(qual_impact_matrix)
+        quant_final_matrix = self.gen_quant_final_matrix(quant_impact_matrix, quant_abs_sum)
+        qual_final_matrix = self.gen_qual_final_matrix(qual_impact_matrix, qual_abs_sum)
+        return (quant_abs_sum, qual_abs_sum, quant_final_matrix, qual_final_matrix)
+
+    def stage_combine(self, stages):
+        (quant_cols, qual_cols) = stages.get_output('validate')[:2]
+        (quant_final_matrix, qual_final_matrix) = stages.get_output('normalize')[2:]
+        return self.gen_final_matrix(quant_final_matrix, qual_final_matrix, stages.get_output('standardize_weights'), quant_cols, qual_cols)
+
+    def stage_score(self, stages):
+        return self.gen_final_scores(stages.get_output('combine'))
+
+    def check_input(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Verifies the structure of the analysis input, raises DelphosError if bad
         """
         if not in_matrix:
             raise DelphosError, "No in_matrix matrix"
@@ -55,127 +184,15 @@ class Evamix(object):
         if len(in_matrix) < 1:
             raise DelphosError, "in_matrix contains no data"
 
-        if self.debug:
-            print "in matrix:"
-            for row in in_matrix:
-                print row
-
-            print "crit weights:"
-            print crit_weights
-
-            print "crit types:"
-            print crit_types
-            
-            print "cost benefits:"
-            print crit_bc
-        
-        self.num_criteria = len(in_matrix[0])
-        self.num_alternatives = len(in_matrix)
-        num_crit_weights = len(crit_weights)
-        if self.num_criteria is not num_crit_weights:
-            raise DelphosError, "Number of criteria in in_matrix ("+str(self.num_criteria)+") does not match number of criteria weights given ("+str(num_crit_weights)+")"
-  
-        #Get lists describing which columns (criteria) in in_matrix are quantitative and which are qualitative
-        (quant_cols, qual_cols) = self.gen_crit_type_lists(crit_types)
-        self.num_qual_criteria = len(qual_cols)
-        self.num_quant_criteria = len(quant_cols)
-        if self.debug:
-            print "\nQuantitative columns:"
-            print quant_cols
-            print "\nQualitative columns:"
-            print qual_cols
-
-        #Check if for any quant criteria, the values are the same for all alternatives
-        if self.num_quant_criteria > 0:
-            for j in quant_cols:
-                first_val = in_matrix[0][j]
-                same = True
-                for i in range(len(in_matrix)):
-                    if in_matrix[i][j] != first_val:
-                        same = False
-                if same:
-                    raise DelphosError, "The quantitative values in row "+str(j)+ " are all the same.  This is not supported.  At least one of the values must differ from the rest for each row."
-
-        #Check if for any qualitative criteria, the values are the same for all alternatives
-        if self.num_qual_criteria > 0:
-            same = True
-            for j in qual_cols:
-                first_val = in_matrix[0][j]
-                for i in range(len(in_matrix)):
-                    if in_matrix[i][j] != first_val:
-                        same = False
-            if same:
-                raise DelphosError, "The criteria values are the same for each alternative.  This is not supported.  The values on at least one row must differ in their value."
-        
-        #Standardize weights
-        self.standardize_weights(crit_weights)
-        if self.debug:
-            print "\nStandardized weights: "
-            print crit_weights
-
-        # If cost ratio criterion then values need to be 'flipped' so that lower 
-        # values will score better than higher values
-        in_matrix = self.flip_cost_ratio_criteria_values(in_matrix, quant_cols, crit_bc)
-            
-        in_matrix = self.standardize_quantitative_values(in_matrix, quant_cols)
-        if self.debug:
-            print "\nStandardized quant values"
-            for row in in_matrix:
-                print row
-    
-        #Generate quantitative impact matrix
-        quant_impact_matrix = self.gen_quant_impact_matrix(in_matrix, crit_weights, quant_cols)
-        if self.debug:            
-            print "\nQuantitative impact matrix:"
-            for row in quant_impact_matrix:
-                print row
-
-        #Compute absolute value of quantitative impact matrix
-        quant_abs_sum = self.absolute_sum(quant_impact_matrix)
-        if self.debug:
-            print "\nAbsolute Sum of quantitative impact matrix:"
-            print quant_abs_sum
-        
-        #Generate quantitative final matrix
-        quant_final_matrix = self.gen_quant_final_matrix(quant_impact_matrix, quant_abs_sum)
-        if self.debug:
-            print "\nFinal quantitative matrix"
-            for row in quant_final_matrix:
-                print row 
-        
-        #Generate qualitative impact matrix
-        qual_impact_matrix = self.gen_qual_impact_matrix(in_matrix, crit_weights, qual_cols)
-        if self.debug:
-            print "\nQualitative impact matrix:"
-            for row in qual_impact_matrix:
-                print row
-        
-        #Compute absolute sum of qualitative impace matrix
-        qual_abs_sum = self.absolute_sum(qual_impact_matrix)
-        if self.debug:
-            print "\nAbsolute Sum of qualitative impact matrix:"
-            print qual_abs_sum
-               
-        #Generate qualitative final matrix
-        qual_final_matrix = self.gen_qual_final_matrix(qual_impact_matrix, qual_abs_sum)
-        if self.debug:
-            print "\nFinal qualitative matrix:"
-            for row in qual_final_matrix:
-                print row
-        
-        final_matrix = self.gen_final_matrix(quant_final_matrix, qual_final_matrix, crit_weights, quant_cols, qual_cols)
-        if self.debug:
-            print "\nFinal matrix:"
-            for row in final_matrix:
-                print row
-        
-        final_scores = self.gen_final_scores(final_matrix)
-        if self.debug:
-            print "\nFinal scores:"
-            for i in range(len(final_scores)):
-                print str(i)+": "+str(final_scores[i])
-                
-        return [final_scores, [crit_weights, quant_impact_matrix, qual_impact_matrix, final_matrix]]
+    def check_same_values(self, in_matrix, quant_cols, qual_cols):
+        """Verifies that no quantitative criterion, and not every qualitative 
+        criterion, has the same value for all alternatives.  Raises DelphosError
+        listing every such criterion
+        """
+        same = []
+        for j in range(len(in_matrix[0])):
+            same.append(not [row for row in in_matrix if row[j] != in_matrix[0][j]])
+        raise_same_values(same, quant_cols, qual_cols)
 
     def standardize_weights(self, weights):
         """Standardizes a set of criteria weights, modifies the list given, returns nothing
@@ -221,14 +238,16 @@ class Evamix(object):
         Return a 2D list which is in_matrix with just the quant values modified"""
         #Copy in_matrix, each iteration needs the untouched original.
         new_matrix = deepcopy(in_matrix)
+        #Min and max of each quant column, found once rather than per value
+        col_ranges = {}
+        for j in quant_cols:
+            crit_vals = self.get_criteria_by_col(in_matrix, j)
+            col_ranges[j] = (min(crit_vals), max(crit_vals))
         #Go right to the quantitative columns for each alternative
         for i in range(len(in_matrix)):
             for j in quant_cols:
-                #Get all values for current quant column
-                crit_vals = self.get_criteria_by_col(in_matrix, j)                    
                 val = in_matrix[i][j]
-                min_val = min(crit_vals)
-                max_val = max(crit_vals)
+                (min_val, max_val) = col_ranges[j]
                 val = float(val-min_val)/float(max_val-min_val)
                 new_matrix[i][j] = val
         return new_matrix
@@ -241,9 +260,10 @@ class Evamix(object):
         mat = initialize_float_array(dim, dim)
         #Pair-wise calculations
         for i in range(dim):
+            self.update_progress(i, dim)
             for j in range(dim):
                 #Don't compare alternative to itself
-                if i is not j:
+                if i != j:
                     #calculate sum(N1, N2, ...) where Nx= weight*(stdA-stdB) 
                     #for each pair of alternatives A and B for each alternatives
                     Ni_vals = []
@@ -269,11 +289,12 @@ class Evamix(object):
         dim = len(in_matrix)
         impact_matrix = initialize_float_array(dim, dim)
         for i in range(dim):
+            self.update_progress(i, dim)
             for j in range(dim):
                 crit_type = None
                 bc_type = None
                 #Don't compare alternative to itself
-                if i is not j:
+                if i != j:
                     sum_greater = 0.0
                     sum_less = 0.0
                     for k in qual_cols:
@@ -343,7 +364,7 @@ class Evamix(object):
         else:
             raise DelphosError, "Second matrix has no dimension"
         
-        if quant_h is not qual_h and quant_h is not qual_h:
+        if quant_h != qual_h:
             raise DelphosError, "Matrices are not the same dimensions"
 
         #Calculate sum of all quantitative and qualitative criteria weights
@@ -0,0 +1,288 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - benchmark suite for the Evamix engines with per stage timings,
+# score cross-checks and regression thresholds against a stored baseline
+#
+# Usage (from src): python -m core.evamix.evamix_benchmark [options], --help
+# lists the options.  Exits with status 1 if an engine fails, engines disagree
+# or a regression threshold is exceeded.
+#===============================================================================
+
+import csv
+import sys
+import time
+from optparse import OptionParser
+import numpy
+
+from evamix import Evamix
+from array_evamix import ArrayEvamix
+from analysis_pipeline import StageRecorder, get_cpu_time, get_max_rss, get_rss, get_rss_change
+
+#Criteria type mixes, the types are given to the criteria in turn
+crit_mixes = {
+    'mixed': ["Ratio", "Ordinal", "Binary"],
+    'ratio': ["Ratio"],
+    'qual': ["Ordinal", "Binary"],
+}
+
+#Engines benchmarked, each with the largest case it is run on measured in
+#n*n*k (alternatives squared times criteria), larger cases are skipped
+engine_names = ['reference', 'array', 'packed', 'scores']
+default_max_cells = {
+    'reference': 10**6,
+    'array': 2*10**8,
+    'packed': 10**10,
+    'scores': 2*10**11,
+}
+
+result_fields = ['case', 'engine', 'stage', 'alternatives', 'criteria', 'mix', 'wall_time', 'cpu_time', 'output_bytes', 'rss_change', 'process_peak_rss']
+
+def new_engine(name):
+    if name == 'reference':
+        return Evamix()
+    elif name == 'array':
+        return ArrayEvamix()
+    elif name == 'packed':
+        return ArrayEvamix(packed=True)
+    elif name == 'scores':
+        return ArrayEvamix()
+    raise ValueError, "Unknown engine "+str(name)
+
+def gen_case_input(num_alterns, num_crit, mix, seed=0):
+    """Returns (in_matrix, crit_weights, crit_types, crit_bc) of random
+    integer values, Ratio 0-100000, Ordinal 1-5 and Binary 1-2
+    """
+    rand = numpy.random.RandomState(seed)
+    types = crit_mixes[mix]
+    crit_types = [types[k % len(types)] for k in range(num_crit)]
+    columns = []
+    for crit_type in crit_types:
+        if crit_type == "Ratio":
+            columns.append(rand.randint(0, 100001, num_alterns))
+        elif crit_type == "Binary":
+            columns.append(rand.randint(1, 3, num_alterns))
+        else:
+            columns.append(rand.randint(1, 6, num_alterns))
+    in_matrix = numpy.array(columns, dtype=float).T.tolist()
+    crit_weights = rand.randint(1, 6, num_crit).tolist()
+    crit_bc = [["B", "C"][x] for x in rand.randint(0, 2, num_crit)]
+    return (in_matrix, crit_weights, crit_types, crit_bc)
+
+def get_case_name(num_alterns, num_crit, mix):
+    return "n%d_k%d_%s" % (num_alterns, num_crit, mix)
+
+class EvamixBenchmark(object):
+    """Runs every engine on a sweep of synthetic inputs recording the time
+    and memory of each analysis stage (see AnalysisPipeline).
+
+    The final scores of every engine run on a case are checked against those
+    of the first engine run on it, to within a tolerance and so that they
+    rank the alternatives the same way.  Results can be written to, and
+    compared with, a CSV file with one row per case, engine and stage.
+
+    Output bytes is the memory held by the stage output and RSS change the
+    change in resident memory of the process over the stage (see StageInfo).
+    Process peak RSS is the peak resident memory of the whole process when
+    the stage finished, so it only grows through the sweep and is not a
+    measure of the stage.
+    """
+
+    def __init__(self, alternatives=None, criteria=None, mixes=None, engines=None, max_cells=None, tolerance=1e-9, seed=0):
+        """alternatives, criteria, mixes - values swept, every combination is a case
+        engines - names of the engines to run, see engine_names
+        max_cells - dict of largest n*n*k to run each engine on, defaults to default_max_cells
+        tolerance - largest difference in scores allowed between engines, relative to the largest score
+        """
+        self.alternatives = alternatives or [10, 100, 1000, 10000, 50000]
+        self.criteria = criteria or [5, 50, 500]
+        self.mixes = mixes or ['mixed', 'ratio', 'qual']
+        self.engines = engines or engine_names
+        self.max_cells = dict(default_max_cells)
+        self.max_cells.update(max_cells or {})
+        self.tolerance = tolerance
+        self.seed = seed
+        self.results = []
+        self.mismatches = []
+        self.errors = []
+        self.skipped = []
+
+    def run(self, verbose=False):
+        """Runs the sweep, returns the list of result rows (dicts keyed by result_fields)"""
+        for num_alterns in self.alternatives:
+            for num_crit in self.criteria:
+                for mix in self.mixes:
+                    self.run_case(num_alterns, num_crit, mix, verbose)
+        return self.results
+
+    def run_case(self, num_alterns, num_crit, mix, verbose=False):
+        case = get_case_name(num_alterns, num_crit, mix)
+        (in_matrix, crit_weights, crit_types, crit_bc) = gen_case_input(num_alterns, num_crit, mix, self.seed)
+        expected = None
+        for name in self.engines:
+            if num_alterns*num_alterns*num_crit > self.max_cells[name]:
+                self.skipped.append((case, name))
+                continue
+            case_info = {'case': case, 'engine': name, 'alternatives': num_alterns, 'criteria': num_crit, 'mix': mix}
+            try:
+                scores = self.run_engine(name, in_matrix, list(crit_weights), crit_types, crit_bc, case_info)
+            except Exception, e:
+                self.errors.append((case, name, "%s: %s" % (e.__class__.__name__, getattr(e, "value", e))))
+                continue
+            if verbose:
+                print "%s %s: %.3fs" % (case, name, self.results[-1]['wall_time'])
+            if expected is None:
+                expected = (name, scores)
+            else:
+                problem = self.check_scores(expected[1], scores)
+                if problem:
+                    self.mismatches.append((case, expected[0], name, problem))
+
+    def run_engine(self, name, in_matrix, crit_weights, crit_types, crit_bc, case_info):
+        """Runs one engine on a case adding a row per stage and a total row to
+        the results, returns the final scores as an array
+        """
+        engine = new_engine(name)
+        recorder = StageRecorder()
+        engine.hooks = [recorder]
+        start_wall = time.time()
+        start_cpu = get_cpu_time()
+        start_rss = get_rss()
+        if name == 'scores':
+            scores = engine.do_scores(in_matrix, crit_weights, crit_types, crit_bc)
+        else:
+            scores = engine.do_analysis(in_matrix, crit_weights, crit_types, crit_bc)[0]
+        wall_time = time.time() - start_wall
+        cpu_time = get_cpu_time() - start_cpu
+        rss_change = get_rss_change(start_rss)
+        total_bytes = 0
+        for info in recorder.infos:
+            output_bytes = info.get_output_bytes()
+            total_bytes += output_bytes
+            self.add_result(case_info, info.name, info.wall_time, info.cpu_time, output_bytes, info.rss_change, info.max_rss)
+        self.add_result(case_info, 'total', wall_time, cpu_time, total_bytes, rss_change, get_max_rss())
+        return numpy.array(scores, dtype=float)
+
+    def add_result(self, case_info, stage, wall_time, cpu_time, output_bytes, rss_change, process_peak_rss):
+        row = dict(case_info)
+        row.update({'stage': stage, 'wall_time': wall_time, 'cpu_time': cpu_time, 'output_bytes': output_bytes,
+                    'rss_change': rss_change, 'process_peak_rss': process_peak_rss})
+        self.results.append(row)
+
+    def check_scores(self, expected, scores):
+        """Returns a description of how scores differ from expected, None if they agree"""
+        if expected.shape != scores.shape:
+            return "different number of scores"
+        tolerance = self.tolerance * max(1.0, float(numpy.abs(expected).max()))
+        max_diff = float(numpy.abs(expected - scores).max())
+        if max_diff > tolerance:
+            return "scores differ by "+str(max_diff)
+        #Ordered by scores, the expected scores must not increase (beyond ties)
+        order = numpy.argsort(-scores, kind='mergesort')
+        if (numpy.diff(expected[order]) > tolerance).any():
+            return "alternatives ranked differently"
+        return None
+
+    def write_results(self, filename):
+        out_file = open(filename, 'wb')
+        try:
+            writer = csv.DictWriter(out_file, result_fields)
+            writer.writerow(dict(zip(result_fields, result_fields)))
+            for row in self.results:
+                writer.writerow(row)
+        finally:
+            out_file.close()
+
+    def find_regressions(self, baseline, threshold=0.25, min_time=0.05):
+        """Returns a list of descriptions of results exceeding the baseline
+        by more than threshold (a fraction), in wall time or output bytes.
+        Stages faster than min_time seconds in the baseline are not timed
+
+        baseline - dict of result rows keyed by (case, engine, stage), see read_baseline
+        """
+        regressions = []
+        for row in self.results:
+            key = (row['case'], row['engine'], row['stage'])
+            if key not in baseline:
+                continue
+            base = baseline[key]
+            if base['wall_time'] >= min_time and row['wall_time'] > base['wall_time']*(1+threshold):
+                regressions.append("%s %s %s: %.4fs, baseline %.4fs" % (key + (row['wall_time'], base['wall_time'])))
+            if row['output_bytes'] > base['output_bytes']*(1+threshold):
+                regressions.append("%s %s %s: %d bytes, baseline %d bytes" % (key + (row['output_bytes'], base['output_bytes'])))
+        return regressions
+
+def read_baseline(filename):
+    """Reads results written by EvamixBenchmark.write_results, returns a dict
+    of rows keyed by (case, engine, stage)
+    """
+    baseline = {}
+    in_file = open(filename, 'rb')
+    try:
+        for row in csv.DictReader(in_file):
+            row['wall_time'] = float(row['wall_time'])
+            row['cpu_time'] = float(row['cpu_time'])
+            row['output_bytes'] = int(row['output_bytes'])
+            baseline[(row['case'], row['engine'], row['stage'])] = row
+    finally:
+        in_file.close()
+    return baseline
+
+def parse_list(value, convert=str):
+    return [convert(item) for item in value.split(',') if item]
+
+def main(args):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--alternatives", default="10,100,1000,10000,50000", help="numbers of alternatives, comma separated")
+    parser.add_option("-k", "--criteria", default="5,50,500", help="numbers of criteria, comma separated")
+    parser.add_option("-m", "--mixes", default="mixed,ratio,qual", help="criteria type mixes, comma separated: "+", ".join(sorted(crit_mixes.keys())))
+    parser.add_option("-e", "--engines", default=",".join(engine_names), help="engines, comma separated: "+", ".join(engine_names))
+    parser.add_option("-c", "--max-cells", action="append", default=[], help="largest n*n*k to run an engine on, as engine=cells")
+    parser.add_option("-o", "--output", help="CSV file to write results to")
+    parser.add_option("-b", "--baseline", help="CSV file of baseline results to compare with")
+    parser.add_option("-t", "--threshold", type="float", default=0.25, help="allowed fraction over the baseline [default: %default]")
+    parser.add_option("--min-time", type="float", default=0.05, help="stages faster than this many seconds in the baseline are not timed [default: %default]")
+    parser.add_option("--tolerance", type="float", default=1e-9, help="allowed relative difference in scores between engines [default: %default]")
+    parser.add_option("-s", "--seed", type="int", default=0)
+    (options, rest) = parser.parse_args(args)
+
+    max_cells = {}
+    for item in options.max_cells:
+        (name, cells) = item.split('=')
+        max_cells[name] = int(float(cells))
+    benchmark = EvamixBenchmark(parse_list(options.alternatives, int), parse_list(options.criteria, int), parse_list(options.mixes),
+                                parse_list(options.engines), max_cells, options.tolerance, options.seed)
+    benchmark.run(True)
+    if options.output:
+        benchmark.write_results(options.output)
+
+    failed = False
+    for (case, engine, error) in benchmark.errors:
+        print "ERROR %s %s: %s" % (case, engine, error)
+        failed = True
+    for (case, expected_engine, engine, problem) in benchmark.mismatches:
+        print "MISMATCH %s: %s and %s %s" % (case, expected_engine, engine, problem)
+        failed = True
+    if options.baseline:
+        for regression in benchmark.find_regressions(read_baseline(options.baseline), options.threshold, options.min_time):
+            print "REGRESSION "+regression
+            failed = True
+    if failed:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,150 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - column major Evamix input with cached per-criterion statistics
+#===============================================================================
+
+import numpy
+
+from delphos_exceptions import *
+
+class EvamixInput(object):
+    """Analysis input stored one criterion per row (columns of in_matrix are
+    contiguous) with the criteria type tags and cached column statistics.
+
+    The minimum and maximum of every column are found once on creation, sort
+    order and distinct levels (with counts) when first asked for.  The
+    preprocessing transforms modify the columns in place and update the
+    statistics they invalidate instead of copying the whole input.
+    """
+
+    def __init__(self, in_matrix, crit_types, crit_bc=None):
+        """evamix_input = EvamixInput(list, list, list)
+
+        in_matrix - list of alternative rows (or n x k array), as given to Evamix.do_analysis
+        crit_types - "Ratio", "Ordinal" or "Binary" for each column
+        crit_bc - "B" or "C" for each column, only used by flip_cost_ratio_values.
+        Defaults to "B" for all
+        """
+        try:
+            in_array = numpy.array(in_matrix, dtype=float)
+        except (TypeError, ValueError):
+            raise DelphosError, "Bad in_matrix matrix"
+        if in_array.ndim != 2:
+            raise DelphosError, "Bad in_matrix matrix"
+        #k x n, each criterion contiguous
+        self.columns = numpy.ascontiguousarray(in_array.T)
+        self.num_alternatives = in_array.shape[0]
+        self.num_criteria = in_array.shape[1]
+
+        self.crit_types = list(crit_types)
+        if crit_bc is None:
+            crit_bc = ["B"] * len(self.crit_types)
+        self.crit_bc = list(crit_bc)
+        self.quant_cols = []
+        self.qual_cols = []
+        self.binary_cols = []
+        self.ordinal_cols = []
+        for col in range(len(self.crit_types)):
+            cur_type = self.crit_types[col]
+            if cur_type == "Ratio":
+                self.quant_cols.append(col)
+            elif cur_type == "Ordinal" or cur_type == "Binary":
+                self.qual_cols.append(col)
+                if cur_type == "Binary":
+                    self.binary_cols.append(col)
+                else:
+                    self.ordinal_cols.append(col)
+
+        if self.num_alternatives:
+            self.min_vals = self.columns.min(axis=1)
+            self.max_vals = self.columns.max(axis=1)
+        else:
+            self.min_vals = numpy.zeros(self.num_criteria)
+            self.max_vals = numpy.zeros(self.num_criteria)
+        self.sort_orders = {}
+        self.levels = {}
+
+    def get_array(self):
+        """Returns the input as an n x k array (a view of the columns)"""
+        return self.columns.T
+
+    def get_column(self, col):
+        return self.columns[col]
+
+    def get_type(self, col):
+        return self.crit_types[col]
+
+    def get_min(self, col):
+        return self.min_vals[col]
+
+    def get_max(self, col):
+        return self.max_vals[col]
+
+    def get_constant_columns(self):
+        """Returns boolean array, True for each column holding a single value"""
+        return self.min_vals == self.max_vals
+
+    def get_sort_order(self, col):
+        """Returns the indices that sort a column (stable, ascending)"""
+        if col not in self.sort_orders:
+            self.sort_orders[col] = numpy.argsort(self.columns[col], kind='mergesort')
+        return self.sort_orders[col]
+
+    def get_levels(self, col):
+        """Returns (levels, counts), the sorted distinct values of a column and
+        the number of alternatives holding each (see QualKernels)
+        """
+        if col not in self.levels:
+            sorted_col = self.columns[col][self.get_sort_order(col)]
+            if len(sorted_col):
+                starts = numpy.concatenate(([0], numpy.flatnonzero(sorted_col[1:] != sorted_col[:-1])+1))
+                counts = numpy.diff(numpy.concatenate((starts, [len(sorted_col)])))
+                self.levels[col] = (sorted_col[starts], counts)
+            else:
+                self.levels[col] = (sorted_col, numpy.zeros(0, dtype=int))
+        return self.levels[col]
+
+    def get_level_ranks(self, col):
+        """Returns the rank of each alternative's value among the levels of a column"""
+        return numpy.searchsorted(self.get_levels(col)[0], self.columns[col])
+
+    def flip_cost_ratio_values(self):
+        """Flips cost ratio columns in place (max - value) so lower values score better"""
+        for col in self.quant_cols:
+            if self.crit_bc[col] == 'C':
+                column = self.columns[col]
+                (min_val, max_val) = (self.min_vals[col], self.max_vals[col])
+                numpy.subtract(max_val, column, column)
+                self.min_vals[col] = max_val - max_val
+                self.max_vals[col] = max_val - min_val
+                #Order reverses, ties would no longer be stable
+                self.sort_orders.pop(col, None)
+                if col in self.levels:
+                    (levels, counts) = self.levels[col]
+                    self.levels[col] = (max_val - levels[::-1], counts[::-1])
+
+    def standardize_quantitative_values(self):
+        """Standardizes all quantitative columns in place to the range [0,1]"""
+        for col in self.quant_cols:
+            column = self.columns[col]
+            (min_val, max_val) = (self.min_vals[col], self.max_vals[col])
+            numpy.subtract(column, min_val, column)
+            numpy.divide(column, max_val - min_val, column)
+            self.min_vals[col] = 0.0
+            self.max_vals[col] = 1.0
+            #Order is kept but rounding may merge close levels
+            self.levels.pop(col, None)
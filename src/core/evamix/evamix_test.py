@@ -18,8 +18,66 @@
 #===============================================================================
 
 import unittest
+import random
+import numpy
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+import gc
 from evamix import Evamix
+from array_evamix import ArrayEvamix
+from rank_acceptability import RankAcceptability
+from weight_stability import WeightStability
+from criteria_sweep import CriteriaSweep
+from rank_reversal import RankReversal
+from scenario_batch import ScenarioBatch
+from input_validation import *
+from incremental_evamix import IncrementalEvamix
+from packed_matrix import *
+from evamix_input import EvamixInput
+from qual_kernels import QualKernels
+import tiled_executor
+from tiled_executor import TiledExecutor
+from analysis_pipeline import *
+from evamix_benchmark import EvamixBenchmark, read_baseline
 from delphos_exceptions import *
+from core.testing_util import new_project
+
+#India 1 input
+india_input = [
+    [4, 3, 4, 2, 4, 3, 3, 2, 2, 2, 3, 4, 2, 1, 1, 3, 2, 3, 37900, 0],
+    [3, 2, 3, 3, 4, 2, 3, 2, 2, 2, 3, 4, 3, 2, 1, 3, 3, 3, 3000, 15000],
+    [3, 3, 3, 4, 4, 4, 3, 4, 2, 2, 2, 4, 4, 1, 1, 3, 2, 3, 240, 256],
+    [4, 4, 3, 4, 3, 4, 3, 4, 2, 2, 2, 4, 4, 1, 1, 3, 2, 3, 12231, 5000],
+    [2, 2, 3, 4, 4, 4, 3, 4, 2, 2, 2, 4, 4, 1, 1, 3, 3, 1, 25, 700],
+    [3, 3, 3, 2, 2, 3, 1, 2, 2, 3, 3, 4, 2, 1, 1, 3, 3, 3, 19700, 15700],
+    [3, 3, 2, 2, 2, 3, 2, 2, 2, 2, 2, 4, 3, 1, 1, 3, 2, 3, 119648, 300],
+    [3, 2, 3, 2, 2, 3, 1, 2, 2, 3, 3, 4, 3, 1, 1, 3, 3, 3, 14875, 15700]
+]
+india_weights = [1,1,2,1,1,1,4,2,2,1,2,2,1,1,3,3,4,3,3,1]
+india_types = ["Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Ordinal","Binary","Ordinal","Ordinal","Ordinal","Ordinal","Ratio","Ratio"]
+india_bc = ["B","B","B","B","B","B","B","B","B","B","B","B","B","B","B","B","B","B","B","C"]
+
+def gen_random_input(num_alterns, crit_types, seed=0):
+    """Generates a random analysis input for the given criteria types.
+    Returns (in_matrix, crit_weights, crit_bc)"""
+    rand = random.Random(seed)
+    in_matrix = []
+    for i in range(num_alterns):
+        row = []
+        for crit_type in crit_types:
+            if crit_type == "Ratio":
+                row.append(rand.randint(0, 100000))
+            elif crit_type == "Binary":
+                row.append(rand.randint(1, 2))
+            else:
+                row.append(rand.randint(1, 5))
+        in_matrix.append(row)
+    crit_weights = [rand.randint(1, 5) for x in crit_types]
+    crit_bc = [rand.choice(["B", "C"]) for x in crit_types]
+    return (in_matrix, crit_weights, crit_bc)
 
 class TestEvamix(unittest.TestCase):
     
@@ -232,5 +290,980 @@ class TestEvamix(unittest.TestCase):
         for i in range(len(result)):
             self.assertAlmostEqual(result[i], expected_result[i], 6)
         
+class TestArrayEvamix(unittest.TestCase):
+
+    def setUp(self):
+        self.evamix = Evamix()
+        self.array_evamix = ArrayEvamix()
+
+    def assert_same_results(self, expected, result):
+        [expected_scores, expected_int] = expected
+        [scores, int_data] = result
+        self.assertEqual(len(expected_scores), len(scores))
+        for i in range(len(scores)):
+            self.assertAlmostEqual(scores[i], expected_scores[i], 9)
+        for m in range(len(int_data)):
+            for i in range(len(int_data[m])):
+                if type(int_data[m][i]) is type([]):
+                    for j in range(len(int_data[m][i])):
+                        self.assertAlmostEqual(int_data[m][i][j], expected_int[m][i][j], 9)
+                else:
+                    self.assertAlmostEqual(int_data[m][i], expected_int[m][i], 9)
+
+    def run_both(self, in_matrix, crit_weights, crit_types, crit_bc):
+        expected = self.evamix.do_analysis(in_matrix, list(crit_weights), crit_types, crit_bc)
+        result = self.array_evamix.do_analysis(in_matrix, list(crit_weights), crit_types, crit_bc)
+        return (expected, result)
+
+    def test_india_matches_reference(self):
+        """test_india_matches_reference - array engine matches reference engine on India 1 data
+        """
+        (expected, result) = self.run_both(india_input, india_weights, india_types, india_bc)
+        self.assert_same_results(expected, result)
+        self.assertEqual(type(result[0]), type([]))
+
+    def test_random_mixed_matches_reference(self):
+        """test_random_mixed_matches_reference - array engine matches reference for random mixed criteria
+        """
+        crit_types = ["Ratio", "Ordinal", "Binary", "Ratio", "Ordinal", "Ordinal"]
+        for seed in range(5):
+            (in_matrix, crit_weights, crit_bc) = gen_random_input(12, crit_types, seed)
+            (expected, result) = self.run_both(in_matrix, crit_weights, crit_types, crit_bc)
+            self.assert_same_results(expected, result)
+
+    def test_single_type_matches_reference(self):
+        """test_single_type_matches_reference - array engine matches reference with only one criteria type
+        """
+        for crit_types in (["Ratio", "Ratio"], ["Ordinal", "Binary", "Ordinal"]):
+            (in_matrix, crit_weights, crit_bc) = gen_random_input(9, crit_types, 3)
+            (expected, result) = self.run_both(in_matrix, crit_weights, crit_types, crit_bc)
+            self.assert_same_results(expected, result)
+
+    def test_same_values_rejected(self):
+        """test_same_values_rejected - array engine rejects constant criteria like the reference
+        """
+        in_matrix = [[1, 3], [2, 3], [3, 3]]
+        self.assertRaises(DelphosError, self.array_evamix.do_analysis, in_matrix, [1, 1], ["Ratio", "Ratio"], ["B", "B"])
+        self.assertRaises(DelphosError, self.array_evamix.do_analysis, in_matrix, [1, 1], ["Ratio", "Ordinal"], ["B", "B"])
+        self.assertRaises(DelphosError, self.array_evamix.do_analysis, in_matrix, [1], ["Ratio", "Ordinal"], ["B", "B"])
+
+    def test_scores_only_matches_analysis(self):
+        """test_scores_only_matches_analysis - do_scores gives the do_analysis final scores, regardless of tile size
+        """
+        crit_types = ["Ratio", "Ordinal", "Binary", "Ratio", "Ordinal"]
+        (in_matrix, crit_weights, crit_bc) = gen_random_input(23, crit_types, 7)
+        expected = self.evamix.do_analysis(in_matrix, list(crit_weights), crit_types, crit_bc)[0]
+        for tile_cells in (1, 50, 2**20):
+            scores = ArrayEvamix(tile_cells).do_scores(in_matrix, list(crit_weights), crit_types, crit_bc)
+            for i in range(len(expected)):
+                self.assertAlmostEqual(scores[i], expected[i], 9)
+
+    def test_scores_only_india(self):
+        """test_scores_only_india - do_scores matches the reference on India 1 data
+        """
+        expected = self.evamix.do_analysis(india_input, list(india_weights), india_types, india_bc)[0]
+        scores = self.array_evamix.do_scores(india_input, list(india_weights), india_types, india_bc)
+        for i in range(len(expected)):
+            self.assertAlmostEqual(scores[i], expected[i], 9)
+
+    def test_batch_scores(self):
+        """test_batch_scores - each weight set in a batch scores the same as its own analysis
+        """
+        crit_types = ["Ratio", "Ordinal", "Binary", "Ratio", "Ordinal"]
+        (in_matrix, crit_weights, crit_bc) = gen_random_input(15, crit_types, 11)
+        rand = random.Random(5)
+        weight_sets = [[rand.randint(1, 5) for x in crit_types] for m in range(6)]
+        orig_sets = [list(x) for x in weight_sets]
+        batch = ArrayEvamix(40).do_batch_scores(in_matrix, weight_sets, crit_types, crit_bc)
+        self.assertEqual(weight_sets, orig_sets)
+        self.assertEqual(len(batch), len(weight_sets))
+        for m in range(len(weight_sets)):
+            expected = self.evamix.do_analysis(in_matrix, list(weight_sets[m]), crit_types, crit_bc)[0]
+            for i in range(len(expected)):
+                self.assertAlmostEqual(batch[m][i], expected[i], 9)
+        self.assertRaises(DelphosError, self.array_evamix.do_batch_scores, in_matrix, [crit_weights, [1, 1]], crit_types, crit_bc)
+
+    def test_packed_matches_reference(self):
+        """test_packed_matches_reference - packed mode matrices match the full reference matrices, regardless of tile size
+        """
+        crit_types = ["Ratio", "Ordinal", "Binary", "Ratio", "Ordinal"]
+        (in_matrix, crit_weights, crit_bc) = gen_random_input(14, crit_types, 2)
+        expected = self.evamix.do_analysis(in_matrix, list(crit_weights), crit_types, crit_bc)
+        for tile_cells in (1, 20, 2**20):
+            result = ArrayEvamix(tile_cells, packed=True).do_analysis(in_matrix, list(crit_weights), crit_types, crit_bc)
+            for m in range(1, 4):
+                self.assertTrue(isinstance(result[1][m], PackedAntisymmetricMatrix))
+            self.assert_same_results(expected, [result[0], [result[1][0]]+[x.tolist() for x in result[1][1:]]])
+            for i in range(len(in_matrix)):
+                for j in range(len(in_matrix)):
+                    self.assertAlmostEqual(result[1][3][i, j], expected[1][3][i][j], 9)
+                    self.assertAlmostEqual(get_matrix_value(result[1][3], i, j), expected[1][3][i][j], 9)
+                self.assertEqual(get_matrix_column(result[1][1], i), get_matrix_column(result[1][1].tolist(), i))
+
+    def test_over_256_criteria_and_alternatives(self):
+        """test_over_256_criteria_and_alternatives - counts past the small int cache compare by value
+        """
+        for (num_alterns, crit_types) in ((6, ["Ratio", "Ordinal", "Binary"]*100), (260, ["Ratio", "Binary"])):
+            (in_matrix, crit_weights, crit_bc) = gen_random_input(num_alterns, crit_types, 11)
+            expected = self.evamix.do_analysis(in_matrix, list(crit_weights), crit_types, crit_bc)
+            result = self.array_evamix.do_analysis(in_matrix, list(crit_weights), crit_types, crit_bc)
+            self.assertEqual(len(expected[0]), num_alterns)
+            self.assert_same_results(expected, result)
+        self.assertRaises(DelphosError, self.evamix.do_analysis, in_matrix, [1]*300, crit_types, crit_bc)
+
+    def test_packed_float32(self):
+        """test_packed_float32 - float32 packed matrices are a quarter of the full size and close to the reference
+        """
+        (expected, result) = (self.evamix.do_analysis(india_input, list(india_weights), india_types, india_bc),
+            ArrayEvamix(packed=True, dtype=numpy.float32).do_analysis(india_input, list(india_weights), india_types, india_bc))
+        for i in range(len(expected[0])):
+            self.assertAlmostEqual(result[0][i], expected[0][i], 5)
+        final = result[1][3]
+        self.assertEqual(final.values.nbytes, len(india_input)*(len(india_input)-1)/2*4)
+        self.assertAlmostEqual(final.absolute_sum(), self.array_evamix.absolute_sum(numpy.array(expected[1][3])), 5)
+
+    def test_pack_matrix(self):
+        """test_pack_matrix - packing a full antisymmetric matrix is lossless
+        """
+        (in_matrix, crit_weights, crit_bc) = gen_random_input(10, ["Ratio", "Ordinal"], 4)
+        full = self.evamix.do_analysis(in_matrix, list(crit_weights), ["Ratio", "Ordinal"], crit_bc)[1][3]
+        packed = pack_matrix(full)
+        self.assertEqual(packed.tolist(), full)
+        self.assertEqual(len(packed), len(full))
+        self.assertEqual(list(packed.row_sums()), list(pack_matrix(full).sum(axis=1)))
+
+class TestEvamixInput(unittest.TestCase):
+
+    def setUp(self):
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ratio"]
+        self.in_matrix = [[10, 3, 1, 5], [40, 1, 2, 5], [20, 3, 2, 9], [30, 2, 1, 7]]
+        self.evamix_input = EvamixInput(self.in_matrix, self.crit_types, ["B", "B", "B", "C"])
+
+    def test_type_tags(self):
+        """test_type_tags - criteria columns are tagged like Evamix.gen_crit_type_lists
+        """
+        (quant_cols, qual_cols) = Evamix().gen_crit_type_lists(self.crit_types)
+        self.assertEqual(self.evamix_input.quant_cols, quant_cols)
+        self.assertEqual(self.evamix_input.qual_cols, qual_cols)
+        self.assertEqual(self.evamix_input.binary_cols, [2])
+        self.assertEqual(self.evamix_input.ordinal_cols, [1])
+
+    def test_statistics(self):
+        """test_statistics - cached column statistics
+        """
+        self.assertEqual(self.evamix_input.get_min(0), 10)
+        self.assertEqual(self.evamix_input.get_max(0), 40)
+        self.assertEqual(list(self.evamix_input.get_sort_order(0)), [0, 2, 3, 1])
+        (levels, counts) = self.evamix_input.get_levels(1)
+        self.assertEqual(list(levels), [1, 2, 3])
+        self.assertEqual(list(counts), [1, 1, 2])
+        self.assertEqual(list(self.evamix_input.get_constant_columns()), [False, False, False, False])
+
+    def test_transforms_match_reference(self):
+        """test_transforms_match_reference - in place flip and standardize give the reference values
+        """
+        evamix = Evamix()
+        (quant_cols, qual_cols) = evamix.gen_crit_type_lists(self.crit_types)
+        expected = evamix.flip_cost_ratio_criteria_values(self.in_matrix, quant_cols, ["B", "B", "B", "C"])
+        expected = evamix.standardize_quantitative_values(expected, quant_cols)
+        self.evamix_input.get_levels(3)
+        columns = self.evamix_input.columns
+        self.evamix_input.flip_cost_ratio_values()
+        self.assertEqual(list(self.evamix_input.get_levels(3)[0]), [0, 2, 4])
+        self.evamix_input.standardize_quantitative_values()
+        self.assertTrue(self.evamix_input.columns is columns)
+        self.assertEqual(self.evamix_input.get_array().tolist(), expected)
+        self.assertEqual(self.evamix_input.get_min(3), 0.0)
+        self.assertEqual(self.evamix_input.get_max(3), 1.0)
+
+class TestQualKernels(unittest.TestCase):
+
+    def setUp(self):
+        #Ordinal column 4 only uses two levels, Binary column 3 uses three
+        self.crit_types = ["Ordinal", "Binary", "Ordinal", "Binary", "Ordinal", "Ratio"]
+        (in_matrix, crit_weights, crit_bc) = gen_random_input(40, self.crit_types, 9)
+        self.in_array = numpy.array(in_matrix, dtype=float)
+        self.in_array[:, 4] = self.in_array[:, 4] % 2 + 3
+        self.in_array[:3, 3] = [1, 2, 3]
+        self.weights = numpy.array(crit_weights, dtype=float)
+        self.qual_cols = [0, 1, 2, 3, 4]
+        self.expected = numpy.zeros((40, 40))
+        for k in self.qual_cols:
+            col = self.in_array[:, k]
+            self.expected += self.weights[k] * numpy.sign(col[:, numpy.newaxis] - col[numpy.newaxis, :])
+
+    def test_type_split(self):
+        """test_type_split - Binary criteria use the bit kernel, Ordinal criteria the level kernel whatever their number of levels
+        """
+        kernels = QualKernels(EvamixInput(self.in_array, self.crit_types))
+        self.assertEqual(kernels.binary_cols, [1])
+        self.assertEqual(kernels.ordinal_cols, [0, 2, 3, 4])
+        self.assertEqual(kernels.ranks.dtype, numpy.int8)
+
+    def test_matches_pairwise(self):
+        """test_matches_pairwise - impacts, row sums and absolute sums match pair-wise comparison, regardless of tile size
+        """
+        for tile_cells in (1, 37, 2**20):
+            kernels = QualKernels(EvamixInput(self.in_array, self.crit_types), tile_cells)
+            dim = self.in_array.shape[0]
+            impact = kernels.gen_impact(self.weights, numpy.arange(dim)[:, numpy.newaxis], numpy.arange(dim)[numpy.newaxis, :])
+            self.assertTrue(numpy.allclose(impact, self.expected))
+            self.assertTrue(numpy.allclose(kernels.row_sums(self.weights), self.expected.sum(axis=1)))
+            self.assertAlmostEqual(kernels.absolute_sum(self.weights), numpy.abs(self.expected).sum(), 9)
+
+    def test_binary_only(self):
+        """test_binary_only - absolute sum with only Binary criteria comes from sorted bit sums
+        """
+        qual_cols = [1, 4]
+        kernels = QualKernels(EvamixInput(self.in_array, ["Ratio", "Binary", "Ratio", "Ratio", "Binary", "Ratio"]))
+        self.assertEqual(kernels.ordinal_cols, [])
+        expected = numpy.zeros((40, 40))
+        for k in qual_cols:
+            col = self.in_array[:, k]
+            expected += self.weights[k] * numpy.sign(col[:, numpy.newaxis] - col[numpy.newaxis, :])
+        self.assertAlmostEqual(kernels.absolute_sum(self.weights), numpy.abs(expected).sum(), 9)
+
+    def test_profiles(self):
+        """test_profiles - alternatives with identical qualitative values share a profile
+        """
+        in_array = numpy.array([[1, 2, 3], [1, 2, 3], [2, 2, 1], [1, 2, 3], [3, 1, 1]], dtype=float)
+        (profiles, counts) = QualKernels(EvamixInput(in_array, ["Ordinal", "Binary", "Ordinal"])).get_profiles()
+        self.assertEqual(sorted(zip(in_array[profiles, 0].tolist(), counts.tolist())), [(1.0, 3), (2.0, 1), (3.0, 1)])
+
+class TestTiledExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ratio", "Ordinal"]
+        (self.in_matrix, self.crit_weights, self.crit_bc) = gen_random_input(31, self.crit_types, 12)
+
+    def run_executor(self, num_workers, tile_cells):
+        evamix = ArrayEvamix(packed=True, executor=TiledExecutor(num_workers, tile_cells))
+        return evamix.do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+
+    def test_matches_reference(self):
+        """test_matches_reference - executor results match the reference engine
+        """
+        expected = Evamix().do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+        result = self.run_executor(0, 50)
+        for i in range(len(expected[0])):
+            self.assertAlmostEqual(result[0][i], expected[0][i], 9)
+        for m in range(1, 4):
+            self.assertTrue(numpy.allclose(result[1][m].to_dense(), expected[1][m], 0, 1e-12))
+
+    def test_identical_regardless_of_tiling(self):
+        """test_identical_regardless_of_tiling - matrices are identical for any tile size and number of workers,
+        scores (summed from the tile row sums) agree to rounding
+        """
+        expected = self.run_executor(0, 2**20)
+        for (num_workers, tile_cells) in ((0, 1), (0, 45), (2, 1), (3, 100)):
+            result = self.run_executor(num_workers, tile_cells)
+            self.assertTrue(numpy.allclose(result[0], expected[0], 0, 1e-12))
+            for m in range(1, 4):
+                self.assertEqual(result[1][m].values.tolist(), expected[1][m].values.tolist())
+
+    def test_tile_sums(self):
+        """test_tile_sums - sums recorded from the tiles match those of the matrix values
+        """
+        result = self.run_executor(2, 40)
+        for m in range(1, 4):
+            matrix = result[1][m]
+            computed = PackedAntisymmetricMatrix(matrix.dim, matrix.values)
+            self.assertTrue(matrix.known_abs_sum is not None)
+            self.assertAlmostEqual(matrix.absolute_sum(), computed.absolute_sum(), 12)
+            self.assertTrue(numpy.allclose(matrix.row_sums(), computed.row_sums(), 0, 1e-12))
+
+    def test_one_pool(self):
+        """test_one_pool - the worker pool is started once per analysis and closed after it
+        """
+        pools = []
+        def count_pool(*args):
+            pools.append(real_pool(*args))
+            return pools[-1]
+        real_pool = tiled_executor.multiprocessing.Pool
+        tiled_executor.multiprocessing.Pool = count_pool
+        try:
+            executor = TiledExecutor(2, 40)
+            ArrayEvamix(packed=True, executor=executor).do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+        finally:
+            tiled_executor.multiprocessing.Pool = real_pool
+        self.assertEqual(len(pools), 1)
+        self.assertEqual(executor.pool, None)
+
+    def test_scores_only(self):
+        """test_scores_only - qualitative absolute sums on the executor give the same scores and batch scores
+        """
+        expected = ArrayEvamix().do_scores(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+        weight_sets = [list(self.crit_weights), [1, 2, 3, 4, 5]]
+        expected_batch = ArrayEvamix().do_batch_scores(self.in_matrix, weight_sets, self.crit_types, self.crit_bc)
+        results = []
+        for (num_workers, tile_cells) in ((0, 1), (2, 30)):
+            evamix = ArrayEvamix(executor=TiledExecutor(num_workers, tile_cells))
+            scores = evamix.do_scores(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+            self.assertTrue(numpy.allclose(scores, expected, 0, 1e-12))
+            self.assertTrue(numpy.allclose(evamix.do_batch_scores(self.in_matrix, weight_sets, self.crit_types, self.crit_bc), expected_batch, 0, 1e-12))
+            results.append(scores)
+        self.assertEqual(results[0], results[1])
+
+class TestMappedMatrices(unittest.TestCase):
+
+    def setUp(self):
+        self.matrix_dir = tempfile.mkdtemp()
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ordinal"]
+        (self.in_matrix, self.crit_weights, self.crit_bc) = gen_random_input(25, self.crit_types, 6)
+        self.expected = ArrayEvamix(packed=True).do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+
+    def tearDown(self):
+        shutil.rmtree(self.matrix_dir)
+
+    def test_mapped_matches_memory(self):
+        """test_mapped_matches_memory - matrices written to mapped files match in memory matrices
+        """
+        for executor in (None, TiledExecutor(0, 40), TiledExecutor(2, 40)):
+            expected = ArrayEvamix(7, packed=True, executor=executor).do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+            evamix = ArrayEvamix(7, packed=True, executor=executor, matrix_dir=self.matrix_dir)
+            result = evamix.do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+            self.assertEqual(result[0], expected[0])
+            for m in range(1, 4):
+                self.assertTrue(isinstance(result[1][m], MappedPackedMatrix))
+                self.assertEqual(result[1][m].values.tolist(), expected[1][m].values.tolist())
+        self.assertEqual(len(os.listdir(self.matrix_dir)), 9)
+
+    def test_pickled_by_reference(self):
+        """test_pickled_by_reference - mapped matrices pickle as their file name and are read lazily
+        """
+        evamix = ArrayEvamix(packed=True, matrix_dir=self.matrix_dir)
+        result = evamix.do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+        final = result[1][3]
+        data = pickle.dumps(final, pickle.HIGHEST_PROTOCOL)
+        self.assertTrue(len(data) < 200)
+        loaded = pickle.loads(data)
+        self.assertTrue(loaded.mapped_values is None)
+        self.assertEqual(get_matrix_column(loaded, 3), get_matrix_column(self.expected[1][3], 3))
+        self.assertEqual(loaded.mode, 'r')
+        loaded.remove()
+        self.assertFalse(os.path.exists(final.filename))
+
+    def test_stored_as_data(self):
+        """test_stored_as_data - packed and mapped matrices are stored as plain data and rebuilt on load
+        """
+        mapped = ArrayEvamix(packed=True, matrix_dir=self.matrix_dir).do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+        for matrix in [self.expected[1][3], pack_matrix(self.expected[1][3], numpy.float32), mapped[1][3]]:
+            data = pickle.dumps(get_matrix_data(matrix), pickle.HIGHEST_PROTOCOL)
+            self.assertFalse('packed_matrix' in data)
+            self.assertFalse('numpy' in data)
+            loaded = load_matrix_data(pickle.loads(data))
+            self.assertEqual(type(loaded), type(matrix))
+            self.assertEqual(loaded.dtype, matrix.dtype)
+            self.assertEqual(loaded.values.tolist(), matrix.values.tolist())
+
+class TestAnalysisPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ratio"]
+        (self.in_matrix, self.crit_weights, self.crit_bc) = gen_random_input(12, self.crit_types, 8)
+
+    def test_hook_receives_stages(self):
+        """test_hook_receives_stages - hooks are told about every stage with its timings and output size
+        """
+        for evamix in (Evamix(), ArrayEvamix(), ArrayEvamix(packed=True)):
+            recorder = StageRecorder()
+            evamix.hooks = [recorder]
+            evamix.do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+            names = [info.name for info in recorder.infos]
+            self.assertEqual(sorted(names), sorted([name for (name, deps) in Evamix.analysis_stages]))
+            self.assertEqual(names[0], 'validate')
+            self.assertEqual(names[-1], 'score')
+            for info in recorder.infos:
+                self.assertTrue(info.wall_time >= 0)
+                self.assertTrue(info.cpu_time >= 0)
+            self.assertEqual(recorder.get_info('quant_impact').get_output_shapes(), (12, 12))
+            self.assertEqual(recorder.get_info('score').get_output_shapes(), (12,))
+            self.assertTrue(recorder.get_info('combine').get_output_bytes() > 0)
+
+    def test_packed_output_bytes(self):
+        """test_packed_output_bytes - packed matrix stages report the size of their stored half
+        """
+        recorder = StageRecorder()
+        evamix = ArrayEvamix(packed=True)
+        evamix.hooks = [recorder]
+        evamix.do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+        self.assertEqual(recorder.get_info('quant_impact').get_output_bytes(), 8*get_num_pairs(12))
+
+    def test_recorder_releases_runs(self):
+        """test_recorder_releases_runs - kept StageInfos hold neither the pipeline nor the stage outputs
+        """
+        recorder = StageRecorder()
+        stages = AnalysisPipeline(ArrayEvamix(), self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc, [recorder])
+        stages.get_results()
+        pipeline_ref = weakref.ref(stages)
+        del stages
+        gc.collect()
+        self.assertEqual(pipeline_ref(), None)
+        for info in recorder.infos:
+            self.assertEqual(info.get_output(), None)
+        self.assertEqual(recorder.get_info('quant_impact').get_output_shapes(), (12, 12))
+
+    def test_lazy_stages(self):
+        """test_lazy_stages - only the stages needed for the output asked for are run
+        """
+        for evamix in (Evamix(), ArrayEvamix(packed=True)):
+            recorder = StageRecorder()
+            stages = AnalysisPipeline(evamix, self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc, [recorder])
+            stages.get_output('quant_impact')
+            self.assertEqual([info.name for info in recorder.infos], ['validate', 'standardize_weights', 'flip_cost', 'standardize_values', 'quant_impact'])
+            stages.get_output('quant_impact')
+            self.assertEqual(len(recorder.infos), 5)
+            self.assertRaises(DelphosError, stages.get_output, 'bad_stage')
+
+    def test_pipeline_matches_analysis(self):
+        """test_pipeline_matches_analysis - results of a pipeline run stage by stage match do_analysis
+        """
+        expected = ArrayEvamix().do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+        stages = ArrayEvamix().gen_pipeline(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+        stages.run_all()
+        self.assertEqual(stages.get_results()[0].tolist(), expected[0])
+
+class TestAnalysisProgress(unittest.TestCase):
+
+    def setUp(self):
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ordinal"]
+        (self.in_matrix, self.crit_weights, self.crit_bc) = gen_random_input(40, self.crit_types, 9)
+        self.matrix_dir = tempfile.mkdtemp()
+        self.reports = []
+
+    def tearDown(self):
+        shutil.rmtree(self.matrix_dir)
+
+    def record(self, fraction, eta):
+        self.reports.append((fraction, eta))
+
+    def cancel_at(self, progress, cancel_fraction):
+        def callback(fraction, eta):
+            self.reports.append((fraction, eta))
+            if fraction >= cancel_fraction:
+                progress.cancel()
+        progress.callback = callback
+
+    def get_engines(self):
+        return (Evamix(), ArrayEvamix(7), ArrayEvamix(7, packed=True, matrix_dir=self.matrix_dir),
+                ArrayEvamix(7, packed=True, executor=TiledExecutor(0, 40), matrix_dir=self.matrix_dir))
+
+    def test_reports_progress(self):
+        """test_reports_progress - the fraction done rises to 1 with an estimate of the time left
+        """
+        for evamix in self.get_engines():
+            self.reports = []
+            evamix.progress = AnalysisProgress(self.record)
+            evamix.do_analysis(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+            fractions = [fraction for (fraction, eta) in self.reports]
+            self.assertEqual(fractions, sorted(fractions))
+            self.assertAlmostEqual(fractions[-1], 1.0, 9)
+            #Reported within the pair-wise stages, not just between them
+            self.assertTrue(len(fractions) > 2*len(Evamix.analysis_stages))
+            self.assertTrue(self.reports[-1][1] is not None)
+
+    def test_cancel(self):
+        """test_cancel - a cancelled run stops at its next tile or stage and removes its mapped matrices
+        """
+        for cancel_fraction in (0.0, 0.3, 0.6, 0.9):
+            for evamix in self.get_engines():
+                self.reports = []
+                progress = AnalysisProgress()
+                self.cancel_at(progress, cancel_fraction)
+                evamix.progress = progress
+                self.assertRaises(AnalysisCancelled, evamix.do_analysis, self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+                self.assertTrue(self.reports[-1][0] < 1.0)
+                self.assertEqual(os.listdir(self.matrix_dir), [])
+
+    def test_run_mca_cancel(self):
+        """test_run_mca_cancel - Project.run_mca passes the progress token to the engine
+        """
+        project = new_project('progress.dlp', self.matrix_dir)
+        progress = AnalysisProgress()
+        progress.cancel()
+        self.assertRaises(AnalysisCancelled, project.run_mca, self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc, progress)
+        progress = AnalysisProgress(self.record)
+        [final_scores, int_data] = project.run_mca(self.in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc, progress)
+        self.assertEqual(len(final_scores), 40)
+        self.assertAlmostEqual(self.reports[-1][0], 1.0, 9)
+
+class TestEvamixBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.benchmark = EvamixBenchmark([10, 30], [5], ['mixed', 'qual'])
+        self.benchmark.run()
+
+    def test_engines_agree(self):
+        """test_engines_agree - every engine runs every stage of a small sweep and agrees on the scores
+        """
+        self.assertEqual(self.benchmark.errors, [])
+        self.assertEqual(self.benchmark.mismatches, [])
+        rows = [row for row in self.benchmark.results if row['case'] == 'n30_k5_mixed' and row['engine'] == 'packed']
+        self.assertEqual(len(rows), len(Evamix.analysis_stages)+1)
+        self.assertEqual(rows[-1]['stage'], 'total')
+        if get_rss() is not None:
+            self.assertEqual([row for row in rows if row['rss_change'] is None], [])
+
+    def test_check_scores(self):
+        """test_check_scores - changed scores and rankings are reported
+        """
+        expected = numpy.array([0.5, 0.1, -0.6])
+        self.assertEqual(self.benchmark.check_scores(expected, expected + 1e-12), None)
+        self.assertNotEqual(self.benchmark.check_scores(expected, numpy.array([0.5, 0.2, -0.6])), None)
+        self.assertNotEqual(self.benchmark.check_scores(expected, expected[:2]), None)
+
+    def test_regression_threshold(self):
+        """test_regression_threshold - results are compared with a baseline written by an earlier run
+        """
+        (handle, filename) = tempfile.mkstemp('.csv')
+        os.close(handle)
+        try:
+            self.benchmark.write_results(filename)
+            baseline = read_baseline(filename)
+        finally:
+            os.remove(filename)
+        self.assertEqual(len(baseline), len(self.benchmark.results))
+        self.assertEqual(self.benchmark.find_regressions(baseline, 0.25, 1000.0), [])
+        key = ('n30_k5_qual', 'array', 'total')
+        baseline[key]['wall_time'] = 1e-6
+        baseline[key]['output_bytes'] = 10
+        regressions = self.benchmark.find_regressions(baseline, 0.25, 0.0)
+        self.assertTrue([regression for regression in regressions if regression.startswith('n30_k5_qual array total') and 'bytes' in regression])
+        self.assertTrue([regression for regression in regressions if regression.startswith('n30_k5_qual array total') and 'bytes' not in regression])
+
+#Sizes (alternatives x criteria) of the synthetic projects run by TestProjectScaling.
+#The realistic tier takes minutes so is only run when EVAMIX_SLOW_TESTS is set,
+#EVAMIX_SCALING_SIZES (eg. 10000x100) replaces its sizes
+run_slow_tests = bool(os.environ.get('EVAMIX_SLOW_TESTS'))
+scaling_sizes = [tuple([int(x) for x in size.split('x')]) for size in os.environ.get('EVAMIX_SCALING_SIZES', '2000x300,5000x200').split(',')]
+smoke_scaling_sizes = [(300, 26)]
+
+class TestProjectScaling(unittest.TestCase):
+
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.project_dir)
+
+    def create_project(self, num_alterns, crit_types, crit_bc):
+        project = new_project('scaling_%dx%d.dlp' % (num_alterns, len(crit_types)), self.project_dir)
+        for i in range(num_alterns):
+            project.add_alternative(u'Alternative %d' % i, '#ff0000')
+        for k in range(len(crit_types)):
+            if crit_types[k] == "Ratio":
+                type_options = u'Units'
+            elif crit_types[k] == "Binary":
+                type_options = [u'Yes', u'No']
+            else:
+                type_options = [[u'Level %d' % level, level] for level in range(1, 6)]
+            project.add_criteria((u'Criterion %d' % k, unicode(crit_types[k]), type_options, crit_bc[k]))
+        return project
+
+    def test_run_and_save_small(self):
+        """test_run_and_save_small - a small synthetic project runs through run_mca and save_analysis
+        """
+        self.run_and_save(smoke_scaling_sizes)
+
+    @unittest.skipUnless(run_slow_tests, "slow, set EVAMIX_SLOW_TESTS to run")
+    def test_run_and_save(self):
+        """test_run_and_save - synthetic projects with thousands of alternatives run through run_mca and save_analysis
+        """
+        self.run_and_save(scaling_sizes)
+
+    def run_and_save(self, sizes):
+        for (num_alterns, num_crit) in sizes:
+            crit_types = [["Ratio", "Ordinal", "Binary"][k % 3] for k in range(num_crit)]
+            (in_matrix, crit_weights, crit_bc) = gen_random_input(num_alterns, crit_types, num_crit)
+            project = self.create_project(num_alterns, crit_types, crit_bc)
+            altern_data = project.get_all_alternatives()
+            crit_data = project.get_all_criteria()
+            self.assertEqual(len(altern_data), num_alterns)
+            self.assertEqual(len(crit_data), num_crit)
+
+            [final_scores, int_data] = project.run_mca(in_matrix, list(crit_weights), crit_types, crit_bc)
+            project.save_analysis(u'Scaling', u'', altern_data, crit_data, in_matrix, crit_weights, final_scores, int_data)
+            run_id = project.get_mca_runs_basic()[-1][0]
+            mca_run = project.get_mca_run_by_id(run_id)
+            self.assertEqual(mca_run[7], final_scores)
+            self.assertEqual(get_matrix_column(mca_run[9][3], num_alterns-1), get_matrix_column(int_data[3], num_alterns-1))
+            expected = ArrayEvamix().do_scores(in_matrix, list(crit_weights), crit_types, crit_bc)
+            for i in range(num_alterns):
+                self.assertAlmostEqual(final_scores[i], expected[i], 9)
+
+class TestRankAcceptability(unittest.TestCase):
+
+    def test_reproducible_across_workers(self):
+        """test_reproducible_across_workers - same seed gives same rank probabilities in process and on a pool
+        """
+        crit_types = ["Ratio", "Ordinal", "Binary", "Ratio"]
+        (in_matrix, crit_weights, crit_bc) = gen_random_input(6, crit_types, 2)
+        options = dict(seed=3, input_spread=0.1, batch_size=20, min_samples=40, max_samples=200)
+        local = RankAcceptability(num_workers=0, **options).do_analysis(in_matrix, crit_weights, crit_types, crit_bc)
+        pooled = RankAcceptability(num_workers=2, **options).do_analysis(in_matrix, crit_weights, crit_types, crit_bc)
+        self.assertEqual(local, pooled)
+        for i in range(len(local)):
+            self.assertAlmostEqual(sum(local[i]), 1.0, 9)
+            self.assertAlmostEqual(sum([row[i] for row in local]), 1.0, 9)
+
+    def test_adaptive_stop(self):
+        """test_adaptive_stop - sampling stops early once rank probabilities converge
+        """
+        in_matrix = [[1, 1], [5, 2], [9, 2]]
+        analysis = RankAcceptability(num_workers=0, batch_size=50, min_samples=100, max_samples=5000, tolerance=0.01)
+        probs = analysis.do_analysis(in_matrix, [1, 1], ["Ratio", "Ordinal"], ["B", "B"])
+        self.assert_(analysis.converged)
+        self.assert_(analysis.num_samples < 5000)
+        self.assertEqual(analysis.get_first_rank_probabilities(), [0.0, 0.0, 1.0])
+
+class TestWeightStability(unittest.TestCase):
+
+    def setUp(self):
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ratio", "Ordinal"]
+        (self.in_matrix, self.crit_weights, self.crit_bc) = gen_random_input(12, self.crit_types, 5)
+
+    def scan_interval(self, analysis, c, kind, steps=2000):
+        """Interval found by checking the ranking at every one of steps points"""
+        values = numpy.linspace(0.0, 1.0, steps+1)
+        stable = analysis.check_stable(analysis.gen_scores(analysis.gen_weight_rows([c]*len(values), values)))[kind]
+        start = numpy.searchsorted(values, analysis.weights[c])
+        (lower, upper) = (start, start-1)
+        while lower > 0 and stable[lower-1]:
+            lower -= 1
+        while upper < steps and stable[upper+1]:
+            upper += 1
+        return (values[lower], values[upper])
+
+    def test_matches_scan(self):
+        """test_matches_scan - interval ends match a fine scan of each weight
+        """
+        analysis = WeightStability()
+        intervals = analysis.do_analysis(self.in_matrix, self.crit_weights, self.crit_types, self.crit_bc)
+        self.assertEqual(len(intervals), len(self.crit_types))
+        for c in range(len(self.crit_types)):
+            (std_weight, rank_lower, rank_upper, top_lower, top_upper) = intervals[c]
+            self.assert_(top_lower <= rank_lower <= std_weight <= rank_upper <= top_upper)
+            for (kind, lower, upper) in [(0, rank_lower, rank_upper), (1, top_lower, top_upper)]:
+                (scan_lower, scan_upper) = self.scan_interval(analysis, c, kind)
+                self.assert_(abs(lower - scan_lower) <= 0.0005 + 1e-6)
+                self.assert_(abs(upper - scan_upper) <= 0.0005 + 1e-6)
+
+    def test_ranking_changes_outside(self):
+        """test_ranking_changes_outside - ranking holds at the interval ends and changes just past them
+        """
+        analysis = WeightStability(tolerance=1e-8)
+        intervals = analysis.do_analysis(self.in_matrix, self.crit_weights, self.crit_types, self.crit_bc)
+        for c in range(len(self.crit_types)):
+            (std_weight, rank_lower, rank_upper) = intervals[c][:3]
+            values = [rank_lower, rank_upper, rank_lower-1e-7, rank_upper+1e-7]
+            stable = analysis.check_stable(analysis.gen_scores(analysis.gen_weight_rows([c]*4, values)))[0]
+            self.assert_(stable[0] and stable[1])
+            self.assertEqual(bool(stable[2]), rank_lower == 0.0)
+            self.assertEqual(bool(stable[3]), rank_upper == 1.0)
+
+    def test_dominant_alternative(self):
+        """test_dominant_alternative - an alternative best on every criterion stays on top for any weights
+        """
+        in_matrix = [[1, 1, 2], [5, 2, 3], [9, 3, 5]]
+        intervals = WeightStability().do_analysis(in_matrix, [1, 2, 1], ["Ratio", "Ordinal", "Ordinal"], ["B", "B", "B"])
+        for interval in intervals:
+            self.assertEqual(interval[3:], [0.0, 1.0])
+
+    def test_constant_qual_column(self):
+        """test_constant_qual_column - weights leaving only a constant qualitative criterion change the ranking
+        """
+        in_matrix = [[10, 1, 1], [20, 1, 2], [15, 1, 1], [5, 1, 2]]
+        intervals = WeightStability().do_analysis(in_matrix, [1, 2, 3], ["Ratio", "Ordinal", "Ordinal"], ["B", "B", "B"])
+        (std_weight, rank_lower, rank_upper, top_lower, top_upper) = intervals[1]
+        self.assert_(rank_lower <= std_weight <= rank_upper < 1.0)
+        self.assert_(top_upper < 1.0)
+        (std_weight, rank_lower, rank_upper, top_lower, top_upper) = intervals[2]
+        self.assert_(0.0 < rank_lower <= std_weight <= rank_upper)
+        self.assert_(0.0 < top_lower)
+
+class TestCriteriaSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ratio", "Ordinal"]
+        (self.in_matrix, self.crit_weights, self.crit_bc) = gen_random_input(15, self.crit_types, 6)
+
+    def test_matches_subset_analysis(self):
+        """test_matches_subset_analysis - each subset scores as an analysis of only its criteria
+        """
+        for subset_size in [None, 2]:
+            sweep = CriteriaSweep(subset_size, batch_size=3, num_workers=0)
+            scores = sweep.do_analysis(self.in_matrix, self.crit_weights, self.crit_types, self.crit_bc)
+            self.assertEqual(len(scores), len(sweep.get_subsets()))
+            for (subset, subset_scores) in zip(sweep.get_subsets(), scores):
+                in_matrix = [[row[k] for k in subset] for row in self.in_matrix]
+                expected = ArrayEvamix().do_scores(in_matrix, [self.crit_weights[k] for k in subset],
+                                                   [self.crit_types[k] for k in subset], [self.crit_bc[k] for k in subset])
+                for i in range(len(expected)):
+                    self.assertAlmostEqual(subset_scores[i], expected[i], 12)
+        self.assertEqual(len(sweep.get_subsets()), 10)
+
+    def test_same_on_pool(self):
+        """test_same_on_pool - subsets scored on a process pool give the same results
+        """
+        local = CriteriaSweep(batch_size=2, num_workers=0)
+        pooled = CriteriaSweep(batch_size=2, num_workers=2)
+        self.assertEqual(local.do_analysis(self.in_matrix, self.crit_weights, self.crit_types, self.crit_bc),
+                         pooled.do_analysis(self.in_matrix, self.crit_weights, self.crit_types, self.crit_bc))
+        self.assertEqual(local.get_rank_volatility(), pooled.get_rank_volatility())
+
+    def test_volatility_and_influence(self):
+        """test_volatility_and_influence - only leaving out the criterion deciding the ranking moves it
+        """
+        #Criterion 0 reverses the order given by the other two
+        in_matrix = [[9, 1, 1], [5, 2, 2], [1, 3, 3]]
+        sweep = CriteriaSweep(num_workers=0)
+        sweep.do_analysis(in_matrix, [1, 5, 5], ["Ratio", "Ordinal", "Ordinal"], ["B", "B", "B"])
+        self.assertEqual(sweep.get_subsets(), [(0, 1), (0, 2), (1, 2)])
+        self.assertEqual(sweep.get_ranks(), [[0, 1, 2], [0, 1, 2], [2, 1, 0]])
+        influence = sweep.get_criteria_influence()
+        self.assertEqual(influence[0], (0, 4.0))
+        self.assertEqual(sorted(influence[1:]), [(1, 0.0), (2, 0.0)])
+        volatility = sweep.get_rank_volatility()
+        self.assertEqual(volatility[0][:3], [0, 0, 2])
+        self.assertEqual(volatility[1][:4], [1, 1, 1, 0.0])
+
+    def test_skips_constant_subset(self):
+        """test_skips_constant_subset - a subset whose only qualitative criterion has one value is skipped
+        """
+        in_matrix = [[1, 2, 1], [3, 2, 2], [5, 2, 3]]
+        sweep = CriteriaSweep(num_workers=0)
+        scores = sweep.do_analysis(in_matrix, [1, 2, 3], ["Ratio", "Ordinal", "Ordinal"], ["B", "B", "B"])
+        self.assertEqual(sweep.get_subsets(), [(0, 1), (0, 2), (1, 2)])
+        self.assertEqual(sweep.get_skipped(), [0])
+        self.assert_(numpy.isnan(scores[0]).all())
+        self.assertFalse(numpy.isnan(scores[1:]).any())
+        self.assertEqual(sweep.get_ranks()[0], None)
+        self.assertEqual(len(sweep.get_rank_volatility()), 3)
+        #Criterion 2 is only left out by the skipped subset
+        influence = dict(sweep.get_criteria_influence())
+        self.assertEqual(influence[2], 0.0)
+
+    def test_too_many_subsets(self):
+        """test_too_many_subsets - DelphosError when the sweep would exceed max_subsets
+        """
+        sweep = CriteriaSweep(2, max_subsets=5, num_workers=0)
+        self.assertRaises(DelphosError, sweep.do_analysis, self.in_matrix, self.crit_weights, self.crit_types, self.crit_bc)
+
+class TestRankReversal(unittest.TestCase):
+
+    def test_matches_reruns(self):
+        """test_matches_reruns - scores and reversals match an analysis rerun without each alternative
+        """
+        for crit_types in [["Ratio", "Ordinal", "Binary", "Ratio"], ["Ratio", "Ratio"], ["Ordinal", "Binary", "Ordinal"]]:
+            (in_matrix, crit_weights, crit_bc) = gen_random_input(12, crit_types, 7)
+            analysis = RankReversal()
+            reversals = analysis.do_analysis(in_matrix, crit_weights, crit_types, crit_bc)
+            full_scores = ArrayEvamix().do_scores(in_matrix, list(crit_weights), crit_types, crit_bc)
+            expected_reversals = []
+            all_scores = analysis.get_scores()
+            for removed in range(len(in_matrix)):
+                alterns = [i for i in range(len(in_matrix)) if i != removed]
+                scores = ArrayEvamix().do_scores([in_matrix[i] for i in alterns], list(crit_weights), crit_types, crit_bc)
+                for a in range(len(alterns)):
+                    self.assertAlmostEqual(all_scores[removed][alterns[a]], scores[a], 12)
+                    for b in range(len(alterns)):
+                        if full_scores[alterns[b]] > full_scores[alterns[a]] + 1e-12 and scores[a] > scores[b] + 1e-12:
+                            expected_reversals.append((removed, alterns[a], alterns[b]))
+            self.assertEqual(sorted(reversals), sorted(expected_reversals))
+            self.assertEqual(analysis.get_skipped(), [])
+
+    def test_flags_reversal(self):
+        """test_flags_reversal - removing an alternative reverses the order of two others
+        """
+        #Alternative 0 is ahead of 2, without alternative 3 the impacts are
+        #divided by different absolute sums and 2 overtakes it
+        in_matrix = [[0, 3], [100, 1], [50, 2], [100, 3]]
+        analysis = RankReversal()
+        reversals = analysis.do_analysis(in_matrix, [1, 1], ["Ratio", "Ordinal"], ["B", "B"])
+        self.assertEqual(reversals, [(3, 2, 0)])
+        ranks = analysis.get_ranks()
+        self.assertEqual(ranks[3][3], None)
+        self.assert_(ranks[3][2] < ranks[3][0])
+        self.assert_(analysis.full_scores[0] > analysis.full_scores[2])
+
+    def test_skips_constant_column(self):
+        """test_skips_constant_column - removals leaving a ratio column with one value are skipped
+        """
+        in_matrix = [[1, 1], [1, 2], [5, 3], [1, 2]]
+        analysis = RankReversal()
+        analysis.do_analysis(in_matrix, [1, 1], ["Ratio", "Ordinal"], ["B", "B"])
+        self.assertEqual(analysis.get_skipped(), [2])
+        self.assertEqual(analysis.get_scores()[2], None)
+        self.assertEqual(analysis.get_ranks()[2], None)
+
+class TestScenarioBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ratio"]
+        (self.in_matrix, self.crit_weights, self.crit_bc) = gen_random_input(10, self.crit_types, 8)
+        self.overlays = [[(0, 0, 99999), (3, 3, 5)], [(2, 1, 5), (4, 2, 1)], [], [(9, 0, 0), (9, 1, 1), (1, 3, 100000)]]
+
+    def test_matches_analysis(self):
+        """test_matches_analysis - each scenario scores as an analysis of the overlaid input
+        """
+        batch = ScenarioBatch()
+        scores = batch.do_analysis(self.in_matrix, self.overlays, self.crit_weights, self.crit_types, self.crit_bc)
+        self.assertEqual(len(scores), len(self.overlays))
+        for s in range(len(self.overlays)):
+            in_matrix = [list(row) for row in self.in_matrix]
+            for (row, col, value) in self.overlays[s]:
+                in_matrix[row][col] = value
+            expected = ArrayEvamix().do_scores(in_matrix, list(self.crit_weights), self.crit_types, self.crit_bc)
+            for i in range(len(expected)):
+                self.assertAlmostEqual(scores[s][i], expected[i], 12)
+
+    def test_summary(self):
+        """test_summary - worst and best scores, regrets and the maximin and minimax regret choices
+        """
+        batch = ScenarioBatch()
+        batch.do_analysis(self.in_matrix, self.overlays, self.crit_weights, self.crit_types, self.crit_bc)
+        scores = numpy.array(batch.get_scores())
+        regrets = numpy.array(batch.get_regrets())
+        self.assertEqual(regrets.min(axis=1).tolist(), [0.0]*len(self.overlays))
+        summary = batch.get_summary()
+        for i in range(len(self.in_matrix)):
+            self.assertEqual(summary[i], [scores[:, i].min(), scores[:, i].max(), regrets[:, i].max()])
+        self.assertEqual(batch.get_maximin(), int(numpy.argmax(scores.min(axis=0))))
+        self.assertEqual(batch.get_minimax_regret(), int(numpy.argmin(regrets.max(axis=0))))
+
+    def test_bad_scenario(self):
+        """test_bad_scenario - DelphosError naming a scenario which leaves a ratio row with one value
+        """
+        overlays = [[(0, 0, 1)], [(i, 0, 7) for i in range(len(self.in_matrix))]]
+        batch = ScenarioBatch()
+        try:
+            batch.do_analysis(self.in_matrix, overlays, self.crit_weights, self.crit_types, self.crit_bc, ['good', 'flat'])
+        except DelphosError, e:
+            self.assert_(e.value.startswith("Scenario flat:"))
+        else:
+            self.fail("DelphosError not raised")
+
+class TestInputValidation(unittest.TestCase):
+
+    def test_grid_errors(self):
+        """test_grid_errors - every missing, non-integer, bad option and same value error in one pass
+        """
+        validation = InputValidation(["Ratio", "Ordinal", "Ratio", "Binary"], [None, [1, 2, 3], None, [1, 2]])
+        errors = validation.validate([[1, 2, 5, 1], [None, 4, 5, 'x'], [3.5, 1, 5, 1], ['7', 2, 5, 1]])
+        self.assertEqual(errors, [(MISSING, 1, 0, None), (NON_INTEGER, 2, 0, 3.5), (BAD_OPTION, 1, 1, 4),
+                                  (NON_INTEGER, 1, 3, 'x'), (SAME_VALUES, None, 2, None)])
+        self.assertEqual(len(validation.get_messages()), 5)
+        self.assertEqual(validation.validate([[1, 2, 5, 1], [2, 2, 5, 1]]), [(SAME_VALUES, None, 2, None), (SAME_QUAL_VALUES, None, None, None)])
+        #A missing value is not an error if input is not required, but its row is not checked for one value
+        self.assertEqual(validation.validate([[1, 2, 5, 1], [1, None, 6, 1]], False), [(SAME_VALUES, None, 0, None)])
+        self.assertRaises(InputError, validation.check, [[1, 2, 5, 1], [1, 3, 6, 2]])
+        #Values that are not finite are not integers
+        validation = InputValidation(["Ratio", "Ordinal"], [None, [1, 2]])
+        errors = validation.validate([[float('nan'), 1], [float('inf'), 2], [2, 2]])
+        self.assertEqual([error[:3] for error in errors], [(NON_INTEGER, 0, 0), (NON_INTEGER, 1, 0)])
+
+    def test_message_templates(self):
+        """test_message_templates - messages are built from the templates given, the default ones for the rest
+        """
+        templates = {MISSING: u"Falta %(crit)s / %(altern)s"}
+        error = (MISSING, 1, 0, None)
+        self.assertEqual(gen_error_message(error, ["Depth"], ["A", "B"], templates), u"Falta 1 'Depth' / 2 'B'")
+        self.assertEqual(gen_error_message(error), u"Missing input in row 0, column 1")
+        self.assertEqual(gen_error_message((BAD_OPTION, 0, 2, 9), templates=templates), u"Invalid option in row 2, column 0: 9")
+        self.assertRaises(DelphosError, gen_error_message, ('bad_type', None, None, None))
+
+    def test_evamix_same_values(self):
+        """test_evamix_same_values - DelphosError listing every ratio row with one value
+        """
+        in_matrix = [[1, 5, 2, 1], [1, 5, 3, 2], [1, 5, 4, 1]]
+        for evamix in [Evamix(), ArrayEvamix()]:
+            try:
+                evamix.do_analysis(in_matrix, [1, 1, 1, 1], ["Ratio", "Ratio", "Ratio", "Ordinal"], ["B", "B", "B", "B"])
+            except DelphosError, e:
+                self.assertEqual(len(e.value.split("\n")), 2)
+                self.assert_(e.value.startswith("The quantitative values in row 0 are all the same."))
+            else:
+                self.fail("DelphosError not raised")
+
+class TestIncrementalEvamix(unittest.TestCase):
+
+    def setUp(self):
+        self.crit_types = ["Ratio", "Ordinal", "Binary", "Ratio", "Ordinal"]
+        (self.in_matrix, self.crit_weights, self.crit_bc) = gen_random_input(10, self.crit_types, 4)
+        self.incremental = IncrementalEvamix(self.in_matrix, self.crit_weights, self.crit_types, self.crit_bc)
+
+    def assert_matches_full(self):
+        """Compares incremental scores to a full analysis of the current state"""
+        inc = self.incremental
+        in_matrix = []
+        for altern_id in inc.get_altern_ids():
+            slot = inc.altern_slots[altern_id]
+            in_matrix.append([inc.columns[crit_id][slot] for crit_id in inc.get_crit_ids()])
+        crit_ids = inc.get_crit_ids()
+        expected = ArrayEvamix().do_scores(in_matrix, [inc.crit_weights[c] for c in crit_ids], [inc.crit_types[c] for c in crit_ids], [inc.crit_bc[c] for c in crit_ids])
+        scores = inc.get_scores()
+        for i in range(len(expected)):
+            self.assertAlmostEqual(scores[i], expected[i], 9)
+
+    def test_initial_state(self):
+        """test_initial_state - incremental scores match a full analysis before any edit
+        """
+        self.assert_matches_full()
+
+    def test_cell_edits(self):
+        """test_cell_edits - single cell edits of ratio and qualitative criteria
+        """
+        rand = random.Random(1)
+        for edit in range(30):
+            altern_id = rand.randint(0, 9)
+            crit_id = rand.randint(0, 4)
+            if self.crit_types[crit_id] == "Ratio":
+                value = rand.randint(0, 100000)
+            else:
+                value = rand.randint(1, 2)
+            self.incremental.update_value(altern_id, crit_id, value)
+            self.assert_matches_full()
+
+    def test_alternative_edits(self):
+        """test_alternative_edits - adding and removing alternatives
+        """
+        self.incremental.remove_alternative(3)
+        self.assert_matches_full()
+        self.incremental.remove_alternative(9)
+        self.assert_matches_full()
+        for altern_id in range(20, 40):
+            self.incremental.add_alternative(altern_id, [altern_id*100, altern_id % 5 + 1, altern_id % 2 + 1, 50, altern_id % 3])
+        self.assert_matches_full()
+        self.assertEqual(self.incremental.get_altern_ids()[:3], [0, 1, 2])
+
+    def test_criteria_edits(self):
+        """test_criteria_edits - adding and removing criteria, including changes of the max weight
+        """
+        self.incremental.add_criteria(10, "Ordinal", "B", 9, [i % 4 for i in range(10)])
+        self.assert_matches_full()
+        self.incremental.add_criteria(11, "Ratio", "C", 2, [i*i for i in range(10)])
+        self.assert_matches_full()
+        self.incremental.remove_criteria(10)
+        self.assert_matches_full()
+        self.incremental.remove_criteria(0)
+        self.assert_matches_full()
+
+    def test_zero_sums(self):
+        """test_zero_sums - tied quantitative or qualitative impacts raise ZeroDivisionError like a full analysis
+        """
+        in_matrix = [[1, 1, 1, 2], [2, 2, 2, 1], [3, 3, 1, 2]]
+        crit_types = ["Ratio", "Ratio", "Ordinal", "Ordinal"]
+        crit_bc = ["B", "C", "B", "B"]
+        self.assertRaises(ZeroDivisionError, ArrayEvamix().do_scores, in_matrix, [1, 1, 1, 1], crit_types, crit_bc)
+        incremental = IncrementalEvamix(in_matrix, [1, 1, 1, 1], crit_types, crit_bc)
+        self.assertRaises(ZeroDivisionError, incremental.get_scores)
+        incremental.remove_criteria(1)
+        self.assertRaises(ZeroDivisionError, incremental.get_scores)
+        incremental.update_value(2, 2, 3)
+        expected = ArrayEvamix().do_scores([[1, 1, 2], [2, 2, 1], [3, 3, 2]], [1, 1, 1], crit_types[:1] + crit_types[2:], ["B", "B", "B"])
+        scores = incremental.get_scores()
+        for i in range(3):
+            self.assertAlmostEqual(scores[i], expected[i], 9)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,397 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - incremental re-evaluation of an Evamix analysis after edits to
+# its input values, alternatives or criteria
+#===============================================================================
+
+import numpy
+
+from delphos_exceptions import *
+from array_evamix import ArrayEvamix
+
+class IncrementalEvamix(object):
+    """Keeps the state of an Evamix analysis so that it can be re-evaluated
+    after an edit without recomputing everything.
+
+    Standardized weights are (max_weight-weight+1)/sum, and the final scores
+    only depend on the ratio of impact row sums to absolute sums, so the
+    impact data is kept unscaled (weighted by max_weight-weight+1).  The
+    quantitative impact of i over j is s[i]-s[j] so only the vector s is kept.
+    The weighted qualitative impact matrix is kept along with its row sums,
+    absolute sum and the unweighted sign matrix (used when max_weight changes).
+
+    A qualitative criterion's contribution to the row sums is found from its
+    own column in O(n*log(n)) (see sign_row_sums).  Its contribution to the
+    absolute sum cannot be separated from the other criteria, so adding or
+    removing it takes one tiled pass over the pairs, updating the impact
+    matrix with that criterion's signs alone and summing the result.
+
+    Edit costs:
+        update_value - O(n) (quantitative column statistics, one row and
+            column of the qualitative matrices)
+        add_alternative, remove_alternative - O(n*k)
+        add_criteria, remove_criteria - O(n) for ratio criteria, one O(n^2)
+            pass for qualitative criteria, instead of O(n^2*k).  Either is
+            O(n^2) if the max weight changes
+
+    Alternatives are stored in slots, a removed alternative's slot is filled
+    by the last one.  Scores are returned in the order alternatives were given.
+    """
+
+    def __init__(self, in_matrix, crit_weights, crit_types, crit_bc, altern_ids=None, crit_ids=None):
+        """in_matrix, crit_weights, crit_types, crit_bc as given to Evamix.do_analysis
+        (crit_weights is not modified).  altern_ids and crit_ids identify the
+        rows and columns of in_matrix for later edits, default to their indices
+        """
+        self.evamix = ArrayEvamix()
+        #Same checks as a full analysis
+        self.evamix.prepare_input(in_matrix, list(crit_weights), crit_types, crit_bc)
+
+        num_alterns = len(in_matrix)
+        num_crits = len(in_matrix[0])
+        if altern_ids is None:
+            altern_ids = range(num_alterns)
+        if crit_ids is None:
+            crit_ids = range(num_crits)
+
+        self.size = num_alterns
+        self.capacity = num_alterns + 16
+        self.altern_ids = list(altern_ids)    #Alternative order for results
+        self.slot_ids = list(altern_ids)      #Alternative id in each slot
+        self.altern_slots = {}
+        for slot in range(num_alterns):
+            self.altern_slots[self.slot_ids[slot]] = slot
+
+        self.crit_ids = list(crit_ids)
+        self.crit_types = {}
+        self.crit_bc = {}
+        self.crit_weights = {}
+        self.columns = {}        #raw values by crit id
+        self.std_columns = {}    #standardized ratio values by crit id
+        self.max_weight = max(crit_weights)
+
+        self.quant_sums = numpy.zeros(self.capacity)
+        self.quant_unweighted = numpy.zeros(self.capacity)
+        self.qual_impact = numpy.zeros((self.capacity, self.capacity))
+        self.qual_signs = numpy.zeros((self.capacity, self.capacity), dtype=numpy.int32)
+        self.qual_rows = numpy.zeros(self.capacity)
+        self.qual_abs_sum = 0.0
+
+        in_array = numpy.array(in_matrix, dtype=float)
+        for c in range(num_crits):
+            crit_id = self.crit_ids[c]
+            self.crit_types[crit_id] = crit_types[c]
+            self.crit_bc[crit_id] = crit_bc[c]
+            self.crit_weights[crit_id] = crit_weights[c]
+            self.columns[crit_id] = numpy.zeros(self.capacity)
+            self.columns[crit_id][:num_alterns] = in_array[:, c]
+            self.__add_crit_terms(crit_id, 1)
+
+    ############################### Results #################################
+
+    def get_scores(self):
+        """Returns list of final scores in alternative order (see get_altern_ids)"""
+        n = self.size
+        if n < 2:
+            raise DelphosError, "First matrix has no dimension"
+        quant_ids = self.__get_crit_ids_by_kind(True)
+        qual_ids = self.__get_crit_ids_by_kind(False)
+        for crit_id in quant_ids:
+            if self.std_columns[crit_id] is None:
+                raise DelphosError, "The quantitative values in row "+str(self.crit_ids.index(crit_id))+ " are all the same.  This is not supported.  At least one of the values must differ from the rest for each row."
+
+        new_weights = [self.__get_new_weight(crit_id) for crit_id in self.crit_ids]
+        new_sum = float(sum(new_weights))
+        scores = numpy.zeros(n)
+        if quant_ids:
+            sum_quant_weights = sum([self.__get_new_weight(crit_id) for crit_id in quant_ids]) / new_sum
+            alt_sums = self.quant_sums[:n]
+            quant_abs_sum = self.evamix.quant_absolute_sum(alt_sums)
+            if quant_abs_sum == 0:
+                raise ZeroDivisionError, "float division"
+            scores += self.evamix.quant_row_sums(alt_sums) / quant_abs_sum * sum_quant_weights
+        if qual_ids:
+            if not [crit_id for crit_id in qual_ids if self.columns[crit_id][:n].min() != self.columns[crit_id][:n].max()]:
+                raise DelphosError, "The criteria values are the same for each alternative.  This is not supported.  The values on at least one row must differ in their value."
+            if self.qual_abs_sum == 0:
+                raise ZeroDivisionError, "float division"
+            sum_qual_weights = sum([self.__get_new_weight(crit_id) for crit_id in qual_ids]) / new_sum
+            scores += self.qual_rows[:n] / self.qual_abs_sum * sum_qual_weights
+        return [float(scores[self.altern_slots[altern_id]]) for altern_id in self.altern_ids]
+
+    def get_altern_ids(self):
+        return list(self.altern_ids)
+
+    def get_crit_ids(self):
+        return list(self.crit_ids)
+
+    def refresh(self):
+        """Recomputes the qualitative row and absolute sums from the impact
+        matrix, discarding rounding error accumulated by many edits
+        """
+        self.__update_qual_totals()
+
+    ################################ Edits ##################################
+
+    def update_value(self, altern_id, crit_id, value):
+        """Changes the input value for one alternative/criterion pair"""
+        slot = self.altern_slots[altern_id]
+        col = self.columns[crit_id]
+        old_value = col[slot]
+        if old_value == value:
+            return
+        col[slot] = value
+        if self.crit_types[crit_id] == "Ratio":
+            self.__update_quant_column(crit_id)
+            return
+
+        n = self.size
+        new_weight = self.__get_new_weight(crit_id)
+        vals = col[:n]
+        delta = numpy.sign(value - vals) - numpy.sign(old_value - vals)
+        delta[slot] = 0
+        old_abs = numpy.abs(self.qual_impact[slot, :n]).sum()
+
+        self.qual_impact[slot, :n] += new_weight * delta
+        self.qual_impact[:n, slot] -= new_weight * delta
+        self.qual_signs[slot, :n] += delta.astype(numpy.int32)
+        self.qual_signs[:n, slot] -= delta.astype(numpy.int32)
+        self.qual_rows[:n] -= new_weight * delta
+        self.qual_rows[slot] += new_weight * delta.sum()
+
+        #Row and column of the slot hold the same absolute values
+        self.qual_abs_sum += 2.0 * (numpy.abs(self.qual_impact[slot, :n]).sum() - old_abs)
+
+    def add_alternative(self, altern_id, values):
+        """Adds an alternative, values are given in criteria order (see get_crit_ids)"""
+        if altern_id in self.altern_slots:
+            raise DelphosError, "Alternative "+str(altern_id)+" already exists in the analysis"
+        if len(values) != len(self.crit_ids):
+            raise DelphosError, "Expected "+str(len(self.crit_ids))+" values for new alternative"
+        if self.size == self.capacity:
+            self.__grow(self.capacity*2)
+        n = self.size
+        slot = n
+        self.size += 1
+        self.altern_ids.append(altern_id)
+        self.slot_ids.append(altern_id)
+        self.altern_slots[altern_id] = slot
+
+        new_row = numpy.zeros(n)
+        new_signs = numpy.zeros(n, dtype=numpy.int32)
+        for c in range(len(self.crit_ids)):
+            crit_id = self.crit_ids[c]
+            col = self.columns[crit_id]
+            col[slot] = values[c]
+            if self.crit_types[crit_id] != "Ratio":
+                signs = numpy.sign(values[c] - col[:n])
+                new_row += self.__get_new_weight(crit_id) * signs
+                new_signs += signs.astype(numpy.int32)
+        self.__update_quant_columns()
+
+        self.qual_impact[slot, :n] = new_row
+        self.qual_impact[:n, slot] = -new_row
+        self.qual_signs[slot, :n] = new_signs
+        self.qual_signs[:n, slot] = -new_signs
+        self.qual_rows[:n] -= new_row
+        self.qual_rows[slot] = new_row.sum()
+        self.qual_abs_sum += 2.0 * numpy.abs(new_row).sum()
+
+    def remove_alternative(self, altern_id):
+        """Removes an alternative from the analysis"""
+        slot = self.altern_slots.pop(altern_id)
+        self.altern_ids.remove(altern_id)
+        n = self.size
+        last = n - 1
+
+        self.qual_abs_sum -= 2.0 * numpy.abs(self.qual_impact[slot, :n]).sum()
+        self.qual_rows[:n] -= self.qual_impact[:n, slot]
+        if slot != last:
+            moved_id = self.slot_ids[last]
+            self.slot_ids[slot] = moved_id
+            self.altern_slots[moved_id] = slot
+            for matrix in (self.qual_impact, self.qual_signs):
+                matrix[slot, :n] = matrix[last, :n]
+                matrix[:n, slot] = matrix[:n, last]
+                matrix[slot, slot] = 0
+            self.qual_rows[slot] = self.qual_rows[last]
+            for col in self.columns.values():
+                col[slot] = col[last]
+        for matrix in (self.qual_impact, self.qual_signs):
+            matrix[last, :n] = 0
+            matrix[:n, last] = 0
+        self.qual_rows[last] = 0.0
+        for col in self.columns.values():
+            col[last] = 0.0
+        self.slot_ids.pop()
+        self.size -= 1
+        self.__update_quant_columns()
+
+    def add_criteria(self, crit_id, crit_type, cost_benefit, weight, values):
+        """Adds a criterion, values are given in alternative order (see get_altern_ids)"""
+        if crit_id in self.columns:
+            raise DelphosError, "Criterion "+str(crit_id)+" already exists in the analysis"
+        if len(values) != len(self.altern_ids):
+            raise DelphosError, "Expected "+str(len(self.altern_ids))+" values for new criterion"
+        col = numpy.zeros(self.capacity)
+        for i in range(len(values)):
+            col[self.altern_slots[self.altern_ids[i]]] = values[i]
+        if weight > self.max_weight:
+            self.__shift_max_weight(weight)
+        self.crit_ids.append(crit_id)
+        self.crit_types[crit_id] = crit_type
+        self.crit_bc[crit_id] = cost_benefit
+        self.crit_weights[crit_id] = weight
+        self.columns[crit_id] = col
+        self.__add_crit_terms(crit_id, 1)
+
+    def remove_criteria(self, crit_id):
+        """Removes a criterion from the analysis"""
+        if len(self.crit_ids) < 2:
+            raise DelphosError, "No criteria weights given"
+        self.__add_crit_terms(crit_id, -1)
+        self.crit_ids.remove(crit_id)
+        del self.crit_types[crit_id]
+        del self.crit_bc[crit_id]
+        del self.crit_weights[crit_id]
+        del self.columns[crit_id]
+        if crit_id in self.std_columns:
+            del self.std_columns[crit_id]
+        new_max = max(self.crit_weights.values())
+        if new_max != self.max_weight:
+            self.__shift_max_weight(new_max)
+
+    ############################### Internals ###############################
+
+    def __get_new_weight(self, crit_id):
+        """Unscaled standardized weight (see Evamix.standardize_weights)"""
+        return self.max_weight - self.crit_weights[crit_id] + 1
+
+    def __get_crit_ids_by_kind(self, quant):
+        return [crit_id for crit_id in self.crit_ids if (self.crit_types[crit_id] == "Ratio") == quant]
+
+    def __add_crit_terms(self, crit_id, sign):
+        """Adds (sign 1) or removes (sign -1) a criterion's contribution to the
+        impact data.  Only the criterion's own column is read, qualitative
+        row sums are updated from its sign row sums and the absolute sum
+        found in the same tiled pass that updates the impact matrix
+        """
+        n = self.size
+        new_weight = self.__get_new_weight(crit_id)
+        if self.crit_types[crit_id] == "Ratio":
+            if sign > 0:
+                self.std_columns[crit_id] = self.__standardize_column(crit_id)
+            std_col = self.std_columns[crit_id]
+            if std_col is not None:
+                self.quant_sums[:n] += sign * new_weight * std_col
+                self.quant_unweighted[:n] += sign * std_col
+        else:
+            col = self.columns[crit_id][:n]
+            self.qual_rows[:n] += sign * new_weight * sign_row_sums(col)
+            abs_sum = 0.0
+            for rows in self.evamix.gen_row_tiles(n):
+                signs = numpy.sign(col[rows, numpy.newaxis] - col[numpy.newaxis, :])
+                tile = self.qual_impact[rows, :n]
+                tile += sign * new_weight * signs
+                self.qual_signs[rows, :n] += sign * signs.astype(numpy.int32)
+                abs_sum += numpy.abs(tile).sum()
+            self.qual_abs_sum = float(abs_sum)
+
+    def __shift_max_weight(self, new_max):
+        """Every unscaled weight moves by the change in max weight"""
+        n = self.size
+        shift = new_max - self.max_weight
+        self.max_weight = new_max
+        self.quant_sums[:n] += shift * self.quant_unweighted[:n]
+        self.qual_impact[:n, :n] += shift * self.qual_signs[:n, :n]
+        self.__update_qual_totals()
+
+    def __standardize_column(self, crit_id):
+        """Returns the flipped (if cost) and standardized ratio column, or None
+        if all values are the same
+        """
+        col = self.columns[crit_id][:self.size]
+        min_val = col.min()
+        max_val = col.max()
+        if min_val == max_val:
+            return None
+        if self.crit_bc[crit_id] == 'C':
+            return (max_val - col) / (max_val - min_val)
+        return (col - min_val) / (max_val - min_val)
+
+    def __update_quant_column(self, crit_id):
+        n = self.size
+        new_weight = self.__get_new_weight(crit_id)
+        old_col = self.std_columns[crit_id]
+        new_col = self.__standardize_column(crit_id)
+        if old_col is not None:
+            self.quant_sums[:n] -= new_weight * old_col
+            self.quant_unweighted[:n] -= old_col
+        if new_col is not None:
+            self.quant_sums[:n] += new_weight * new_col
+            self.quant_unweighted[:n] += new_col
+        self.std_columns[crit_id] = new_col
+
+    def __update_quant_columns(self):
+        """Rebuilds all ratio columns after the alternatives change, O(n*k)"""
+        n = self.size
+        self.quant_sums[:] = 0.0
+        self.quant_unweighted[:] = 0.0
+        for crit_id in self.__get_crit_ids_by_kind(True):
+            self.__add_crit_terms(crit_id, 1)
+
+    def __update_qual_totals(self):
+        n = self.size
+        self.qual_rows[:] = 0.0
+        self.qual_rows[:n] = self.qual_impact[:n, :n].sum(axis=1)
+        self.qual_abs_sum = float(numpy.abs(self.qual_impact[:n, :n]).sum())
+
+    def __grow(self, capacity):
+        """Reallocates storage to hold capacity alternatives"""
+        n = self.size
+        for crit_id in self.columns:
+            col = numpy.zeros(capacity)
+            col[:n] = self.columns[crit_id][:n]
+            self.columns[crit_id] = col
+        for name in ('quant_sums', 'quant_unweighted', 'qual_rows'):
+            vec = numpy.zeros(capacity)
+            vec[:n] = getattr(self, name)[:n]
+            setattr(self, name, vec)
+        qual_impact = numpy.zeros((capacity, capacity))
+        qual_impact[:n, :n] = self.qual_impact[:n, :n]
+        self.qual_impact = qual_impact
+        qual_signs = numpy.zeros((capacity, capacity), dtype=numpy.int32)
+        qual_signs[:n, :n] = self.qual_signs[:n, :n]
+        self.qual_signs = qual_signs
+        self.capacity = capacity
+
+def sign_row_sums(col):
+    """Returns the row sums of the sign matrix of a column, sum over j of
+    sign(col[i]-col[j]), the number of smaller values less the number of
+    larger values.  O(n*log(n)) with no n x n matrix
+    """
+    sorted_col = numpy.sort(col)
+    return numpy.searchsorted(sorted_col, col, 'left') - (len(col) - numpy.searchsorted(sorted_col, col, 'right'))
+
+def incremental_evamix_from_run(mca_run):
+    """Creates an IncrementalEvamix from a stored analysis run (see McaRuns.get_all_by_id)"""
+    (run_id, name, description, altern_data, crit_data, input_data, input_weights, results, created, int_results) = mca_run
+    altern_ids = [altern[0] for altern in altern_data]
+    crit_ids = [crit[0] for crit in crit_data]
+    crit_types = [crit[2] for crit in crit_data]
+    crit_bc = [crit[4] for crit in crit_data]
+    return IncrementalEvamix(input_data, input_weights, crit_types, crit_bc, altern_ids, crit_ids)
@@ -0,0 +1,78 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - analysis input error types and their messages, plain Python so
+# that the reference Evamix engine can use them
+#===============================================================================
+
+from delphos_exceptions import *
+
+#Error types, each error is a tuple (error_type, altern, crit, value)
+MISSING = 'missing'
+NON_INTEGER = 'non_integer'
+BAD_OPTION = 'bad_option'
+SAME_VALUES = 'same_values'
+SAME_QUAL_VALUES = 'same_qual_values'
+
+#Message template of each error type.  %(crit)s is the row (criterion),
+#%(altern)s the column (alternative) and %(value)s the value found.  The
+#interface passes translated templates to gen_error_message
+error_templates = {
+    MISSING: u"Missing input in row %(crit)s, column %(altern)s",
+    NON_INTEGER: u"Invalid input in row %(crit)s, column %(altern)s, expected an integer but found: %(value)s",
+    BAD_OPTION: u"Invalid option in row %(crit)s, column %(altern)s: %(value)s",
+    SAME_VALUES: u"The quantitative values in row %(crit)s are all the same.  This is not supported.  At least one of the values must differ from the rest for each row.",
+    SAME_QUAL_VALUES: u"The criteria values are the same for each alternative.  This is not supported.  The values on at least one row must differ in their value.",
+}
+
+def find_same_values(same, quant_cols, qual_cols):
+    """Returns the errors for a boolean array, True for each criterion with
+    the same value for all alternatives.  No quantitative criterion, and not
+    every qualitative criterion, may have the same value for all alternatives
+    """
+    errors = [(SAME_VALUES, None, j, None) for j in quant_cols if same[j]]
+    if len(qual_cols) > 0 and not [j for j in qual_cols if not same[j]]:
+        errors.append((SAME_QUAL_VALUES, None, None, None))
+    return errors
+
+def raise_same_values(same, quant_cols, qual_cols):
+    """Raises DelphosError with the messages of all errors found by find_same_values"""
+    errors = find_same_values(same, quant_cols, qual_cols)
+    if errors:
+        raise DelphosError, "\n".join([gen_error_message(error) for error in errors])
+
+def gen_error_message(error, crit_names=None, altern_names=None, templates=None):
+    """Returns the message for an error, criteria and alternatives are
+    given by number and name if the names are given, else by index
+
+    templates - message template of each error type, error_templates
+    (untranslated) are used for any not given
+    """
+    (error_type, altern, crit, value) = error
+    crit_text = altern_text = ""
+    if crit is not None:
+        crit_text = unicode(crit)
+        if crit_names:
+            crit_text = unicode(crit+1)+" '"+unicode(crit_names[crit])+"'"
+    if altern is not None:
+        altern_text = unicode(altern)
+        if altern_names:
+            altern_text = unicode(altern+1)+" '"+unicode(altern_names[altern])+"'"
+
+    template = (templates or {}).get(error_type, error_templates.get(error_type))
+    if template is None:
+        raise DelphosError, "Unknown input error type "+unicode(error_type)
+    return unicode(template) % {'crit': crit_text, 'altern': altern_text, 'value': unicode(value)}
@@ -0,0 +1,123 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - validation of a whole grid of analysis input in one pass,
+# reporting every error found
+#===============================================================================
+
+import numpy
+
+from delphos_exceptions import *
+from input_errors import *
+
+def parse_value(value):
+    """Returns (number, error_type) for one input value, number is nan and
+    error_type MISSING or NON_INTEGER if it is not an integer, else None
+    """
+    if value is None or value == "":
+        return (numpy.nan, MISSING)
+    if isinstance(value, basestring):
+        try:
+            return (float(int(value)), None)
+        except ValueError:
+            return (numpy.nan, NON_INTEGER)
+    if isinstance(value, (int, long)):
+        return (float(value), None)
+    if isinstance(value, float) and numpy.isfinite(value) and value == int(value):
+        return (value, None)
+    return (numpy.nan, NON_INTEGER)
+
+#Applies parse_value to every cell of an object array in one pass
+parse_values = numpy.frompyfunc(parse_value, 1, 2)
+
+class InputValidation(object):
+    """Validates an alternatives x criteria grid of input values (an
+    in_matrix, see Evamix.do_analysis) in one pass, and reports every error
+    rather than stopping at the first.
+
+    Every cell is parsed once into a float array, giving the missing and
+    non-integer cells.  The ordinal/binary codes of each qualitative
+    criterion are then checked against its options, and the criteria with
+    the same value for all alternatives found, with whole column array
+    operations.  A criterion with a missing or invalid value is not checked
+    for being the same for all alternatives.
+    """
+
+    def __init__(self, crit_types, crit_options=None):
+        """crit_types - type of each criterion, Ratio, Ordinal or Binary
+        crit_options - list with the valid codes of each qualitative
+        criterion (None for the others), codes are not checked if not given
+        """
+        self.crit_types = crit_types
+        self.crit_options = crit_options
+        self.quant_cols = [j for j in range(len(crit_types)) if crit_types[j] == "Ratio"]
+        self.qual_cols = [j for j in range(len(crit_types)) if crit_types[j] == "Ordinal" or crit_types[j] == "Binary"]
+        self.errors = None
+
+    def validate(self, in_matrix, input_required=True, check_same=True):
+        """Returns list of every error in in_matrix, each a tuple
+        (error_type, altern, crit, value) where altern or crit is None for
+        errors of a whole criterion or of the whole grid
+
+        input_required - report missing values
+        check_same - report criteria with the same value for all alternatives
+        """
+        grid = numpy.empty((len(in_matrix), len(self.crit_types)), dtype=object)
+        grid[:] = in_matrix
+        (numbers, error_types) = parse_values(grid)
+        numbers = numbers.astype(float)
+        missing = numpy.equal(error_types, MISSING)
+        non_integer = numpy.equal(error_types, NON_INTEGER)
+        bad_option = numpy.zeros(grid.shape, dtype=bool)
+        if self.crit_options:
+            for j in self.qual_cols:
+                if self.crit_options[j] is not None:
+                    bad_option[:, j] = ~numpy.in1d(numbers[:, j], self.crit_options[j]) & ~missing[:, j] & ~non_integer[:, j]
+
+        flagged = non_integer | bad_option
+        if input_required:
+            flagged = flagged | missing
+        #Errors in order criterion by criterion, as rows of the input table
+        (crits, alterns) = numpy.nonzero(flagged.T)
+        self.errors = []
+        for (i, j) in zip(alterns.tolist(), crits.tolist()):
+            if non_integer[i, j]:
+                self.errors.append((NON_INTEGER, i, j, grid[i, j]))
+            elif bad_option[i, j]:
+                self.errors.append((BAD_OPTION, i, j, grid[i, j]))
+            else:
+                self.errors.append((MISSING, i, j, None))
+
+        if check_same and len(grid) > 0:
+            complete = ~(missing | flagged).any(axis=0)
+            same = complete & (numbers == numbers[0]).all(axis=0)
+            qual_cols = self.qual_cols
+            if not complete[qual_cols].all():
+                qual_cols = []
+            self.errors.extend(find_same_values(same, self.quant_cols, qual_cols))
+        return self.errors
+
+    def get_errors(self):
+        return self.errors
+
+    def get_messages(self, crit_names=None, altern_names=None, templates=None):
+        """Returns list with the message of each error, see gen_error_message"""
+        return [gen_error_message(error, crit_names, altern_names, templates) for error in self.errors]
+
+    def check(self, in_matrix, input_required=True, check_same=True, crit_names=None, altern_names=None):
+        """Validates in_matrix, raises InputError with the messages of all errors found"""
+        if self.validate(in_matrix, input_required, check_same):
+            raise InputError, "\n".join(self.get_messages(crit_names, altern_names))
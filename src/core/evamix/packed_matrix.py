@@ -0,0 +1,328 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - packed storage for the antisymmetric Evamix impact and final matrices
+#===============================================================================
+
+import os
+import numpy
+
+#Maximum number of pairs handled at once when walking a packed matrix
+pair_tile_cells = 2**20
+
+def get_num_pairs(dim):
+    """Number of cells above the diagonal of a dim x dim matrix"""
+    return dim*(dim-1)/2
+
+def get_row_offset(dim, row):
+    """Index into the packed values of the first cell (row, row+1) of a row"""
+    return row*(2*dim-row-1)/2
+
+def gen_row_ranges(dim, tile_cells=None):
+    """Yields (first_row, end_row) ranges of whole rows covering the cells above
+    the diagonal of a dim x dim matrix, each holding at most tile_cells cells
+    (unless a single row is longer)
+    """
+    if tile_cells is None:
+        tile_cells = pair_tile_cells
+    row = 0
+    while row < dim-1:
+        end_row = row+1
+        count = dim-1-row
+        while end_row < dim-1 and count+(dim-1-end_row) <= tile_cells:
+            count += dim-1-end_row
+            end_row += 1
+        yield (row, end_row)
+        row = end_row
+
+def get_pair_indices(dim, first_row, end_row):
+    """Returns (start, end, rows, cols) for the cells above the diagonal in rows
+    first_row to end_row-1.  values[start:end] of a packed matrix are the
+    cells at rows[x], cols[x]
+    """
+    row_range = numpy.arange(first_row, end_row)
+    counts = dim-1-row_range
+    rows = numpy.repeat(row_range, counts)
+    row_starts = numpy.cumsum(counts)-counts
+    count = int(counts.sum())
+    cols = numpy.arange(count)-numpy.repeat(row_starts, counts)+rows+1
+    start = get_row_offset(dim, first_row)
+    return (start, start+count, rows, cols)
+
+def gen_pair_tiles(dim, tile_cells=None):
+    """Yields (start, end, rows, cols) covering the cells above the diagonal
+    of a dim x dim matrix in packed (row major) order, see gen_row_ranges and
+    get_pair_indices
+    """
+    for (first_row, end_row) in gen_row_ranges(dim, tile_cells):
+        yield get_pair_indices(dim, first_row, end_row)
+
+class PackedAntisymmetricMatrix(object):
+    """An antisymmetric (M[i][j] == -M[j][i]) matrix with a zero diagonal,
+    stored as the cells above the diagonal in row major order.
+
+    Takes less than half the memory of the full matrix (a quarter when stored
+    as float32) and can be used where the Evamix matrices are read as lists:
+    len(m), m[i][j] and m.tolist() work as for the full matrix.  m[i] builds
+    a whole row, so cells are read with m[i, j] (or m.get(i, j)) instead.
+
+    Whoever fills the values may record their absolute and row sums with
+    set_sums (the TiledExecutor sums each tile as it is written) so that they
+    are not summed again.
+    """
+    #Sums recorded by set_sums, None when they must be computed
+    known_abs_sum = None
+    known_row_sums = None
+
+    def __init__(self, dim, values=None, dtype=numpy.float64):
+        self.dim = dim
+        if values is None:
+            values = numpy.zeros(get_num_pairs(dim), dtype=dtype)
+        self.values = numpy.asarray(values, dtype=dtype)
+        if len(self.values) != get_num_pairs(dim):
+            raise ValueError, "Expected "+str(get_num_pairs(dim))+" values for packed matrix of dimension "+str(dim)
+
+    def get_shape(self):
+        return (self.dim, self.dim)
+    shape = property(get_shape)
+
+    def get_dtype(self):
+        return self.values.dtype
+    dtype = property(get_dtype)
+
+    def __len__(self):
+        return self.dim
+
+    def __getitem__(self, index):
+        """m[i, j] is a single cell, m[i] a full row (see get_row)"""
+        if isinstance(index, tuple):
+            return self.get(*index)
+        return self.get_row(index)
+
+    def get(self, row, col):
+        """Returns a single cell, O(1)"""
+        if row < 0:
+            row += self.dim
+        if col < 0:
+            col += self.dim
+        if row == col:
+            return 0.0
+        if row < col:
+            return float(self.values[get_row_offset(self.dim, row)+col-row-1])
+        return -float(self.values[get_row_offset(self.dim, col)+row-col-1])
+
+    def get_row(self, row):
+        """Returns a full row as a float array"""
+        dim = self.dim
+        if row < 0:
+            row += dim
+        full_row = numpy.zeros(dim)
+        start = get_row_offset(dim, row)
+        full_row[row+1:] = self.values[start:start+dim-1-row]
+        above = numpy.arange(row)
+        full_row[:row] = -self.values[above*(2*dim-above-1)/2+row-above-1]
+        return full_row
+
+    def get_col(self, col):
+        """Returns a full column as a float array"""
+        return -self.get_row(col)
+
+    def to_dense(self):
+        """Returns the full matrix as an n x n float array"""
+        dense = numpy.zeros((self.dim, self.dim))
+        for (start, end, rows, cols) in gen_pair_tiles(self.dim):
+            dense[rows, cols] = self.values[start:end]
+            dense[cols, rows] = -self.values[start:end]
+        return dense
+
+    def tolist(self):
+        return self.to_dense().tolist()
+
+    def astype(self, dtype):
+        return PackedAntisymmetricMatrix(self.dim, self.values.astype(dtype), dtype)
+
+    def set_sums(self, abs_sum, row_sums):
+        """Records the absolute sum and row sums of the values as they were
+        written, returned by absolute_sum and row_sums from then on.  None
+        leaves a sum to be computed
+        """
+        self.known_abs_sum = abs_sum
+        self.known_row_sums = row_sums
+
+    def row_sums(self):
+        """Sum of each row, the Evamix score of each alternative for the final matrix"""
+        if self.known_row_sums is not None:
+            return numpy.array(self.known_row_sums, dtype=numpy.float64)
+        sums = numpy.zeros(self.dim)
+        for (start, end, rows, cols) in gen_pair_tiles(self.dim):
+            vals = self.values[start:end].astype(numpy.float64)
+            sums += numpy.bincount(rows, vals, self.dim) - numpy.bincount(cols, vals, self.dim)
+        return sums
+
+    def sum(self, axis=None):
+        if axis == 1:
+            return self.row_sums()
+        if axis == 0:
+            return -self.row_sums()
+        return 0.0
+
+    def absolute_sum(self):
+        """Sum of the absolute value of every cell, twice that of the stored
+        half.  Summed a block at a time so no copy of the values is made
+        """
+        if self.known_abs_sum is not None:
+            return self.known_abs_sum
+        abs_sum = 0.0
+        for start in range(0, len(self.values), pair_tile_cells):
+            abs_sum += float(numpy.abs(self.values[start:start+pair_tile_cells]).sum(dtype=numpy.float64))
+        return 2.0 * abs_sum
+
+    def get_memory_size(self):
+        """Bytes of memory held by the values"""
+        return int(self.values.nbytes)
+
+    def __neg__(self):
+        return PackedAntisymmetricMatrix(self.dim, -self.values, self.values.dtype)
+
+    def __mul__(self, factor):
+        return PackedAntisymmetricMatrix(self.dim, self.values*factor, self.values.dtype)
+    __rmul__ = __mul__
+
+    def __div__(self, divisor):
+        return PackedAntisymmetricMatrix(self.dim, self.values/divisor, self.values.dtype)
+    __truediv__ = __div__
+
+    def __add__(self, other):
+        if isinstance(other, PackedAntisymmetricMatrix):
+            if other.dim != self.dim:
+                raise ValueError, "Packed matrices are not the same dimensions"
+            other = other.values
+        return PackedAntisymmetricMatrix(self.dim, self.values+other, self.values.dtype)
+    __radd__ = __add__
+
+class MappedPackedMatrix(PackedAntisymmetricMatrix):
+    """A PackedAntisymmetricMatrix whose values are kept in a memory mapped
+    file so that matrices too large for memory can be built tile by tile
+    and read back a row at a time.
+
+    Pickles as a reference to its file, not its values.  The file is opened
+    when the values are first accessed.
+    """
+    def __init__(self, dim, filename, dtype=numpy.float64, mode='r'):
+        """mode - numpy.memmap mode, 'w+' creates (or overwrites) the file"""
+        self.dim = dim
+        self.filename = filename
+        self.mode = mode
+        self.value_type = numpy.dtype(dtype)
+        self.mapped_values = None
+        if mode == 'w+':
+            self.get_values()
+            self.mode = 'r+'
+
+    def get_values(self):
+        if self.mapped_values is None:
+            num_pairs = get_num_pairs(self.dim)
+            values = numpy.memmap(self.filename, dtype=self.value_type, mode=self.mode, shape=(max(1, num_pairs),))
+            self.mapped_values = values[:num_pairs]
+        return self.mapped_values
+
+    def set_values(self, values):
+        self.get_values()[:] = values
+        self.set_sums(None, None)
+    values = property(get_values, set_values)
+
+    def get_dtype(self):
+        return self.value_type
+    dtype = property(get_dtype)
+
+    def get_memory_size(self):
+        """Values are held in the file, not in memory"""
+        return 0
+
+    def flush(self):
+        """Writes changed values out to the file"""
+        if self.mapped_values is not None and self.mode != 'r':
+            self.mapped_values.flush()
+
+    def close(self):
+        """Releases the mapping, it is reopened on next access"""
+        self.flush()
+        self.mapped_values = None
+
+    def remove(self):
+        """Deletes the file holding the values"""
+        self.mapped_values = None
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def __getstate__(self):
+        self.flush()
+        return {'dim':self.dim, 'filename':self.filename, 'value_type':self.value_type.str}
+
+    def __setstate__(self, state):
+        self.dim = state['dim']
+        self.filename = state['filename']
+        self.value_type = numpy.dtype(state['value_type'])
+        self.mode = 'r'
+        self.mapped_values = None
+
+def pack_matrix(matrix, dtype=numpy.float64):
+    """Returns a PackedAntisymmetricMatrix of the given dtype for an
+    antisymmetric matrix given as a list of lists, array or packed matrix.
+    Memory mapped matrices are returned as they are
+    """
+    if isinstance(matrix, MappedPackedMatrix):
+        return matrix
+    if isinstance(matrix, PackedAntisymmetricMatrix):
+        return matrix.astype(dtype)
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    dim = matrix.shape[0]
+    values = numpy.zeros(get_num_pairs(dim), dtype=dtype)
+    for (start, end, rows, cols) in gen_pair_tiles(dim):
+        values[start:end] = matrix[rows, cols]
+    return PackedAntisymmetricMatrix(dim, values, dtype)
+
+def get_matrix_data(matrix):
+    """Returns a packed matrix as plain data for storing, a dict with its dim,
+    dtype and either its packed values as a string or the name of the file
+    holding them.  Stored runs so do not depend on these classes, see
+    load_matrix_data
+    """
+    data = {'dim':int(matrix.dim), 'dtype':matrix.dtype.str}
+    if isinstance(matrix, MappedPackedMatrix):
+        matrix.flush()
+        data['filename'] = matrix.filename
+    else:
+        data['values'] = matrix.values.tostring()
+    return data
+
+def load_matrix_data(data):
+    """Rebuilds the packed matrix stored by get_matrix_data"""
+    if 'filename' in data:
+        return MappedPackedMatrix(data['dim'], data['filename'], data['dtype'])
+    return PackedAntisymmetricMatrix(data['dim'], numpy.fromstring(data['values'], dtype=data['dtype']), data['dtype'])
+
+def get_matrix_value(matrix, row, col):
+    """Returns a cell of a list of lists or packed matrix"""
+    if isinstance(matrix, PackedAntisymmetricMatrix):
+        return matrix.get(row, col)
+    return matrix[row][col]
+
+def get_matrix_column(matrix, col):
+    """Returns a column of a list of lists or packed matrix as a list"""
+    if isinstance(matrix, PackedAntisymmetricMatrix):
+        return matrix.get_col(col).tolist()
+    return [row[col] for row in matrix]
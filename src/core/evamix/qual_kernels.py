@@ -0,0 +1,169 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - Evamix qualitative impact kernels specialized for Binary and
+# Ordinal criteria
+#===============================================================================
+
+import numpy
+
+from packed_matrix import gen_pair_tiles
+
+class QualKernels(object):
+    """Qualitative impact computations specialized for the few levels taken by
+    qualitative criteria.
+
+    The kernel of each criterion is chosen by its type tag in the
+    EvamixInput.  Binary criteria are held as 0/1 bits.  For these
+    sign(x_i-x_j) equals b_i-b_j so their weighted sum over criteria is
+    B_i-B_j where B is the weighted bit sum of each alternative, one
+    subtraction per pair however many there are.  A Binary criterion whose
+    input holds more than two values is not binary, so it is ranked.
+
+    Ordinal criteria are held as small integer level ranks with the number
+    of alternatives at each level (both cached by the EvamixInput), however
+    many levels their input happens to use.  Their row sums (alternatives beaten
+    less alternatives lost to) come from cumulative level counts in time
+    proportional to n plus the number of levels.
+
+    The absolute sum of the qualitative impact matrix does not split by
+    criterion so it is computed pair-wise, but over the distinct qualitative
+    profiles (alternatives with identical qualitative values) weighted by the
+    number of alternatives sharing them.  When every criterion is Binary it
+    is found from the sorted bit sums instead.
+    """
+
+    def __init__(self, evamix_input, tile_cells=2**20):
+        """evamix_input - EvamixInput of the values, its qualitative columns
+        are used with their cached levels and level counts
+        tile_cells - maximum number of pair values computed at once
+        """
+        self.dim = evamix_input.num_alternatives
+        self.crit_types = list(evamix_input.crit_types)
+        self.qual_cols = list(evamix_input.qual_cols)
+        self.tile_cells = tile_cells
+        self.binary_cols = []
+        self.ordinal_cols = []
+        bits = []
+        ranks = []
+        self.level_counts = []
+        for col in self.qual_cols:
+            (levels, counts) = evamix_input.get_levels(col)
+            level_ranks = evamix_input.get_level_ranks(col)
+            if col in evamix_input.binary_cols and len(levels) <= 2:
+                self.binary_cols.append(col)
+                bits.append(level_ranks.astype(numpy.uint8))
+            else:
+                self.ordinal_cols.append(col)
+                ranks.append(level_ranks)
+                self.level_counts.append(counts)
+
+        self.bits = numpy.zeros((self.dim, len(bits)), dtype=numpy.uint8)
+        for b in range(len(bits)):
+            self.bits[:, b] = bits[b]
+        max_levels = max([len(counts) for counts in self.level_counts] + [0])
+        if max_levels < 128:
+            rank_type = numpy.int8
+        else:
+            rank_type = numpy.int32
+        self.ranks = numpy.zeros((self.dim, len(ranks)), dtype=rank_type)
+        for r in range(len(ranks)):
+            self.ranks[:, r] = ranks[r]
+
+        self.profiles = None
+        self.profile_counts = None
+
+    def bit_sums(self, weight_array):
+        """Returns n x m weighted bit sums for an m x k array of weights"""
+        return numpy.dot(self.bits, weight_array[:, self.binary_cols].T)
+
+    def crit_row_sums(self):
+        """Returns an n x len(qual_cols) array of unweighted qualitative row sums,
+        the number of alternatives beaten less the number lost to per criterion
+        """
+        dim = self.dim
+        crit_row_sums = numpy.zeros((dim, len(self.qual_cols)))
+        for b in range(len(self.binary_cols)):
+            bits = self.bits[:, b].astype(float)
+            crit_row_sums[:, self.qual_cols.index(self.binary_cols[b])] = bits*dim - bits.sum()
+        for r in range(len(self.ordinal_cols)):
+            counts = self.level_counts[r]
+            below = numpy.cumsum(counts) - counts
+            above = dim - numpy.cumsum(counts)
+            level_sums = below - above
+            crit_row_sums[:, self.qual_cols.index(self.ordinal_cols[r])] = level_sums[self.ranks[:, r]]
+        return crit_row_sums
+
+    def row_sums(self, weights):
+        """Row sums of the qualitative impact matrix for a vector of k weights"""
+        return numpy.dot(self.crit_row_sums(), weights[self.qual_cols])
+
+    def gen_impact(self, weights, left, right):
+        """Returns the qualitative impact of alternatives left over right,
+        index arrays broadcast against each other (eg. a column of rows and
+        a row of all alternatives for a block of full matrix rows, or the
+        row and column indices of a packed pair tile)
+        """
+        bit_sums = self.bit_sums(weights[numpy.newaxis, :])[:, 0]
+        impact = bit_sums[left] - bit_sums[right]
+        for r in range(len(self.ordinal_cols)):
+            col_ranks = self.ranks[:, r]
+            impact = impact + weights[self.ordinal_cols[r]] * numpy.sign(col_ranks[left] - col_ranks[right])
+        return impact
+
+    def get_profiles(self):
+        """Returns (profiles, counts), the index of one alternative holding each
+        distinct qualitative profile and the number of alternatives holding it
+        """
+        if self.profiles is None:
+            values = numpy.concatenate((self.bits.astype(numpy.int32), self.ranks.astype(numpy.int32)), axis=1)
+            order = numpy.lexsort(values.T[::-1])
+            sorted_values = values[order]
+            changed = (sorted_values[1:] != sorted_values[:-1]).any(axis=1)
+            starts = numpy.concatenate(([0], numpy.flatnonzero(changed)+1))
+            self.profiles = order[starts]
+            self.profile_counts = numpy.diff(numpy.concatenate((starts, [self.dim])))
+        return (self.profiles, self.profile_counts)
+
+    def absolute_sum(self, weights):
+        """Absolute sum of the qualitative impact matrix for a vector of k weights"""
+        return float(self.batch_absolute_sums(weights[numpy.newaxis, :])[0])
+
+    def batch_absolute_sums(self, weight_array):
+        """Returns the qualitative absolute sum for each row of an m x k array of weights"""
+        num_sets = weight_array.shape[0]
+        bit_sums = self.bit_sums(weight_array)
+        if not self.ordinal_cols:
+            #Impact is bit_sums[i]-bit_sums[j], sum |.| from the sorted sums
+            abs_sums = numpy.zeros(num_sets)
+            factors = 2.0*numpy.arange(self.dim) - self.dim + 1
+            for m in range(num_sets):
+                abs_sums[m] = 2.0 * numpy.dot(numpy.sort(bit_sums[:, m]), factors)
+            return abs_sums
+
+        (profiles, counts) = self.get_profiles()
+        num_profiles = len(profiles)
+        bit_sums = bit_sums[profiles]
+        ranks = self.ranks[profiles]
+        ranked_weights = weight_array[:, self.ordinal_cols]
+        abs_sums = numpy.zeros(num_sets)
+        tile_cells = max(1, self.tile_cells / max(len(self.ordinal_cols), num_sets))
+        for (start, end, rows, cols) in gen_pair_tiles(num_profiles, tile_cells):
+            signs = numpy.sign(ranks[rows] - ranks[cols])
+            impact = bit_sums[rows] - bit_sums[cols] + numpy.dot(signs, ranked_weights.T)
+            abs_sums += numpy.dot(counts[rows]*counts[cols].astype(float), numpy.abs(impact))
+        #Each pair of profiles appears twice in the full matrix
+        return 2.0 * abs_sums
@@ -0,0 +1,170 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - Monte Carlo rank acceptability (stochastic sensitivity) analysis
+# built on the Evamix algorithm
+#===============================================================================
+
+import multiprocessing
+import numpy
+
+from delphos_exceptions import *
+from array_evamix import ArrayEvamix
+from evamix_input import EvamixInput
+
+def run_sample_batch(batch_args):
+    """Scores one batch of random samples, returns an n x n array counting how
+    many samples placed alternative i at rank r (0 is the best rank).
+
+    Module level so that it can be sent to a process pool.  All randomness
+    comes from the batch seed so a batch gives the same counts whichever
+    worker runs it.
+    """
+    (raw_array, crit_weights, crit_types, crit_bc, num_samples, seed, weight_spread, input_spread, tile_cells) = batch_args
+    evamix = ArrayEvamix(tile_cells)
+    rand = numpy.random.RandomState(seed)
+    (quant_cols, qual_cols) = evamix.gen_crit_type_lists(crit_types)
+    evamix.num_criteria = len(crit_types)
+    dim = raw_array.shape[0]
+
+    weights = numpy.array(crit_weights, dtype=float)
+    weight_sets = weights * (1.0 + rand.uniform(-weight_spread, weight_spread, (num_samples, len(weights))))
+    weight_array = evamix.gen_std_weight_array(weight_sets.tolist())
+    #Only ratio values are perturbed, the qualitative kernels are shared by all samples
+    kernels = None
+    if qual_cols:
+        kernels = evamix.gen_qual_kernels(EvamixInput(raw_array, crit_types))
+
+    if input_spread and quant_cols:
+        scores = numpy.zeros((num_samples, dim))
+        for m in range(num_samples):
+            in_array = raw_array.copy()
+            in_array[:, quant_cols] *= 1.0 + rand.uniform(-input_spread, input_spread, (dim, len(quant_cols)))
+            in_array = evamix.flip_cost_ratio_criteria_values(in_array, quant_cols, crit_bc)
+            in_array = evamix.standardize_quantitative_values(in_array, quant_cols)
+            scores[m] = evamix.gen_batch_scores(in_array, weight_array[m:m+1], quant_cols, qual_cols, kernels)[0]
+    else:
+        in_array = evamix.flip_cost_ratio_criteria_values(raw_array, quant_cols, crit_bc)
+        in_array = evamix.standardize_quantitative_values(in_array, quant_cols)
+        scores = evamix.gen_batch_scores(in_array, weight_array, quant_cols, qual_cols, kernels)
+
+    rank_counts = numpy.zeros((dim, dim), dtype=int)
+    ranks = numpy.arange(dim)
+    #Highest score first, ties keep alternative order
+    order = numpy.argsort(-scores, axis=1, kind='mergesort')
+    for m in range(num_samples):
+        rank_counts[order[m], ranks] += 1
+    return rank_counts
+
+class RankAcceptability(object):
+    """Monte Carlo rank acceptability analysis.
+
+    Samples criteria weights around the weights given by the user (and
+    optionally perturbs the ratio input values), scores each sample with
+    Evamix and counts how often each alternative holds each rank.  Samples
+    are drawn in rounds of batches which are run on a process pool.  Each
+    batch has its own seed derived from the analysis seed so results are
+    reproducible and do not depend on the number of worker processes.
+
+    Sampling stops once the rank probabilities change by less than tolerance
+    between rounds (after at least min_samples) or max_samples is reached.
+    """
+
+    def __init__(self, seed=0, weight_spread=0.25, input_spread=0.0, batch_size=250, batches_per_round=4,
+                 min_samples=1000, max_samples=20000, tolerance=0.005, num_workers=None, tile_cells=2**20):
+        """weight_spread - each weight is multiplied by a uniform random factor in [1-spread, 1+spread]
+        input_spread - same for each ratio input value, 0 leaves input untouched
+        num_workers - size of process pool, defaults to number of CPUs.  0 or 1 runs in this process
+        """
+        self.seed = seed
+        self.weight_spread = weight_spread
+        self.input_spread = input_spread
+        self.batch_size = batch_size
+        self.batches_per_round = batches_per_round
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.tolerance = tolerance
+        self.num_workers = num_workers
+        self.tile_cells = tile_cells
+
+        self.rank_counts = None
+        self.num_samples = 0
+        self.converged = False
+
+    def do_analysis(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Runs the analysis, returns the rank probability list (see get_rank_probabilities)
+
+        crit_weights - weights as input by the user (eg. InputWeightSet.get_weights()), not modified
+        """
+        #Validate with the same checks as a single analysis
+        ArrayEvamix(self.tile_cells).prepare_input(in_matrix, list(crit_weights), crit_types, crit_bc)
+        raw_array = numpy.array(in_matrix, dtype=float)
+        dim = raw_array.shape[0]
+
+        self.rank_counts = numpy.zeros((dim, dim), dtype=int)
+        self.num_samples = 0
+        self.converged = False
+        prev_probs = None
+        batch_num = 0
+
+        pool = None
+        if self.num_workers is None or self.num_workers > 1:
+            pool = multiprocessing.Pool(self.num_workers)
+        try:
+            while self.num_samples < self.max_samples:
+                batch_args = []
+                round_samples = 0
+                for b in range(self.batches_per_round):
+                    num_samples = min(self.batch_size, self.max_samples - self.num_samples - round_samples)
+                    if num_samples <= 0:
+                        break
+                    batch_args.append((raw_array, list(crit_weights), crit_types, crit_bc, num_samples,
+                                       self.seed*1000003 + batch_num, self.weight_spread, self.input_spread, self.tile_cells))
+                    round_samples += num_samples
+                    batch_num += 1
+
+                if pool:
+                    batch_counts = pool.map(run_sample_batch, batch_args)
+                else:
+                    batch_counts = map(run_sample_batch, batch_args)
+                for counts in batch_counts:
+                    self.rank_counts += counts
+                self.num_samples += round_samples
+
+                probs = self.rank_counts / float(self.num_samples)
+                if prev_probs is not None and self.num_samples >= self.min_samples:
+                    if numpy.abs(probs - prev_probs).max() < self.tolerance:
+                        self.converged = True
+                        break
+                prev_probs = probs
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        return self.get_rank_probabilities()
+
+    def get_rank_probabilities(self):
+        """Returns list where item [i][r] is the probability alternative i holds rank r (0 is best)"""
+        if self.rank_counts is None or not self.num_samples:
+            return None
+        return (self.rank_counts / float(self.num_samples)).tolist()
+
+    def get_first_rank_probabilities(self):
+        """Returns list with the probability of each alternative being ranked first"""
+        if self.rank_counts is None or not self.num_samples:
+            return None
+        return (self.rank_counts[:, 0] / float(self.num_samples)).tolist()
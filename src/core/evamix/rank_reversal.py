@@ -0,0 +1,247 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - leave-one-alternative-out rank reversal analysis
+#===============================================================================
+
+import numpy
+
+from delphos_exceptions import *
+from array_evamix import ArrayEvamix
+
+class RankReversal(object):
+    """Leave-one-alternative-out rank reversal analysis.
+
+    Evamix scores are relative to the other alternatives: the ratio values
+    are standardized by the column minimum and maximum and every impact
+    matrix is divided by its absolute sum.  Removing one alternative can so
+    reorder the others.  For each alternative this finds the ranking of the
+    rest without it, and flags every pair of alternatives whose order is
+    reversed.
+
+    Each removal is a downdate of statistics computed once rather than a new
+    analysis, O(n*k) per removal (plus sorting n values):
+        ratio columns - the minimum and maximum only change when the removed
+            alternative holds them alone, then the next value is used and the
+            standardized column is rescaled.  The weighted sums s (the
+            quantitative impact of i over j is s[i]-s[j]) are corrected for
+            the rescaled columns only
+        qualitative - the row sums lose the impact over the removed
+            alternative and the absolute sum twice its absolute row sum
+
+    A removal which leaves a ratio column (or all of the qualitative
+    columns) with a single value, or fewer than two alternatives, can not be
+    analysed and is listed by get_skipped.
+    """
+
+    def __init__(self, score_tolerance=1e-12, tile_cells=2**20):
+        """score_tolerance - score differences smaller than this (relative to
+        the largest score) are ties, which are not reversals
+        """
+        self.score_tolerance = score_tolerance
+        self.tile_cells = tile_cells
+
+        self.full_scores = None
+        self.scores = None
+        self.reversals = None
+        self.skipped = None
+
+    def do_analysis(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Runs the analysis, returns the reversal list (see get_reversals)
+
+        crit_weights - weights as input by the user (eg. InputWeightSet.get_weights()), not modified
+        """
+        evamix = ArrayEvamix(self.tile_cells)
+        (in_array, weights, quant_cols, qual_cols) = evamix.prepare_input(in_matrix, list(crit_weights), crit_types, crit_bc)
+        raw_array = numpy.array(in_matrix, dtype=float)
+        dim = raw_array.shape[0]
+        self.evamix = evamix
+        self.quant_cols = quant_cols
+        self.qual_cols = qual_cols
+        self.sum_quant_weights = weights[quant_cols].sum()
+        self.sum_qual_weights = weights[qual_cols].sum()
+
+        #Ratio column statistics
+        self.quant_weights = weights[quant_cols]
+        self.quant_values = in_array[:, quant_cols]
+        self.quant_raw = raw_array[:, quant_cols]
+        (self.min_vals, self.min_counts, self.next_min_vals) = self.gen_extremes(raw_array[:, quant_cols])
+        (max_vals, self.max_counts, next_max_vals) = self.gen_extremes(-raw_array[:, quant_cols])
+        (self.max_vals, self.next_max_vals) = (-max_vals, -next_max_vals)
+        self.alt_sums = numpy.dot(self.quant_values, self.quant_weights)
+
+        #Qualitative row sums and absolute sum, and which columns are left constant
+        self.qual_weights = weights[qual_cols]
+        self.qual_raw = raw_array[:, qual_cols]
+        self.qual_rows = numpy.zeros(dim)
+        self.qual_abs_sum = 0.0
+        if qual_cols:
+            kernels = evamix.gen_qual_kernels()
+            self.qual_rows = numpy.dot(kernels.crit_row_sums(), self.qual_weights)
+            self.qual_abs_sum = float(evamix.qual_batch_absolute_sums(kernels, in_array, weights[numpy.newaxis, :], qual_cols)[0])
+        (qual_min, qual_min_counts, qual_next_min) = self.gen_extremes(self.qual_raw)
+        (qual_max, qual_max_counts, qual_next_max) = self.gen_extremes(-self.qual_raw)
+        self.qual_spread = [qual_min, qual_min_counts, qual_next_min, -qual_max, qual_max_counts, -qual_next_max]
+
+        self.full_scores = self.gen_scores(None)
+        self.abs_tolerance = self.score_tolerance * max(1.0, float(numpy.abs(self.full_scores).max()))
+        self.scores = []
+        self.reversals = []
+        self.skipped = []
+        for removed in range(dim):
+            scores = None
+            if dim > 2:
+                scores = self.gen_scores(removed)
+            if scores is None:
+                self.skipped.append(removed)
+            else:
+                self.reversals.extend(self.find_reversals(removed, scores))
+            self.scores.append(scores)
+        return self.get_reversals()
+
+    def gen_extremes(self, columns):
+        """Returns the minimum of each column, how many times it occurs and
+        the smallest value above it (the minimum again if there is none)
+        """
+        if columns.shape[1] == 0:
+            empty = numpy.zeros(0)
+            return (empty, numpy.zeros(0, dtype=int), empty)
+        min_vals = columns.min(axis=0)
+        is_min = columns == min_vals
+        above = numpy.where(is_min, numpy.inf, columns)
+        next_vals = above.min(axis=0)
+        next_vals = numpy.where(numpy.isinf(next_vals), min_vals, next_vals)
+        return (min_vals, is_min.sum(axis=0), next_vals)
+
+    def get_removed_extremes(self, row, min_vals, min_counts, next_min_vals, max_vals, max_counts, next_max_vals):
+        """Column minimums and maximums once the alternative with values row is removed"""
+        new_min = numpy.where((row == min_vals) & (min_counts == 1), next_min_vals, min_vals)
+        new_max = numpy.where((row == max_vals) & (max_counts == 1), next_max_vals, max_vals)
+        return (new_min, new_max)
+
+    def gen_scores(self, removed):
+        """Returns the final scores of all alternatives with alternative
+        removed taken out (its own score left as nan), None if that input can
+        not be analysed.  removed None scores the full input
+        """
+        dim = len(self.alt_sums)
+        keep = numpy.ones(dim, dtype=bool)
+        scores = numpy.zeros(dim)
+        if removed is not None:
+            keep[removed] = False
+            scores[removed] = numpy.nan
+
+        if self.quant_cols:
+            alt_sums = self.alt_sums
+            if removed is not None:
+                (new_min, new_max) = self.get_removed_extremes(self.quant_raw[removed], self.min_vals, self.min_counts, self.next_min_vals,
+                                                               self.max_vals, self.max_counts, self.next_max_vals)
+                if (new_max == new_min).any():
+                    return None
+                #Standardized values of rescaled columns are a*z + b, b is the
+                #same for every alternative so it does not change the impacts
+                changed = numpy.nonzero((new_min != self.min_vals) | (new_max != self.max_vals))[0]
+                if len(changed):
+                    scale = (self.max_vals[changed] - self.min_vals[changed]) / (new_max[changed] - new_min[changed])
+                    alt_sums = alt_sums + numpy.dot(self.quant_values[:, changed], self.quant_weights[changed] * (scale - 1.0))
+                alt_sums = alt_sums[keep]
+            quant_abs_sum = self.evamix.quant_absolute_sum(alt_sums)
+            if quant_abs_sum == 0:
+                return None
+            scores[keep] += self.evamix.quant_row_sums(alt_sums) / quant_abs_sum * self.sum_quant_weights
+
+        if self.qual_cols:
+            qual_rows = self.qual_rows
+            qual_abs_sum = self.qual_abs_sum
+            if removed is not None:
+                (new_min, new_max) = self.get_removed_extremes(self.qual_raw[removed], *self.qual_spread)
+                if (new_max == new_min).all():
+                    return None
+                #Impact of each alternative over the one removed
+                removed_impact = numpy.dot(numpy.sign(self.qual_raw - self.qual_raw[removed]), self.qual_weights)
+                qual_rows = (qual_rows - removed_impact)[keep]
+                qual_abs_sum = qual_abs_sum - 2.0 * numpy.abs(removed_impact).sum()
+            if qual_abs_sum <= 0:
+                return None
+            scores[keep] += qual_rows / qual_abs_sum * self.sum_qual_weights
+        return scores
+
+    def find_reversals(self, removed, scores):
+        """Returns the (removed, first, second) reversals of a removal, where
+        first was ranked below second with all alternatives and above it
+        once removed is taken out
+        """
+        keep = numpy.arange(len(scores)) != removed
+        alterns = numpy.nonzero(keep)[0]
+        #Alternatives in their new order, each with its full score
+        new_order = alterns[numpy.argsort(-scores[alterns], kind='mergesort')]
+        full_ordered = self.full_scores[new_order]
+        #Reversed pairs lie between the first alternative with a better one
+        #after it and the last with a worse one before it
+        later_best = numpy.maximum.accumulate(full_ordered[::-1])[::-1]
+        earlier_worst = numpy.minimum.accumulate(full_ordered)
+        passed = numpy.nonzero(full_ordered[:-1] + self.abs_tolerance < later_best[1:])[0]
+        if not len(passed):
+            return []
+        overtaken = numpy.nonzero(full_ordered[1:] > earlier_worst[:-1] + self.abs_tolerance)[0] + 1
+        window = new_order[passed[0]:overtaken[-1]+1]
+        reversals = []
+        for p in range(len(window)):
+            first = window[p]
+            later = window[p+1:]
+            worse_before = self.full_scores[later] > self.full_scores[first] + self.abs_tolerance
+            better_now = scores[first] > scores[later] + self.abs_tolerance
+            for second in later[worse_before & better_now]:
+                reversals.append((removed, int(first), int(second)))
+        return reversals
+
+    def get_reversals(self):
+        """Returns list of (removed, first, second) alternative indices, one for
+        every pair whose order is reversed by a removal: first ranked below
+        second with all alternatives, above it once removed is taken out
+        """
+        return self.reversals
+
+    def get_scores(self):
+        """Returns list where item [r] is the list of final scores with
+        alternative r removed (nan for r itself), None if skipped
+        """
+        if self.scores is None:
+            return None
+        return [scores is not None and scores.tolist() or None for scores in self.scores]
+
+    def get_ranks(self):
+        """Returns list where item [r][i] is the rank of alternative i (0 is
+        best) with alternative r removed, None for r itself or if skipped
+        """
+        if self.scores is None:
+            return None
+        all_ranks = []
+        for r in range(len(self.scores)):
+            if self.scores[r] is None:
+                all_ranks.append(None)
+                continue
+            ranks = [None] * len(self.scores)
+            alterns = [i for i in range(len(self.scores)) if i != r]
+            order = numpy.argsort(-self.scores[r][alterns], kind='mergesort')
+            for rank in range(len(order)):
+                ranks[alterns[order[rank]]] = rank
+            all_ranks.append(ranks)
+        return all_ranks
+
+    def get_skipped(self):
+        """Returns list of the alternatives whose removal could not be analysed"""
+        return self.skipped
@@ -0,0 +1,160 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - evaluates a batch of data scenarios, overlays of input values,
+# in one pass with a regret summary across them
+#===============================================================================
+
+import numpy
+
+from delphos_exceptions import *
+from array_evamix import ArrayEvamix
+from input_validation import find_same_values, gen_error_message
+from evamix_input import EvamixInput
+
+class ScenarioBatch(object):
+    """Evamix analysis of the same alternatives and criteria under several
+    data scenarios.
+
+    Each scenario is an overlay of input values on a base input.  The
+    overlays are applied to a scenarios x alternatives x criteria array and
+    the ratio values of all scenarios are flipped, standardized and summed in
+    single array operations.  Qualitative row sums and absolute sums are
+    computed once from the base input and shared by every scenario which
+    does not change a qualitative value.
+
+    Summarizes the scenarios for each alternative by its worst and best
+    score and its regret, how far its score falls short of the best
+    alternative of a scenario, with the maximin and minimax regret choices.
+    """
+
+    def __init__(self, tile_cells=2**20):
+        self.tile_cells = tile_cells
+        self.scores = None
+
+    def do_analysis(self, in_matrix, overlays, crit_weights, crit_types, crit_bc, names=None):
+        """Runs the analysis, returns list with one list of final scores per scenario
+
+        overlays - one list of (row, col, value) per scenario, replacing in_matrix[row][col]
+        crit_weights - weights as input by the user (eg. InputWeightSet.get_weights()), not modified
+        names - scenario names, used in error messages
+        """
+        if not overlays:
+            raise DelphosError, "No scenarios given"
+        self.names = names or [str(s+1) for s in range(len(overlays))]
+        evamix = ArrayEvamix(self.tile_cells)
+        #Checks of the base input, weights are standardized once for all scenarios
+        evamix.check_weights(in_matrix, list(crit_weights), crit_types, crit_bc)
+        (quant_cols, qual_cols) = evamix.gen_crit_type_lists(crit_types)
+        weights = list(crit_weights)
+        evamix.standardize_weights(weights)
+        weights = numpy.array(weights, dtype=float)
+
+        base_array = numpy.array(in_matrix, dtype=float)
+        values = numpy.repeat(base_array[numpy.newaxis, :, :], len(overlays), axis=0)
+        qual_changed = numpy.zeros(len(overlays), dtype=bool)
+        is_qual = numpy.zeros(base_array.shape[1], dtype=bool)
+        is_qual[qual_cols] = True
+        for s in range(len(overlays)):
+            for (row, col, value) in overlays[s]:
+                values[s, row, col] = value
+                if is_qual[col] and value != base_array[row, col]:
+                    qual_changed[s] = True
+        self.check_scenarios(values, quant_cols, qual_cols)
+
+        num_scenarios = values.shape[0]
+        dim = values.shape[1]
+        self.scores = numpy.zeros((num_scenarios, dim))
+        if quant_cols:
+            self.scores += self.gen_quant_scores(values, weights, quant_cols, crit_bc)
+        if qual_cols:
+            base_rows = None
+            for s in range(num_scenarios):
+                if qual_changed[s]:
+                    self.scores[s] += self.gen_qual_scores(evamix, EvamixInput(values[s], crit_types), weights, qual_cols)
+                else:
+                    if base_rows is None:
+                        base_rows = self.gen_qual_scores(evamix, EvamixInput(base_array, crit_types), weights, qual_cols)
+                    self.scores[s] += base_rows
+        return self.scores.tolist()
+
+    def check_scenarios(self, values, quant_cols, qual_cols):
+        """Same checks as ArrayEvamix.check_same_values for every scenario,
+        raises DelphosError listing the errors of all scenarios"""
+        constant = (values == values[:, :1, :]).all(axis=1)
+        messages = []
+        for s in range(values.shape[0]):
+            for error in find_same_values(constant[s], quant_cols, qual_cols):
+                messages.append("Scenario "+unicode(self.names[s])+": "+gen_error_message(error))
+        if messages:
+            raise DelphosError, "\n".join(messages)
+
+    def gen_quant_scores(self, values, weights, quant_cols, crit_bc):
+        """Returns the scenarios x alternatives quantitative part of the final scores"""
+        cols = values[:, :, quant_cols]
+        cost = numpy.array([crit_bc[k] == 'C' for k in quant_cols], dtype=bool)
+        max_vals = cols.max(axis=1)[:, numpy.newaxis, :]
+        cols = numpy.where(cost, max_vals - cols, cols)
+        min_vals = cols.min(axis=1)[:, numpy.newaxis, :]
+        cols = (cols - min_vals) / (cols.max(axis=1)[:, numpy.newaxis, :] - min_vals)
+        #Weighted sums, the quantitative impact of i over j is s[i]-s[j]
+        alt_sums = numpy.dot(cols, weights[quant_cols])
+        dim = alt_sums.shape[1]
+        factors = 2.0*numpy.arange(dim) - dim + 1
+        abs_sums = 2.0 * numpy.dot(numpy.sort(alt_sums, axis=1), factors)
+        if (abs_sums == 0).any():
+            raise ZeroDivisionError, "float division"
+        row_sums = alt_sums*dim - alt_sums.sum(axis=1)[:, numpy.newaxis]
+        return row_sums / abs_sums[:, numpy.newaxis] * weights[quant_cols].sum()
+
+    def gen_qual_scores(self, evamix, evamix_input, weights, qual_cols):
+        """Returns the qualitative part of the final scores of one scenario,
+        given its values as an EvamixInput"""
+        kernels = evamix.gen_qual_kernels(evamix_input)
+        abs_sum = float(evamix.qual_batch_absolute_sums(kernels, evamix_input.get_array(), weights[numpy.newaxis, :], qual_cols)[0])
+        if abs_sum == 0:
+            raise ZeroDivisionError, "float division"
+        return kernels.row_sums(weights) / abs_sum * weights[qual_cols].sum()
+
+    def get_scores(self):
+        """Returns list where item [s][i] is the final score of alternative i in scenario s"""
+        if self.scores is None:
+            return None
+        return self.scores.tolist()
+
+    def get_regrets(self):
+        """Returns list where item [s][i] is the best score of scenario s less that of alternative i"""
+        if self.scores is None:
+            return None
+        return (self.scores.max(axis=1)[:, numpy.newaxis] - self.scores).tolist()
+
+    def get_summary(self):
+        """Returns list with one item per alternative:
+        [min_score, max_score, max_regret]
+        its worst and best score over the scenarios and its largest regret
+        """
+        if self.scores is None:
+            return None
+        regrets = numpy.array(self.get_regrets())
+        return numpy.array([self.scores.min(axis=0), self.scores.max(axis=0), regrets.max(axis=0)]).T.tolist()
+
+    def get_maximin(self):
+        """Returns the index of the alternative whose worst score is best"""
+        return int(numpy.argmax(self.scores.min(axis=0)))
+
+    def get_minimax_regret(self):
+        """Returns the index of the alternative whose largest regret is smallest"""
+        return int(numpy.argmin(numpy.array(self.get_regrets()).max(axis=0)))
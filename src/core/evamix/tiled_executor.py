@@ -0,0 +1,325 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - multi-process tiled execution of the Evamix pair-wise stages
+#===============================================================================
+
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import numpy
+
+from packed_matrix import *
+from qual_kernels import QualKernels
+from evamix_input import EvamixInput
+
+#Shared buffers and data of the worker process, set by init_worker
+worker_state = {}
+
+#Index of each matrix in the output buffers of an analysis
+QUANT_IMPACT = 0
+QUAL_IMPACT = 1
+FINAL = 2
+
+def to_shared(array, typecode='d'):
+    """Copies an array into a new shared memory buffer"""
+    array = numpy.ascontiguousarray(array).ravel()
+    shared = RawArray(typecode, max(1, len(array)))
+    from_shared(shared, typecode)[:len(array)] = array
+    return shared
+
+def from_shared(shared, typecode='d'):
+    """Returns a numpy view of a shared memory buffer"""
+    if typecode == 'f':
+        return numpy.frombuffer(shared, dtype=numpy.float32)
+    return numpy.frombuffer(shared, dtype=numpy.float64)
+
+def attach_buffer(buf, typecode='d'):
+    """Returns a numpy view of an output buffer, a shared memory buffer or the
+    name of a memory mapped matrix file (see MappedPackedMatrix)
+    """
+    if isinstance(buf, basestring):
+        if typecode == 'f':
+            return numpy.memmap(buf, dtype=numpy.float32, mode='r+')
+        return numpy.memmap(buf, dtype=numpy.float64, mode='r+')
+    return from_shared(buf, typecode)
+
+def init_worker(shared_input, shape, weights, quant_cols, qual_types, out_buffers, typecode):
+    """Pool initializer, attaches a worker to the shared input and output buffers.
+    Also run in the calling process when no pool is used
+
+    quant_cols - quantitative columns of the input, empty if their impact is not needed
+    qual_types - criteria types of the input columns to build the qualitative
+    kernels from, empty if they are not needed
+    out_buffers - [quant_impact, qual_impact, final] output buffers
+    """
+    in_array = from_shared(shared_input)[:shape[0]*shape[1]].reshape(shape)
+    worker_state.clear()
+    worker_state['dim'] = shape[0]
+    worker_state['in_array'] = in_array
+    worker_state['weights'] = weights
+    worker_state['out'] = [attach_buffer(buf, typecode) for buf in out_buffers]
+    if quant_cols:
+        worker_state['alt_sums'] = numpy.dot(in_array[:, quant_cols], weights[quant_cols])
+    if qual_types:
+        worker_state['kernels'] = QualKernels(EvamixInput(in_array, qual_types))
+
+def gen_tile_sums(dim, values, first_row, end_row, rows, cols):
+    """Returns (row_abs, row_sums) for the packed cells of a range of rows, the
+    absolute sum of the cells of each row of the range and the contribution
+    of the cells to the row sums of the full matrix
+    """
+    values = values.astype(numpy.float64)
+    row_starts = get_row_offset(dim, numpy.arange(first_row, end_row)) - get_row_offset(dim, first_row)
+    row_abs = numpy.add.reduceat(numpy.abs(values), row_starts)
+    row_sums = numpy.bincount(rows, values, dim) - numpy.bincount(cols, values, dim)
+    return (row_abs, row_sums)
+
+def run_impact_tile(tile_args):
+    """Computes the packed impact cells of a range of rows into the shared
+    quantitative (QUANT_IMPACT) or qualitative (QUAL_IMPACT) output buffer.
+    Returns (first_row, end_row, row_abs, row_sums) of the cells as stored,
+    see gen_tile_sums
+    """
+    (out_index, first_row, end_row) = tile_args
+    dim = worker_state['dim']
+    (start, end, rows, cols) = get_pair_indices(dim, first_row, end_row)
+    impact_out = worker_state['out'][out_index]
+    if out_index == QUANT_IMPACT:
+        alt_sums = worker_state['alt_sums']
+        impact_out[start:end] = alt_sums[rows] - alt_sums[cols]
+    else:
+        impact_out[start:end] = worker_state['kernels'].gen_impact(worker_state['weights'], rows, cols)
+    return (first_row, end_row) + gen_tile_sums(dim, impact_out[start:end], first_row, end_row, rows, cols)
+
+def run_final_tile(tile_args):
+    """Combines the impact cells of a range of rows into the final matrix cells,
+    quant/quant_abs_sum*sum_quant_weights + qual/qual_abs_sum*sum_qual_weights
+    as in ArrayEvamix.  A None absolute sum leaves that matrix out.
+    Returns (first_row, end_row, row_abs, row_sums) of the final cells as
+    stored, see gen_tile_sums
+    """
+    (first_row, end_row, quant_abs_sum, sum_quant_weights, qual_abs_sum, sum_qual_weights) = tile_args
+    dim = worker_state['dim']
+    (start, end, rows, cols) = get_pair_indices(dim, first_row, end_row)
+    (quant_out, qual_out, final_out) = worker_state['out']
+    final = numpy.zeros(end-start)
+    if quant_abs_sum is not None:
+        final = final + quant_out[start:end]/quant_abs_sum*sum_quant_weights
+    if qual_abs_sum is not None:
+        final = final + qual_out[start:end]/qual_abs_sum*sum_qual_weights
+    final_out[start:end] = final
+    return (first_row, end_row) + gen_tile_sums(dim, final_out[start:end], first_row, end_row, rows, cols)
+
+def run_profile_tile(tile_args):
+    """Weighted absolute qualitative impact of each row of a range of rows of the
+    distinct profile pairs (see QualKernels.batch_absolute_sums), one column
+    per weight set
+    """
+    (first_row, end_row, weight_array) = tile_args
+    kernels = worker_state['kernels']
+    (profiles, counts) = kernels.get_profiles()
+    (start, end, rows, cols) = get_pair_indices(len(profiles), first_row, end_row)
+    bit_sums = kernels.bit_sums(weight_array)[profiles]
+    ranks = kernels.ranks[profiles]
+    impact = bit_sums[rows] - bit_sums[cols] + numpy.dot(numpy.sign(ranks[rows] - ranks[cols]), weight_array[:, kernels.ordinal_cols].T)
+    weighted = numpy.abs(impact) * (counts[rows]*counts[cols].astype(float))[:, numpy.newaxis]
+    row_starts = numpy.searchsorted(rows, numpy.arange(first_row, end_row))
+    return (first_row, end_row, numpy.add.reduceat(weighted, row_starts, axis=0))
+
+class TiledExecutor(object):
+    """Runs the Evamix pair-wise stages over blocks of rows on a process pool.
+
+    start_analysis copies the standardized input once into shared memory and
+    starts the pool, each worker attaching to it and to the output buffers of
+    the quantitative impact, qualitative impact and final matrices.  The
+    impact and combination stages of the analysis then run on the same pool,
+    the final stage reading the impact cells the workers wrote, until
+    close_analysis.  Workers write the packed cells of their rows straight
+    into the output buffers so the matrices are identical whatever the tile
+    size and number of workers.
+
+    Each tile also returns the absolute sum of each of its rows and its part
+    of the row sums, which are combined here and recorded on the matrix (see
+    PackedAntisymmetricMatrix.set_sums) so that normalization and scoring
+    do not walk the matrices again.
+
+    Used by the ArrayEvamix impact and combination stages in packed mode when
+    its executor is set.
+    """
+
+    def __init__(self, num_workers=None, tile_cells=2**20):
+        """num_workers - size of process pool, defaults to number of CPUs.  0 or 1 runs in this process
+        tile_cells - number of matrix cells in each block of rows sent to a worker
+        """
+        self.num_workers = num_workers
+        self.tile_cells = tile_cells
+        self.pool = None
+        self.matrices = None
+
+    def use_pool(self):
+        return self.num_workers is None or self.num_workers > 1
+
+    def start(self, init_args):
+        """Starts the workers (or attaches this process) with worker state from init_args"""
+        self.close()
+        if self.use_pool():
+            self.pool = multiprocessing.Pool(self.num_workers, init_worker, init_args)
+        else:
+            init_worker(*init_args)
+
+    def close(self, terminate=False):
+        """Stops the workers, terminate stops them without waiting for running tiles"""
+        if self.pool is not None:
+            if terminate:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+            self.pool.join()
+            self.pool = None
+        for out in worker_state.get('out', []):
+            if isinstance(out, numpy.memmap):
+                out.flush()
+        worker_state.clear()
+
+    def run_tiles(self, func, tasks, progress=None):
+        """Runs func over tasks on the started workers, returns the results in task order
+
+        progress - AnalysisProgress told as each task completes, if it is
+        cancelled (or a task fails) the workers are terminated and the
+        exception raised
+        """
+        results = []
+        try:
+            if self.pool is not None:
+                for result in self.pool.imap(func, tasks):
+                    results.append(result)
+                    self.update_progress(progress, len(results), len(tasks))
+            else:
+                for task in tasks:
+                    results.append(func(task))
+                    self.update_progress(progress, len(results), len(tasks))
+        except:
+            self.close_analysis(True)
+            raise
+        return results
+
+    def update_progress(self, progress, done, total):
+        if progress is not None:
+            progress.update(float(done)/max(1, total))
+
+    def start_analysis(self, in_array, weights, quant_cols, qual_types, dtype=numpy.float64, out_matrices=(None, None, None)):
+        """Starts the workers for the pair-wise stages of one analysis of
+        prepared input and standardized weights
+
+        qual_types - criteria types of the input columns, empty when there are
+        no qualitative criteria (see init_worker)
+        out_matrices - [quant_impact, qual_impact, final] MappedPackedMatrix
+        to write each matrix to, None writes it to shared memory.  The impact
+        matrices of criteria types not present are not made
+        """
+        dim = in_array.shape[0]
+        typecode = self.get_typecode(dtype)
+        num_pairs = get_num_pairs(dim)
+        needed = [bool(quant_cols), bool(qual_types), True]
+        self.matrices = []
+        out_buffers = []
+        for (out_matrix, is_needed) in zip(out_matrices, needed):
+            if not is_needed:
+                out_buffers.append(RawArray(typecode, 1))
+                self.matrices.append(None)
+            elif out_matrix is not None:
+                out_matrix.flush()
+                out_buffers.append(out_matrix.filename)
+                self.matrices.append(out_matrix)
+            else:
+                shared = RawArray(typecode, max(1, num_pairs))
+                out_buffers.append(shared)
+                self.matrices.append(PackedAntisymmetricMatrix(dim, from_shared(shared, typecode)[:num_pairs], dtype))
+        init_args = (to_shared(in_array), in_array.shape, numpy.asarray(weights, dtype=float),
+                     list(quant_cols), list(qual_types), out_buffers, typecode)
+        self.start(init_args)
+
+    def close_analysis(self, terminate=False):
+        """Stops the workers of the analysis, see close"""
+        self.close(terminate)
+        self.matrices = None
+
+    def gen_quant_impact_matrix(self, progress=None):
+        """Returns the packed quantitative impact matrix of the started analysis"""
+        return self.gen_impact_matrix(QUANT_IMPACT, progress)
+
+    def gen_qual_impact_matrix(self, progress=None):
+        """Returns the packed qualitative impact matrix of the started analysis"""
+        return self.gen_impact_matrix(QUAL_IMPACT, progress)
+
+    def gen_impact_matrix(self, out_index, progress=None):
+        """Fills and returns the packed impact matrix QUANT_IMPACT or QUAL_IMPACT
+        of the started analysis, with its sums recorded
+
+        progress - AnalysisProgress to report each tile to, see run_tiles
+        """
+        matrix = self.matrices[out_index]
+        tasks = [(out_index, first_row, end_row) for (first_row, end_row) in gen_row_ranges(matrix.dim, self.tile_cells)]
+        self.record_sums(matrix, self.run_tiles(run_impact_tile, tasks, progress))
+        return matrix
+
+    def gen_final_matrix(self, quant_abs_sum, sum_quant_weights, qual_abs_sum, sum_qual_weights, progress=None):
+        """Fills and returns the packed final matrix of the started analysis,
+        combining the impact matrices the workers filled (see run_final_tile),
+        a None absolute sum leaves that matrix out
+
+        progress - AnalysisProgress to report each tile to, see run_tiles
+        """
+        matrix = self.matrices[FINAL]
+        tasks = [(first_row, end_row, quant_abs_sum, sum_quant_weights, qual_abs_sum, sum_qual_weights)
+                 for (first_row, end_row) in gen_row_ranges(matrix.dim, self.tile_cells)]
+        self.record_sums(matrix, self.run_tiles(run_final_tile, tasks, progress))
+        return matrix
+
+    def record_sums(self, matrix, results):
+        """Combines the row absolute sums and partial row sums returned by the
+        tiles of a matrix and records them on it
+        """
+        row_abs = numpy.zeros(matrix.dim)
+        row_sums = numpy.zeros(matrix.dim)
+        for (first_row, end_row, tile_abs, tile_sums) in results:
+            row_abs[first_row:end_row] = tile_abs
+            row_sums += tile_sums
+        matrix.set_sums(2.0 * float(row_abs.sum()), row_sums)
+
+    def qual_batch_absolute_sums(self, in_array, weight_array, kernels):
+        """Returns the qualitative absolute sum for each row of an m x k array
+        of weights, see QualKernels.batch_absolute_sums
+
+        kernels - QualKernels of in_array
+        """
+        if not kernels.ordinal_cols:
+            return kernels.batch_absolute_sums(weight_array)
+        num_profiles = len(kernels.get_profiles()[0])
+        num_sets = weight_array.shape[0]
+        tile_cells = max(1, self.tile_cells / max(len(kernels.ordinal_cols), num_sets))
+        tasks = [(first_row, end_row, weight_array) for (first_row, end_row) in gen_row_ranges(num_profiles, tile_cells)]
+        row_abs = numpy.zeros((num_profiles, num_sets))
+        self.start((to_shared(in_array), in_array.shape, numpy.zeros(in_array.shape[1]), [], kernels.crit_types, [], 'd'))
+        for (first_row, end_row, tile_abs) in self.run_tiles(run_profile_tile, tasks):
+            row_abs[first_row:end_row] = tile_abs
+        self.close()
+        return 2.0 * row_abs.sum(axis=0)
+
+    def get_typecode(self, dtype):
+        if numpy.dtype(dtype) == numpy.float32:
+            return 'f'
+        return 'd'
@@ -0,0 +1,172 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - weight stability intervals, how far each criterion weight can
+# move before the ranking of the alternatives changes
+#===============================================================================
+
+import numpy
+
+from delphos_exceptions import *
+from array_evamix import ArrayEvamix
+
+class WeightStability(object):
+    """Weight stability interval analysis built on the Evamix algorithm.
+
+    Works on standardized weights (see Evamix.standardize_weights), which sum
+    to 1.  The weight of one criterion is moved to t, anywhere in [0, 1], and
+    the other weights are scaled to keep the sum at 1, so they keep their
+    proportions.  For each criterion the interval of t containing its weight
+    over which the ranking stays the same is found, once for the full
+    ranking and once for the top ranked alternative alone.
+
+    Scores are a non-linear function of t (the impact matrices are divided by
+    their absolute sums) so the interval ends are found numerically.  Each
+    criterion weight is first stepped across [0, 1] on a grid, finding where
+    the ranking first changes either side of the weight, then those brackets
+    are bisected down to tolerance.  Every grid and bisection step is a single
+    batch of weight sets scored by ArrayEvamix.gen_batch_scores, the
+    bisection steps covering all criteria at once, and the input is prepared
+    only once.  A change of ranking that reverts within one grid step can be
+    missed, more grid_points narrows the step.
+
+    Moving all the qualitative (or quantitative) weight onto criteria with a
+    single value leaves those impacts with a zero absolute sum.  Such weights
+    can not be scored and count as changing the ranking.
+    """
+
+    def __init__(self, grid_points=32, tolerance=1e-6, score_tolerance=1e-12, tile_cells=2**20):
+        """grid_points - number of steps across [0, 1] the weights are first moved in
+        tolerance - width in standardized weight the interval ends are found to
+        score_tolerance - score differences smaller than this (relative to the
+        largest score) do not change the ranking, so ties stay ties
+        """
+        self.grid_points = grid_points
+        self.tolerance = tolerance
+        self.score_tolerance = score_tolerance
+        self.tile_cells = tile_cells
+
+        self.intervals = None
+        self.num_evaluations = 0
+
+    def do_analysis(self, in_matrix, crit_weights, crit_types, crit_bc):
+        """Runs the analysis, returns the interval list (see get_intervals)
+
+        crit_weights - weights as input by the user (eg. InputWeightSet.get_weights()), not modified
+        """
+        self.evamix = ArrayEvamix(self.tile_cells)
+        (self.in_array, self.weights, self.quant_cols, self.qual_cols) = self.evamix.prepare_input(in_matrix, list(crit_weights), crit_types, crit_bc)
+        self.kernels = None
+        if self.qual_cols:
+            self.kernels = self.evamix.gen_qual_kernels()
+        self.num_evaluations = 0
+
+        base_scores = self.gen_scores(self.weights[numpy.newaxis, :])[0]
+        #Highest score first, ties keep alternative order
+        self.base_order = numpy.argsort(-base_scores, kind='mergesort')
+        self.abs_tolerance = self.score_tolerance * max(1.0, float(numpy.abs(base_scores).max()))
+
+        num_crit = len(self.weights)
+        #Interval ends, [criterion, 0 rank 1 top, 0 lower 1 upper]
+        bounds = numpy.zeros((num_crit, 2, 2))
+        brackets = []
+        for c in range(num_crit):
+            self.scan_criterion(c, bounds, brackets)
+        self.bisect(bounds, brackets)
+
+        self.intervals = []
+        for c in range(num_crit):
+            self.intervals.append([float(self.weights[c])] + bounds[c].ravel().tolist())
+        return self.intervals
+
+    def get_intervals(self):
+        """Returns list with one item per criterion:
+        [std_weight, rank_lower, rank_upper, top_lower, top_upper]
+        where the full ranking is unchanged for standardized weights in
+        [rank_lower, rank_upper] and the top ranked alternative in [top_lower, top_upper]
+        """
+        return self.intervals
+
+    def scan_criterion(self, c, bounds, brackets):
+        """Steps the weight of criterion c across the grid.  Sets the interval
+        ends of bounds that stay stable to the end of [0, 1] and adds
+        (c, kind, side, stable_t, changed_t) to brackets for the others
+        """
+        weight = self.weights[c]
+        if weight >= 1.0:
+            #The only weighted criterion, it can not move
+            bounds[c] = weight
+            return
+        grid = numpy.linspace(0.0, 1.0, self.grid_points+1)
+        stable = self.check_stable(self.gen_scores(self.gen_weight_rows([c]*len(grid), grid)))
+        for kind in range(2):
+            below = [m for m in range(len(grid)) if grid[m] < weight]
+            below.reverse()
+            above = [m for m in range(len(grid)) if grid[m] > weight]
+            for (side, steps, end) in [(0, below, 0.0), (1, above, 1.0)]:
+                stable_t = weight
+                for m in steps:
+                    if not stable[kind][m]:
+                        brackets.append((c, kind, side, stable_t, grid[m]))
+                        break
+                    stable_t = grid[m]
+                else:
+                    bounds[c, kind, side] = end
+
+    def bisect(self, bounds, brackets):
+        """Bisects all brackets together, one batch of weight sets per step"""
+        if not brackets:
+            return
+        crits = numpy.array([bracket[0] for bracket in brackets])
+        kinds = numpy.array([bracket[1] for bracket in brackets])
+        sides = numpy.array([bracket[2] for bracket in brackets])
+        stable_t = numpy.array([bracket[3] for bracket in brackets], dtype=float)
+        changed_t = numpy.array([bracket[4] for bracket in brackets], dtype=float)
+        rows = numpy.arange(len(brackets))
+        while numpy.abs(changed_t - stable_t).max() > self.tolerance:
+            mid_t = (stable_t + changed_t) / 2.0
+            stable = self.check_stable(self.gen_scores(self.gen_weight_rows(crits, mid_t)))
+            mid_stable = stable[kinds, rows]
+            stable_t = numpy.where(mid_stable, mid_t, stable_t)
+            changed_t = numpy.where(mid_stable, changed_t, mid_t)
+        bounds[crits, kinds, sides] = stable_t
+
+    def gen_weight_rows(self, crits, values):
+        """Returns an m x k array of standardized weights, row m moving the
+        weight of criterion crits[m] to values[m] and scaling the others
+        """
+        crits = numpy.asarray(crits)
+        values = numpy.asarray(values, dtype=float)
+        scale = (1.0 - values) / (1.0 - self.weights[crits])
+        weight_rows = self.weights[numpy.newaxis, :] * scale[:, numpy.newaxis]
+        weight_rows[numpy.arange(len(crits)), crits] = values
+        return weight_rows
+
+    def gen_scores(self, weight_rows):
+        """Returns an m x n array of scores, nan rows for weights that can not be scored"""
+        self.num_evaluations += weight_rows.shape[0]
+        return self.evamix.gen_batch_scores(self.in_array, weight_rows, self.quant_cols, self.qual_cols, self.kernels, zero_sum_nan=True)
+
+    def check_stable(self, scores):
+        """Returns a 2 x m boolean array, whether each row of scores keeps
+        the full ranking (row 0) and the top ranked alternative (row 1).
+        Rows of nan scores keep neither
+        """
+        scored = ~numpy.isnan(scores).any(axis=1)
+        ordered = scores[:, self.base_order]
+        rank_stable = (numpy.diff(ordered, axis=1) <= self.abs_tolerance).all(axis=1)
+        top_stable = ordered[:, 0] >= scores.max(axis=1) - self.abs_tolerance
+        return numpy.array([rank_stable & scored, top_stable & scored])
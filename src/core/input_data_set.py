@@ -17,201 +17,226 @@
 # @summary - 
 #===============================================================================
 
-import copy
-from sets import Set
+import numpy
+
 from util.common_functions import *
 from delphos_exceptions import *
+from evamix.input_validation import InputValidation, gen_error_message
 
 class InputDataSet():
 	"""Maintains altern/crit grid input data by the user.
-	
-	The grid cells of data are represented in a linear list, not a 2D list or other
-	The row and column of each cell is stored within the cells structure
-	So an 8x8 grid, 8 alternatives, 8 criteria would have a 64 element cell_data list
-	
+
+	The values are held in a dense grid, one list per row (criteria) with
+	one value per column (alternative), so an 8x8 grid, 8 alternatives,
+	8 criteria would have 8 rows of 8 values.  Lookup tables map each altern
+	and crit id to its column and row.
+
+	The grid cells are also numbered in a linear order, row by row, for the
+	table widgets.  Cell index i is row i / num_alterns, column
+	i % num_alterns and its contents are [altern_data, crit_data, row, col, value]
+
 	Ties input values to their associated altern/criteria pair so
 	that the user can go back and change the altern and crit without losing
-	the data that they already input.  It also separates data from 
+	the data that they already input.  It also separates data from
 	presentation.
-	
-	input_data: [[[altern_data][crit_data][row][col][value]], ...]
+
+	values: [[value, ...], ...] indexed [row][col]
 	altern_data: (altern_id, altern_name, altern_color)
 	crit_data: (crit_id, crit_name, crit_type, crit_options_units, cost_benefit)
 	"""
-	
+
 	def __init__(self, altern_data=None, crit_data=None):
 		self.num_alterns = 0
 		self.num_crits = 0
-		self.cell_data = None
-		if altern_data and crit_data:	  
-			self.cell_data = self.create_cell_data(altern_data, crit_data)
- 
+		self.altern_data = []
+		self.crit_data = []
+		self.altern_index = {}
+		self.crit_index = {}
+		self.values = []
+		if altern_data and crit_data:
+			self.set_headings(altern_data, crit_data)
+
 	def make_copy(self):
 		new_set = InputDataSet()
-		new_set.cell_data = copy.copy(self.cell_data)
 		new_set.num_alterns = self.num_alterns
 		new_set.num_crits = self.num_crits
+		new_set.altern_data = self.altern_data
+		new_set.crit_data = self.crit_data
+		new_set.altern_index = self.altern_index
+		new_set.crit_index = self.crit_index
+		new_set.values = [row[:] for row in self.values]
 		return new_set
-	
-	def create_cell_data(self, altern_data, crit_data):
-		cell_data = []
-		self.num_alterns = len(altern_data)
-		self.num_crits = len(crit_data)
-		for i in range(self.num_crits):
-			for j in range(self.num_alterns):
-				#Append associated alter and crit data to each 'cell'.  
-				#Append row and column to put in
-				#Append space for input value
-				cell_data.append([altern_data[j], crit_data[i], i, j, None])
-		
-		#print "input data:"
-		#print input_data
-		
-		return cell_data
-	
+
+	def set_headings(self, altern_data, crit_data):
+		"""Sets the alternatives (columns) and criteria (rows) of the grid,
+		with no values"""
+		self.altern_data = list(altern_data)
+		self.crit_data = list(crit_data)
+		self.num_alterns = len(self.altern_data)
+		self.num_crits = len(self.crit_data)
+		self.altern_index = dict([(self.altern_data[j][0], j) for j in range(self.num_alterns)])
+		self.crit_index = dict([(self.crit_data[i][0], i) for i in range(self.num_crits)])
+		self.values = [[None] * self.num_alterns for i in range(self.num_crits)]
+
 	def update_values(self, new_values):
-		for i in range(len(self.cell_data)):
-			self.set_value(i, new_values.get_value(i))
-	
+		for i in range(self.num_crits):
+			self.values[i] = new_values.values[i][:]
+
 	def load_values(self, input_data):
-		"""Load values into set"""
+		"""Load values into set
+
+		input_data - list of (altern_id, crit_id, value), pairs not in the set are ignored
+		"""
 		if not input_data:
 			raise Exception, "Error loading input table, no values given"
-	
-		#Load values from the given input data into the cell data where altern 
-		#and crit id match
-		for i in range(len(self.cell_data)):
-			for j in range(len(input_data)):
-				cur_altern_id = self.cell_data[i][0][0]
-				cur_crit_id = self.cell_data[i][1][0]
-				new_altern_id = input_data[j][0]
-				new_crit_id = input_data[j][1]
-				if cur_altern_id == new_altern_id and cur_crit_id == new_crit_id:
-					self.set_value(i, input_data[j][2])
-	
+
+		for (altern_id, crit_id, value) in input_data:
+			self.set_value_by_ids(altern_id, crit_id, value)
+
 	def update_headings(self, new_altern_data, new_crit_data):
+		"""Replaces the alternatives and criteria of the grid, keeping the
+		value of every altern/crit id pair in both"""
 		if not new_altern_data or not new_crit_data:
 			raise Exception, "Error updating input table"
-	
-		#Create new empty input set
-		new_input_data = InputDataSet(new_altern_data, new_crit_data)
-		
-		#Load values from current input set into new input set where altern 
-		#and crit id match
-		for i in range(len(self.cell_data)):
-			for j in range(len(new_input_data.cell_data)):
-				cur_altern_id = self.cell_data[i][0][0]
-				cur_crit_id = self.cell_data[i][1][0]
-				new_altern_id = new_input_data.cell_data[j][0][0]
-				new_crit_id = new_input_data.cell_data[j][1][0]
-				if cur_altern_id == new_altern_id and cur_crit_id == new_crit_id:
-					#Copy value
-					new_input_data.cell_data[j][4] = self.cell_data[i][4]
-		
-		#Replace current input data set with new updated one
-		self.num_alterns = new_input_data.num_alterns
-		self.num_crits = new_input_data.num_crits
-		self.cell_data = new_input_data.cell_data
+
+		old_values = self.values
+		#Column of each new alternative in the current grid, None if new
+		old_cols = [self.altern_index.get(altern[0]) for altern in new_altern_data]
+		old_rows = [self.crit_index.get(crit[0]) for crit in new_crit_data]
+
+		self.set_headings(new_altern_data, new_crit_data)
+		for i in range(self.num_crits):
+			if old_rows[i] is None:
+				continue
+			old_row = old_values[old_rows[i]]
+			self.values[i] = [old_row[col] if col is not None else None for col in old_cols]
 
 	def get_num_alterns(self):
 		return self.num_alterns
 
 	def get_num_crits(self):
 		return self.num_crits
-  
+
 	def get_cell_data(self):
-		return self.cell_data
-	
+		"""Returns list of the contents of every cell, see get_cell_contents"""
+		return [self.get_cell_contents(i) for i in range(self.get_num_cells())]
+
 	def get_cell_contents(self, index):
-		return self.cell_data[index]
-	
+		"""Returns [altern_data, crit_data, row, col, value] of cell index"""
+		(row, col) = divmod(index, self.num_alterns)
+		return [self.altern_data[col], self.crit_data[row], row, col, self.values[row][col]]
+
 	def get_num_cells(self):
-		return len(self.cell_data)
-		
+		return self.num_alterns * self.num_crits
+
 	def get_row(self, index):
-		return self.cell_data[index][2]
-		
+		return index / self.num_alterns
+
 	def get_col(self, index):
-		return self.cell_data[index][3]
+		return index % self.num_alterns
 
 	def get_value(self, index):
-		return self.cell_data[index][4]
+		(row, col) = divmod(index, self.num_alterns)
+		return self.values[row][col]
 
 	def set_value(self, index, value):
-		self.cell_data[index][4] = value
+		(row, col) = divmod(index, self.num_alterns)
+		self.values[row][col] = value
+
+	def get_value_by_ids(self, altern_id, crit_id):
+		"""Returns the value of an altern/crit id pair, None if it has none
+		or is not in the set"""
+		row = self.crit_index.get(crit_id)
+		col = self.altern_index.get(altern_id)
+		if row is None or col is None:
+			return None
+		return self.values[row][col]
+
+	def set_value_by_ids(self, altern_id, crit_id, value):
+		"""Sets the value of an altern/crit id pair, ignored if it is not in the set"""
+		row = self.crit_index.get(crit_id)
+		col = self.altern_index.get(altern_id)
+		if row is not None and col is not None:
+			self.values[row][col] = value
 
 	def get_crit_name(self, index):
-		return self.cell_data[index][1][1]
-	
+		return self.crit_data[self.get_row(index)][1]
+
 	def get_crit_type(self, index):
-		return self.cell_data[index][1][2]
-	
+		return self.crit_data[self.get_row(index)][2]
+
 	def get_altern_name(self, index):
-		return self.cell_data[index][0][1]
+		return self.altern_data[self.get_col(index)][1]
 
 	def get_qual_rows(self):
-		return list(Set([x[2] for x in self.cell_data if x[1][2] == "Ordinal" or x[1][2] == "Binary"]))
-	
+		return [i for i in range(self.num_crits) if self.crit_data[i][2] == "Ordinal" or self.crit_data[i][2] == "Binary"]
+
 	def get_quant_rows(self):
-		return list(Set([x[2] for x in self.cell_data if x[1][2] == "Ratio"]))
-
-	def check_quant_rows(self):
-		"""Check if all rows with quantative criteria have the same values
-		within a given row"""
-		quant_rows = self.get_quant_rows()
-		for row in quant_rows:
-			if self.check_same_values_by_row(row):
-				crit_name = self.get_crit_name(row)
-				raise InputError, unicode(row+1)+" '"+unicode(crit_name)+"'"
-		
-	def check_qual_rows(self):
-		"""Check if all rows with qualitative criteria have the same values
-		within a given row"""
-		qual_rows = self.get_qual_rows()
-		if len(qual_rows) > 0:	   
-			row_same_list = []
-			for row in qual_rows:		   
-				crit_name = self.get_crit_name(row)
-				row_same_list.append(self.check_same_values_by_row(row))
-				 
-			all_same = reduce(lambda x, y: x and y, row_same_list) 
-			if all_same: 
-				raise InputError, ""
-		else:
-			return None
-			
-	def check_same_values_by_row(self, row):
-		"""Check if the cells in any row all have the same values
+		return [i for i in range(self.num_crits) if self.crit_data[i][2] == "Ratio"]
+
+	def get_crit_options(self):
+		"""Returns list with the option codes of each qualitative criterion,
+		None for the others"""
+		crit_options = []
+		for crit in self.crit_data:
+			if crit[2] == "Ordinal" or crit[2] == "Binary":
+				crit_options.append([option[1] for option in crit[3]])
+			else:
+				crit_options.append(None)
+		return crit_options
+
+	def validate(self, input_required=True, check_same=True):
+		"""Checks the whole grid in one pass, returns list of every error found,
+		see InputValidation.validate.  Errors give the column (alternative)
+		then the row (criterion) of the cell
+
+		input_required - report missing values
+		check_same - report quantitative rows, or all qualitative rows, with one value
 		"""
-		row_cells = self.get_row_cells(row)			
-		same_bool_list = [x[4] == y[4] for x in [row_cells[0]] for y in row_cells]
-		same = reduce(lambda x, y: x and y, same_bool_list)
-		if same:
-			return True
-		else:
-			return False
-		
+		validation = InputValidation([crit[2] for crit in self.crit_data], self.get_crit_options())
+		return validation.validate(self.get_mca_input(), input_required, check_same)
+
+	def get_error_messages(self, errors, templates=None):
+		"""Returns list with a message for each error, naming its row and column
+
+		templates - message template of each error type, see gen_error_message
+		"""
+		crit_names = [crit[1] for crit in self.crit_data]
+		altern_names = [altern[1] for altern in self.altern_data]
+		return [gen_error_message(error, crit_names, altern_names, templates) for error in errors]
+
+	def check_input(self, input_required=True, check_same=True):
+		"""Checks the whole grid, raises InputError listing every error found"""
+		errors = self.validate(input_required, check_same)
+		if errors:
+			raise InputError, "\n".join(self.get_error_messages(errors))
+
 	def get_num_rows(self):
 		"""Return number of rows in input data
 		"""
-		#return list(Set([x[2] for x in self.cell_data]))
 		return self.num_crits
-	
+
 	def get_row_cells(self, row):
-		return [cell for cell in self.cell_data if cell[2] == row]
-	
+		start = row * self.num_alterns
+		return [self.get_cell_contents(i) for i in range(start, start + self.num_alterns)]
+
+	def get_row_values(self, row):
+		"""Returns list of the values of a row, one per alternative"""
+		return self.values[row][:]
+
 	def get_mca_input(self):
 		"""Generate in matrix for Evamix MCA
 		alterns down, criteria across, opposite of table widget"""
-		input = initialize_int_array(self.get_num_alterns(), self.get_num_crits())
-		for cell in self.cell_data:
-			col = cell[2] #Note pulling the row valu and using as column
-			row = cell[3] #Note pulling the column value and using as row
-			input[row][col] = cell[4]
-		return input
-	
-	def load_mca_input(self, input_matrix):
-		for cell in self.cell_data:
-			col = cell[2]
-			row = cell[3]
-			cell[4] = input_matrix[row][col]
\ No newline at end of file
+		return [list(altern_values) for altern_values in zip(*self.values)]
+
+	def load_mca_input(self, input_matrix, missing=None):
+		"""Loads values from an in matrix for Evamix MCA, alterns down, criteria
+		across (see get_mca_input)
+
+		missing - optional matrix of the same shape, True where there is no value
+		"""
+		values = numpy.empty((self.num_alterns, self.num_crits), dtype=object)
+		values[:] = input_matrix
+		if missing is not None:
+			values[numpy.asarray(missing, dtype=bool)] = None
+		self.values = values.T.tolist()
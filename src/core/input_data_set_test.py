@@ -0,0 +1,83 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+# 
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2 
+# 
+# This program is free software; you can redistribute it and/or 
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - input data set unit tests
+#===============================================================================
+
+import unittest
+from input_data_set import InputDataSet
+from evamix.input_validation import *
+from delphos_exceptions import *
+
+class TestInputDataSet(unittest.TestCase):
+
+    def setUp(self):
+        self.altern_data = [(10+j, u'Alternative %d' % j, '#ff0000') for j in range(4)]
+        self.crit_data = [(20, u'Catch', u'Ratio', u'Tonnes', u'B'),
+                          (21, u'Habitat', u'Ordinal', u'Low,High', u'B'),
+                          (22, u'Cost', u'Ratio', u'Dollars', u'C')]
+        self.input_data = InputDataSet(self.altern_data, self.crit_data)
+        self.input_data.load_values([(10+j, 20+i, i*10+j) for i in range(3) for j in range(4)] + [(99, 20, 5)])
+
+    def test_cells(self):
+        """test_cells - cells numbered row by row, with lookups by altern/crit id
+        """
+        self.assertEqual(self.input_data.get_num_cells(), 12)
+        self.assertEqual(self.input_data.get_cell_contents(6), [self.altern_data[2], self.crit_data[1], 1, 2, 12])
+        self.assertEqual([cell[4] for cell in self.input_data.get_row_cells(2)], [20, 21, 22, 23])
+        self.assertEqual(self.input_data.get_value_by_ids(13, 21), 13)
+        self.input_data.set_value(6, 0)
+        self.assertEqual(self.input_data.get_value_by_ids(12, 21), 0)
+        self.assertEqual(self.input_data.get_mca_input()[2], [2, 0, 22])
+
+    def test_update_headings(self):
+        """test_update_headings - values kept by altern/crit id as alternatives and criteria change
+        """
+        copy_data = self.input_data.make_copy()
+        copy_data.set_value(0, -1)
+        self.assertEqual(self.input_data.get_value(0), 0)
+        new_altern_data = [self.altern_data[3], (14, u'New', '#00ff00'), self.altern_data[0]]
+        new_crit_data = [self.crit_data[2], (23, u'Jobs', u'Ratio', u'People', u'B'), self.crit_data[0]]
+        self.input_data.update_headings(new_altern_data, new_crit_data)
+        self.assertEqual(self.input_data.get_mca_input(), [[23, None, 3], [None, None, None], [20, None, 0]])
+        matrix = [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+        self.input_data.load_mca_input(matrix)
+        self.assertEqual(self.input_data.get_mca_input(), matrix)
+
+    def test_check_input(self):
+        """test_check_input - InputError listing every error in the grid, by row and column
+        """
+        self.crit_data[1] = (21, u'Habitat', u'Ordinal', [(u'Low', 1), (u'High', 2)], u'B')
+        input_data = InputDataSet(self.altern_data, self.crit_data)
+        input_data.load_values([(10+j, 20+i, [j, j % 2 + 1, 7][i]) for i in range(3) for j in range(4)])
+        #Cost has one value in every column
+        input_data.check_input(True, False)
+        input_data.set_value_by_ids(11, 20, None)
+        input_data.set_value_by_ids(12, 20, u'12.5')
+        input_data.set_value_by_ids(13, 21, 3)
+        self.assertEqual(input_data.validate(), [(MISSING, 1, 0, None), (NON_INTEGER, 2, 0, u'12.5'), (BAD_OPTION, 3, 1, 3), (SAME_VALUES, None, 2, None)])
+        self.assertEqual(input_data.validate(False, False), [(NON_INTEGER, 2, 0, u'12.5'), (BAD_OPTION, 3, 1, 3)])
+        try:
+            input_data.check_input()
+        except InputError, e:
+            messages = e.value.split("\n")
+            self.assertEqual(len(messages), 4)
+            self.assertEqual(messages[0], "Missing input in row 1 'Catch', column 2 'Alternative 1'")
+        else:
+            self.fail("InputError not raised")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,7 @@ from sqlalchemy import *
 from delphos_exceptions import *
 import os
 import sys
+import numpy
 
 class InputSet():
 	"""Maintains global input by the user for a project.
@@ -38,6 +39,9 @@ class InputSet():
 	crit_data: (crit_id, crit_name, crit_type, crit_options_units, cost_benefit)
 	"""
 	
+	#Most ids bound in one query, SQLite allows at most 999 parameters
+	max_query_ids = 900
+	
 	def __init__(self, name, metadata):
 		"""altern_set = InputSet(string, BoundMetadata)
 		
@@ -93,6 +97,30 @@ class InputSet():
 		if value is not None:
 			self.add_input(altern_id, crit_id, value)
 
+	def update_many(self, input_values):
+		"""Sets many input values at once, inside one transaction so that
+		either all or none of them are stored
+		
+		input_values - list of (altern_id, crit_id, value), a value of None removes the input
+		"""
+		if not input_values:
+			return
+		keys = [{'key_altern_id':altern_id, 'key_crit_id':crit_id} for (altern_id, crit_id, value) in input_values]
+		rows = [{'altern_id':altern_id, 'crit_id':crit_id, 'value':value} for (altern_id, crit_id, value) in input_values if value is not None]
+		delete_sql = self.table.delete( and_(self.table.c.altern_id==bindparam('key_altern_id'), self.table.c.crit_id==bindparam('key_crit_id')) )
+		conn = self.metadata.engine.connect()
+		trans = conn.begin()
+		try:
+			conn.execute(delete_sql, keys)
+			if rows:
+				conn.execute(self.table.insert(), rows)
+			trans.commit()
+		except:
+			trans.rollback()
+			conn.close()
+			raise
+		conn.close()
+
 	def get_input_value(self, altern_id, crit_id):
 		"""Return input value given an altern and crit id
 		"""
@@ -135,13 +163,44 @@ class InputSet():
 	def get_all_input(self):
 		"""Returns all inputs in set in list structure [[id, name], ...]
 		"""
-		return list(self.table.select(order_by=self.table.c.altern_id).execute())
+		return list(self.table.select(order_by=[self.table.c.altern_id]).execute())
+
+	def get_input_matrix(self, altern_ids, crit_ids):
+		"""Returns (in_matrix, missing) for the given alternatives and criteria,
+		fetched in one query.  in_matrix is a numpy array with a row per
+		alternative and a column per criterion in the order of the ids given
+		(as Evamix.do_analysis expects) and missing a boolean array of the same
+		shape, True where there is no input (in_matrix is 0 there)
+		"""
+		altern_index = dict([(altern_ids[i], i) for i in range(len(altern_ids))])
+		crit_index = dict([(crit_ids[j], j) for j in range(len(crit_ids))])
+		in_matrix = numpy.zeros((len(altern_ids), len(crit_ids)), dtype=int)
+		missing = numpy.ones((len(altern_ids), len(crit_ids)), dtype=bool)
+		if not altern_ids or not crit_ids:
+			return (in_matrix, missing)
+
+		#Filter by id in the query unless there are too many ids to bind,
+		#cells of other ids are then skipped as they are read
+		conditions = [self.table.c.value != None]
+		if len(altern_ids) + len(crit_ids) <= self.max_query_ids:
+			conditions.append(self.table.c.altern_id.in_(*altern_ids))
+			conditions.append(self.table.c.crit_id.in_(*crit_ids))
+		elif len(crit_ids) <= self.max_query_ids:
+			conditions.append(self.table.c.crit_id.in_(*crit_ids))
+		sql = select([self.table.c.altern_id, self.table.c.crit_id, self.table.c.value], and_(*conditions), order_by=[self.table.c.altern_id, self.table.c.crit_id])
+		for (altern_id, crit_id, value) in sql.execute().fetchall():
+			i = altern_index.get(altern_id)
+			j = crit_index.get(crit_id)
+			if i is not None and j is not None:
+				in_matrix[i, j] = value
+				missing[i, j] = False
+		return (in_matrix, missing)
 
 #	def get_input_ids(self):
 #		"""Returns list of IDs of inputs currently loaded
 #		"""
 #		altern_id_list = []
-#		for row in self.table.select(order_by=self.table.c.input_id).execute():
+#		for row in self.table.select(order_by=[self.table.c.input_id]).execute():
 #			altern_id_list.append(row.input_id)
 #		return altern_id_list
 	
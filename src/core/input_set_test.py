@@ -0,0 +1,88 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+# 
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2 
+# 
+# This program is free software; you can redistribute it and/or 
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - project input set unit tests
+#===============================================================================
+
+import unittest
+import shutil
+import tempfile
+from testing_util import new_project
+from input_data_set import InputDataSet
+
+class TestInputSet(unittest.TestCase):
+
+    def test_project_input_matrix(self):
+        """test_project_input_matrix - input of selected alternatives and criteria read in one query into a matrix and missing mask
+        """
+        project_dir = tempfile.mkdtemp()
+        try:
+            project = new_project('input_matrix.dlp', project_dir)
+            for i in range(4):
+                project.add_alternative(u'Alternative %d' % i, '#ff0000')
+            for i in range(3):
+                project.add_criteria((u'Criterion %d' % i, u'Ratio', u'Tonnes', u'B'))
+            altern_ids = [altern[0] for altern in project.get_all_alternatives()]
+            crit_ids = [crit[0] for crit in project.get_all_criteria()]
+            for i in range(4):
+                for j in range(3):
+                    if (i + j) % 3:
+                        project.update_input_value(altern_ids[i], crit_ids[j], i*10+j)
+
+            (in_matrix, missing) = project.get_input_matrix([altern_ids[3], altern_ids[1]], [crit_ids[2], crit_ids[0]])
+            self.assertEqual(in_matrix.tolist(), [[32, 0], [0, 10]])
+            self.assertEqual(missing.tolist(), [[False, True], [True, False]])
+
+            input_data = InputDataSet([(altern_ids[3], u'', ''), (altern_ids[1], u'', '')], [(crit_ids[2], u'', u'Ratio', u'', u'B'), (crit_ids[0], u'', u'Ratio', u'', u'B')])
+            input_data.load_mca_input(in_matrix, missing)
+            self.assertEqual(input_data.get_mca_input(), [[32, None], [None, 10]])
+            self.assertEqual(type(input_data.get_value(0)), int)
+
+            #Too many ids to bind in the query
+            project.input_set.max_query_ids = 2
+            (in_matrix, missing) = project.get_input_matrix(altern_ids, crit_ids)
+            self.assertEqual(in_matrix.tolist(), [[0, 1, 2], [10, 11, 0], [20, 0, 22], [0, 31, 32]])
+            self.assertEqual(missing.sum(), 4)
+        finally:
+            shutil.rmtree(project_dir)
+
+    def test_project_bulk_input(self):
+        """test_project_bulk_input - many input values set in one transaction, all or none stored
+        """
+        project_dir = tempfile.mkdtemp()
+        try:
+            project = new_project('bulk_input.dlp', project_dir)
+            for i in range(3):
+                project.add_alternative(u'Alternative %d' % i, '#ff0000')
+            project.add_criteria((u'Catch', u'Ratio', u'Tonnes', u'B'))
+            project.add_criteria((u'Cost', u'Ratio', u'Dollars', u'C'))
+            altern_ids = [altern[0] for altern in project.get_all_alternatives()]
+            crit_ids = [crit[0] for crit in project.get_all_criteria()]
+
+            project.update_input_values([(altern_ids[i], crit_ids[j], i+j) for i in range(3) for j in range(2)])
+            project.update_input_values([(altern_ids[0], crit_ids[0], 50), (altern_ids[2], crit_ids[1], None)])
+            (in_matrix, missing) = project.get_input_matrix(altern_ids, crit_ids)
+            self.assertEqual(in_matrix.tolist(), [[50, 1], [1, 2], [2, 0]])
+            self.assertEqual(missing.sum(), 1)
+
+            #The same cell twice fails on its second insert, nothing is stored
+            self.assertRaises(Exception, project.update_input_values, [(altern_ids[1], crit_ids[0], 7), (altern_ids[1], crit_ids[0], 8)])
+            self.assertEqual(project.get_input_value(altern_ids[1], crit_ids[0]), 1)
+        finally:
+            shutil.rmtree(project_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - content addressed cache of analysis data stored in the project DB
+#===============================================================================
+
+from sqlalchemy import *
+import pickle
+import hashlib
+import time
+import threading
+import numpy
+
+class McaCache(object):
+    """Caches prepared analysis input and analysis results in the project DB.
+
+    Entries are keyed by a hash of their content so an identical input matrix
+    (with the same criteria types and cost/benefit flags) submitted again, by
+    a rerun or after the project is reopened, finds its prepared data: the
+    standardized input and the per-criterion qualitative sign tensor.  Full
+    results are additionally keyed by the criteria weights.
+
+    The least recently used entries are evicted once the total size of the
+    cached data passes max_bytes.  Entries estimated to be larger than
+    max_bytes (see estimate_input_size and estimate_result_size) are neither
+    built nor cached, so large runs pay nothing for the cache.
+
+    Reads and writes of the table are serialized by lock, which the project
+    shares with its other writers, as analyses may run in background threads.
+    """
+    def __init__(self, metadata, db_name, max_bytes=64*1024*1024, lock=None):
+        """mca_cache = McaCache(BoundMetadata, string, int, RLock)
+
+        metadata - SQLAlchemy metadata object providing access to DB engine and tables
+        db_name - name to give DB table
+        max_bytes - maximum total size of cached data
+        lock - lock held while the DB is accessed, a new one if not given
+        """
+        self.metadata = metadata
+        self.db_name = db_name
+        self.max_bytes = max_bytes
+        self.lock = lock or threading.RLock()
+        self.table = None
+
+        #Load cache table from DB if it exists otherwise create it
+        if self.metadata.engine.has_table(self.db_name):
+            self.table = Table(self.db_name, self.metadata, autoload=True)
+        else:
+            self.__create_table()
+
+    def __create_table(self):
+        """Create a new cache table in the DB
+        """
+        self.table = self.__get_table_object()
+        self.table.create()
+
+    def __get_table_object(self):
+        """Create cache Table object (SQLAlchemy)
+
+        data is a pickled python object, last_used is the time it was last read or written
+        """
+        return Table(self.db_name, self.metadata,
+            Column('cache_key', String(40), primary_key=True),
+            Column('data', Binary()),
+            Column('size', Integer),
+            Column('last_used', Float())
+        )
+
+    def gen_input_key(self, in_matrix, crit_types, crit_bc, packed=False):
+        """Returns the key of prepared input data for an analysis input
+        
+        packed - data is for a packed mode ArrayEvamix, which uses a packed sign tensor
+        """
+        in_array = numpy.array(in_matrix, dtype=float)
+        key = hashlib.sha1()
+        key.update(str(in_array.shape))
+        key.update(in_array.tostring())
+        key.update("|".join([str(x) for x in crit_types]))
+        key.update("|".join([str(x) for x in crit_bc]))
+        if packed:
+            key.update("packed")
+        return key.hexdigest()
+
+    def gen_result_key(self, input_key, crit_weights, packed=False, dtype=numpy.float64):
+        """Returns the key of the analysis result for an input key and weights
+
+        packed, dtype - packing and value type of the result matrices
+        """
+        key = hashlib.sha1(input_key + repr([float(x) for x in crit_weights]))
+        key.update("packed=%s dtype=%s" % (bool(packed), numpy.dtype(dtype).str))
+        return key.hexdigest()
+
+    def estimate_input_size(self, num_alterns, num_crits, num_qual, packed=False):
+        """Returns the approximate size in bytes of the prepared input of an
+        analysis (see run_analysis), the input array and the qualitative sign tensor
+        """
+        if packed:
+            num_pairs = num_alterns*(num_alterns-1)/2
+        else:
+            num_pairs = num_alterns*num_alterns
+        return num_alterns*num_crits*8 + num_pairs*num_qual
+
+    def estimate_result_size(self, num_alterns, packed=False, dtype=numpy.float64):
+        """Returns the approximate size in bytes of an analysis result, the
+        final scores and three impact/final matrices.  Unpacked matrices are
+        lists, pickled at 9 bytes a value
+        """
+        if packed:
+            matrix_size = num_alterns*(num_alterns-1)/2*numpy.dtype(dtype).itemsize
+        else:
+            matrix_size = num_alterns*num_alterns*9
+        return num_alterns*9 + 3*matrix_size
+
+    def get(self, cache_key):
+        """Returns the cached object or None if not cached"""
+        self.lock.acquire()
+        try:
+            row = self.table.select(self.table.c.cache_key==cache_key).execute().fetchone()
+            if not row:
+                return None
+            self.table.update(self.table.c.cache_key==cache_key).execute({'last_used':time.time()})
+        finally:
+            self.lock.release()
+        return pickle.loads(str(row['data']))
+
+    def put(self, cache_key, value):
+        """Caches an object, evicting least recently used entries as needed.
+        Objects larger than max_bytes are not cached
+        """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return False
+        self.lock.acquire()
+        try:
+            self.table.delete(self.table.c.cache_key==cache_key).execute()
+            self.table.insert().execute({'cache_key':cache_key, 'data':data, 'size':len(data), 'last_used':time.time()})
+            self.evict(self.max_bytes)
+        finally:
+            self.lock.release()
+        return True
+
+    def evict(self, max_bytes):
+        """Removes least recently used entries until the cache holds at most max_bytes"""
+        total = self.get_size()
+        if total <= max_bytes:
+            return
+        rows = select([self.table.c.cache_key, self.table.c.size], order_by=[self.table.c.last_used]).execute().fetchall()
+        for (cache_key, size) in rows:
+            if total <= max_bytes:
+                break
+            self.table.delete(self.table.c.cache_key==cache_key).execute()
+            total -= size
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.table.delete().execute()
+        finally:
+            self.lock.release()
+
+    def get_size(self):
+        """Returns the total size in bytes of the cached data"""
+        size = select([func.sum(self.table.c.size)]).execute().fetchone()[0]
+        if size:
+            return int(size)
+        return 0
+
+    def get_num(self):
+        """Returns the number of cached entries"""
+        return len(select([self.table.c.cache_key]).execute().fetchall())
+
+    def run_analysis(self, evamix, in_matrix, crit_weights, crit_types, crit_bc):
+        """Runs an analysis with the given ArrayEvamix using cached data where possible.
+
+        Same arguments and result as Evamix.do_analysis.  A cached result is
+        returned directly, otherwise cached prepared input is used (and the
+        input prepared and cached if not found).  Results and prepared input
+        estimated to be larger than max_bytes are skipped before anything is
+        built, the analysis is then run as if there was no cache.
+        """
+        num_alterns = len(in_matrix)
+        num_qual = len([crit_type for crit_type in crit_types if crit_type == "Ordinal" or crit_type == "Binary"])
+        cache_result = self.estimate_result_size(num_alterns, evamix.packed, evamix.dtype) <= self.max_bytes
+        cache_input = evamix.use_qual_signs() and \
+            self.estimate_input_size(num_alterns, len(crit_types), num_qual, evamix.packed) <= self.max_bytes
+        if not cache_result and not cache_input:
+            return evamix.do_analysis(in_matrix, crit_weights, crit_types, crit_bc)
+
+        input_key = self.gen_input_key(in_matrix, crit_types, crit_bc, evamix.packed)
+        result_key = self.gen_result_key(input_key, crit_weights, evamix.packed, evamix.dtype)
+        if cache_result:
+            result = self.get(result_key)
+            if result is not None:
+                #A run standardizes the given weights in place and returns
+                #that list in the result, the cached result holds a copy
+                crit_weights[:] = result[1][0]
+                result[1][0] = crit_weights
+                return result
+
+        if cache_input:
+            prepared = self.get(input_key)
+            if prepared is None:
+                evamix.check_weights(in_matrix, crit_weights, crit_types, crit_bc)
+                (in_array, quant_cols, qual_cols) = evamix.prepare_values(in_matrix, crit_types, crit_bc)
+                qual_signs = evamix.gen_qual_sign_tensor(in_array, qual_cols)
+                prepared = (in_array, quant_cols, qual_cols, qual_signs)
+                self.put(input_key, prepared)
+            result = evamix.do_prepared_analysis(in_matrix, crit_weights, crit_types, crit_bc, prepared)
+        else:
+            result = evamix.do_analysis(in_matrix, crit_weights, crit_types, crit_bc)
+
+        if cache_result:
+            self.put(result_key, result)
+        return result
+
+    def __unicode__(self):
+        """Description of object
+        """
+        return "MCA cache"
+
+    def __str__(self):
+        """Description of object
+        """
+        return "MCA Cache"
@@ -0,0 +1,74 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+# 
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2 
+# 
+# This program is free software; you can redistribute it and/or 
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - analysis cache unit tests
+#===============================================================================
+
+import unittest
+import numpy
+from sqlalchemy import *
+from mca_cache import McaCache
+from evamix.array_evamix import ArrayEvamix
+from evamix.packed_matrix import *
+
+in_matrix = [[4, 3, 37900], [3, 2, 3000], [3, 3, 240], [4, 4, 12231], [2, 2, 25]]
+crit_weights = [1, 2, 3]
+crit_types = ["Ordinal", "Binary", "Ratio"]
+crit_bc = ["B", "B", "C"]
+
+class TestMcaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = McaCache(BoundMetaData('sqlite://'), 'mca_cache')
+
+    def test_reuse(self):
+        """test_reuse - a repeated run is served from the cache with the same result
+        """
+        result = self.cache.run_analysis(ArrayEvamix(packed=True), in_matrix, list(crit_weights), crit_types, crit_bc)
+        self.assertEqual(self.cache.get_num(), 2)
+        weights = list(crit_weights)
+        cached = self.cache.run_analysis(ArrayEvamix(packed=True), in_matrix, weights, crit_types, crit_bc)
+        self.assertEqual(self.cache.get_num(), 2)
+        self.assertEqual(cached[0], result[0])
+        #The given weights are standardized and returned as by an uncached run
+        self.assert_(cached[1][0] is weights)
+        self.assertEqual(weights, result[1][0])
+
+    def test_dtype_key(self):
+        """test_dtype_key - float32 and float64 results are cached apart
+        """
+        self.cache.run_analysis(ArrayEvamix(packed=True), in_matrix, list(crit_weights), crit_types, crit_bc)
+        result = self.cache.run_analysis(ArrayEvamix(packed=True, dtype=numpy.float32), in_matrix, list(crit_weights), crit_types, crit_bc)
+        self.assertEqual(self.cache.get_num(), 3)
+        self.assertEqual(result[1][3].values.dtype, numpy.float32)
+
+    def test_oversize_skipped(self):
+        """test_oversize_skipped - entries estimated over max_bytes are not built or cached
+        """
+        evamix = ArrayEvamix(packed=True)
+        self.cache.max_bytes = self.cache.estimate_input_size(len(in_matrix), 3, 2, True) - 1
+        self.assertTrue(self.cache.estimate_result_size(len(in_matrix), True) > self.cache.max_bytes)
+        def no_signs(in_array, qual_cols):
+            self.fail("Sign tensor built for an entry over max_bytes")
+        evamix.gen_qual_sign_tensor = no_signs
+        result = self.cache.run_analysis(evamix, in_matrix, list(crit_weights), crit_types, crit_bc)
+        self.assertEqual(self.cache.get_num(), 0)
+        expected = ArrayEvamix().do_scores(in_matrix, list(crit_weights), crit_types, crit_bc)
+        for i in range(len(in_matrix)):
+            self.assertAlmostEqual(result[0][i], expected[i], 9)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,21 +19,26 @@ from sqlalchemy import *
 import os
 import sys
 import pickle
+import numpy
 from util.common_functions import *
+from evamix.packed_matrix import *
 
 class McaRuns(object):
     """Provides access to MCA input and result data for a given run
     """
-    def __init__(self, metadata, db_name):
+    def __init__(self, metadata, db_name, matrix_dtype=numpy.float64):
         """project_data = ProjectData(BoundMetadata, string, string, string)
         
         metadata - SQLAlchemy metadata object providing access to DB engine and tables
         db_name - name to give DB
         project_name - name of project
         type - analaysis type (eg. fisheries or mpa)
+        matrix_dtype - value type the impact and final matrices are stored as, 
+        numpy.float32 halves their size
         """
         self.metadata = metadata
         self.db_name = db_name
+        self.matrix_dtype = matrix_dtype
         
         self.table = None
         self.mapper = None
@@ -41,6 +46,8 @@ class McaRuns(object):
         #Load project table from DB if it exists otherwise create it
         if self.metadata.engine.has_table(self.db_name):
             self.table = Table(self.db_name, self.metadata, autoload=True)
+            if 'stability' not in self.table.columns.keys():
+                self.__add_stability_column()
         else:
             self.__create_table()
         
@@ -52,10 +59,16 @@ class McaRuns(object):
         self.table = self.__get_table_object()
         self.table.create()
     
+    def __add_stability_column(self):
+        """Adds the stability column to a table created before it existed"""
+        self.metadata.engine.execute("ALTER TABLE "+self.db_name+" ADD COLUMN stability BLOB")
+        self.table.append_column(Column('stability', Binary()))
+
     def __get_table_object(self):
         """Create mca runs Table object (SQLAlchemy)
         
         int_results are intermediate results generated during analysis
+        stability are the weight stability intervals of the run, see WeightStability
         """
         return Table(self.db_name, self.metadata,
             Column('id', Integer, Sequence('mca_run_seq'), primary_key=True),
@@ -67,7 +80,8 @@ class McaRuns(object):
             Column('input_weights', Binary()),
             Column('results', Binary()),
             Column('created', DateTime(timezone=True)),
-            Column('int_results', Binary())
+            Column('int_results', Binary()),
+            Column('stability', Binary())
         )
 
     def insert(self, name, description, altern_data, crit_data, input_data, input_weights, results, int_results):
@@ -85,8 +99,28 @@ class McaRuns(object):
         input_data = pickle.dumps(input_data)
         input_weights = pickle.dumps(input_weights)
         results = pickle.dumps(results)
-        int_results = pickle.dumps(int_results)
-        self.table.insert().execute({'name':unicode(name), 'description':unicode(description), 'altern_data':altern_data, 'crit_data':crit_data, 'input_data':input_data, 'input_weights':input_weights, 'results':results, 'created':func.current_timestamp(), 'int_results':int_results})
+        int_results = pickle.dumps(self.pack_int_results(int_results), pickle.HIGHEST_PROTOCOL)
+        result = self.table.insert().execute({'name':unicode(name), 'description':unicode(description), 'altern_data':altern_data, 'crit_data':crit_data, 'input_data':input_data, 'input_weights':input_weights, 'results':results, 'created':func.current_timestamp(), 'int_results':int_results})
+        return result.last_inserted_ids()[0]
+
+    def pack_int_results(self, int_results):
+        """Stores the antisymmetric impact and final matrices in packed form,
+        as plain data (see get_matrix_data) so that the stored run does not
+        depend on the matrix classes
+        """
+        if not int_results:
+            return int_results
+        std_weights = [float(weight) for weight in int_results[0]]
+        return [std_weights] + [get_matrix_data(pack_matrix(matrix, self.matrix_dtype)) for matrix in int_results[1:]]
+
+    def unpack_int_results(self, int_results):
+        """Rebuilds the packed matrices stored by pack_int_results.  Runs
+        stored before packing was added hold them as lists of lists, both are
+        read back by get_matrix_column and get_matrix_value
+        """
+        if not int_results:
+            return int_results
+        return [int_results[0]] + [isinstance(matrix, dict) and load_matrix_data(matrix) or matrix for matrix in int_results[1:]]
 
     def delete(self, id):
         """Remove mca run given its unique run ID
@@ -96,10 +130,11 @@ class McaRuns(object):
     def get_all(self):
         """Returns list of mca runs
         """
-        rows = self.table.select(order_by=self.table.c.id).execute().fetchall()
+        rows = self.table.select(order_by=[self.table.c.id]).execute().fetchall()
         recs = []
         for row in rows:
-            cur_row = list(row)
+            #Stability is not included, see get_stability
+            cur_row = list(row)[:10]
             #unpickle pickled fields
             cur_row[3] = pickle.loads(cur_row[3])
             cur_row[4] = pickle.loads(cur_row[4])
@@ -107,19 +142,19 @@ class McaRuns(object):
             cur_row[6] = pickle.loads(cur_row[6])
             cur_row[7] = pickle.loads(cur_row[7])
             cur_row[8] = utc_to_local_time(cur_row[8])
-            cur_row[9] = pickle.loads(cur_row[9])
+            cur_row[9] = self.unpack_int_results(pickle.loads(str(cur_row[9])))
             recs.append(cur_row)
         return recs
     
     def get_num(self):
         """Returns the number of analysis runs stored
         """
-        return len(self.table.select(order_by=self.table.c.id).execute().fetchall())
+        return len(self.table.select(order_by=[self.table.c.id]).execute().fetchall())
 
     def get_basic(self):
         """Returns list with basic information about analysis runs that have been performed
         """
-        rows = self.table.select(order_by=self.table.c.id).execute().fetchall()
+        rows = self.table.select(order_by=[self.table.c.id]).execute().fetchall()
         recs = []
         for row in rows:
             cur_row = list(row)
@@ -134,18 +169,29 @@ class McaRuns(object):
 
     def get_all_by_id(self, id):
         #(altern data, crit data, input data, input weights, results)
-        rows = self.table.select(self.table.c.id == id, order_by=self.table.c.id).execute().fetchall()
+        rows = self.table.select(self.table.c.id == id, order_by=[self.table.c.id]).execute().fetchall()
         for row in rows:
-            cur_row = list(row)
+            cur_row = list(row)[:10]
             cur_row[3] = pickle.loads(cur_row[3])
             cur_row[4] = pickle.loads(cur_row[4])
             cur_row[5] = pickle.loads(cur_row[5])
             cur_row[6] = pickle.loads(cur_row[6])
             cur_row[7] = pickle.loads(cur_row[7])
             cur_row[8] = utc_to_local_time(cur_row[8])
-            cur_row[9] = pickle.loads(cur_row[9])
+            cur_row[9] = self.unpack_int_results(pickle.loads(str(cur_row[9])))
             return cur_row
 
+    def set_stability(self, id, stability):
+        """Stores the weight stability intervals of a run (see WeightStability.get_intervals)"""
+        self.table.update(self.table.c.id == id).execute({'stability':pickle.dumps(stability)})
+
+    def get_stability(self, id):
+        """Returns the weight stability intervals of a run, None if they have not been computed"""
+        row = select([self.table.c.stability], self.table.c.id == id).execute().fetchone()
+        if row is None or row[0] is None:
+            return None
+        return pickle.loads(str(row[0]))
+
     def __unicode__(self):
         """Description of object
         """
@@ -0,0 +1,76 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+# 
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2 
+# 
+# This program is free software; you can redistribute it and/or 
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - analysis runs table unit tests
+#===============================================================================
+
+import unittest
+import shutil
+import tempfile
+from sqlalchemy import *
+from mca_runs import McaRuns
+from evamix.weight_stability import WeightStability
+from testing_util import new_project
+
+class TestMcaRuns(unittest.TestCase):
+
+    def test_stored_with_run(self):
+        """test_stored_with_run - stability intervals are stored alongside the analysis run
+        """
+        project_dir = tempfile.mkdtemp()
+        try:
+            crit_types = ["Ratio", "Ordinal", "Binary"]
+            in_matrix = [[120, 1, 1], [450, 3, 2], [80, 5, 1], [300, 2, 2], [210, 4, 1], [640, 2, 2]]
+            crit_weights = [3, 2, 1]
+            crit_bc = ["B", "C", "B"]
+            project = new_project('stability.dlp', project_dir)
+            for i in range(6):
+                project.add_alternative(u'Alternative %d' % i, '#ff0000')
+            project.add_criteria((u'Ratio', u'Ratio', u'Units', crit_bc[0]))
+            project.add_criteria((u'Ordinal', u'Ordinal', [[u'Level %d' % level, level] for level in range(1, 6)], crit_bc[1]))
+            project.add_criteria((u'Binary', u'Binary', [u'Yes', u'No'], crit_bc[2]))
+            [final_scores, int_data] = project.run_mca(in_matrix, list(crit_weights), crit_types, crit_bc)
+            run_id = project.save_analysis(u'Stability', u'', project.get_all_alternatives(), project.get_all_criteria(), in_matrix, crit_weights, final_scores, int_data)
+            self.assertEqual(project.get_mca_runs_basic()[-1][0], run_id)
+            self.assertEqual(project.get_weight_stability(run_id), None)
+
+            stability = project.run_weight_stability(run_id)
+            self.assertEqual(stability, WeightStability().do_analysis(in_matrix, crit_weights, crit_types, crit_bc))
+            self.assertEqual(project.get_weight_stability(run_id), stability)
+            self.assertEqual(len(project.get_mca_run_by_id(run_id)), 10)
+        finally:
+            shutil.rmtree(project_dir)
+
+    def test_adds_column(self):
+        """test_adds_column - runs tables created before stability was stored gain the column
+        """
+        metadata = BoundMetaData('sqlite:///:memory:')
+        Table('mca_runs', metadata,
+            Column('id', Integer, Sequence('mca_run_seq'), primary_key=True),
+            Column('name', Unicode(200)), Column('description', Unicode(200)),
+            Column('altern_data', Binary()), Column('crit_data', Binary()), Column('input_data', Binary()),
+            Column('input_weights', Binary()), Column('results', Binary()),
+            Column('created', DateTime(timezone=True)), Column('int_results', Binary())).create()
+        metadata.clear()
+        runs = McaRuns(metadata, 'mca_runs')
+        runs.insert(u'Old', u'', [[1, u'A']], [], [[1]], [1], [0.0], None)
+        run_id = runs.get_basic()[0][0]
+        runs.set_stability(run_id, [[1.0, 1.0, 1.0, 1.0, 1.0]])
+        self.assertEqual(runs.get_stability(run_id), [[1.0, 1.0, 1.0, 1.0, 1.0]])
+        self.assertEqual(len(runs.get_all_by_id(run_id)), 10)
+
+if __name__ == '__main__':
+    unittest.main()
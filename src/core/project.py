@@ -20,6 +20,7 @@ import logging
 import os
 import sys
 import csv
+import threading
 from sqlalchemy import *
 
 from project_data import *
@@ -27,6 +28,9 @@ from alternative_set import *
 from criteria_set import *
 from input_set import *
 from mca_runs import *
+from mca_cache import *
+from scenario_set import *
+from project_repository import *
 from delphos_exceptions import *
 from csv_types import *
 
@@ -34,6 +38,14 @@ from data import default_alternative_data
 from data import default_criteria_data
 
 from evamix.evamix import *
+from evamix.array_evamix import *
+from evamix.rank_acceptability import *
+from evamix.weight_stability import *
+from evamix.criteria_sweep import *
+from evamix.rank_reversal import *
+from evamix.scenario_batch import *
+from evamix.incremental_evamix import *
+from evamix.tiled_executor import *
 from util.common_functions import *
 
 class Project:
@@ -69,8 +81,18 @@ class Project:
         self.crit_set = None    #Primary CriteriaSet
         self.input_table_name = 'input'
         self.input_set = None
+        self.repository = None    #In memory alternatives, criteria and input, see ProjectRepository
+        self.scenario_table_name = 'scenarios'
+        self.scenario_set = None    #Named overlays of input values, see ScenarioSet
         self.mca_runs_table_name = 'mca_runs'
         self.mca_runs = None	#Holds analysis runs for project        
+        self.mca_engine = ArrayEvamix    #Evamix is the (slower) reference implementation
+        self.mca_cache_table_name = 'mca_cache'
+        self.mca_cache = None   #Cache of prepared input and results, see McaCache
+        self.mca_executor = None    #TiledExecutor for multi-process analysis of large projects
+        self.mca_matrix_dir = None    #Directory for memory mapped analysis matrices of large projects
+        self.mca_hooks = []    #StageHook objects timing/tracing each stage of an analysis run
+        self.db_lock = threading.RLock()    #Serializes every write to the DB, analysis runs write from background threads (see McaCache)
         
         #Calculate timezone offset from UTC (greenwich mean time)
         self.utc_offset = time.altzone / 3600
@@ -110,7 +132,10 @@ class Project:
             self.__create_alternative_set(load_default_altern)
             self.__create_criteria_set(load_default_crit)
             self.__create_input_set()
+            self.__create_repository()
+            self.__create_scenario_set()
             self.__create_mca_runs_table()
+            self.__create_mca_cache()
 
         #Cross-platform compatible colors taken from 
         #http://www.tbtf.com/resource/20colors.html
@@ -157,6 +182,30 @@ class Project:
     def get_project_type(self):
         return self.project_data.get_project_type()
 
+    def __create_repository(self):
+        """Loads the alternatives, criteria and input into memory, reads of them
+        are served from the ProjectRepository and changes are written through it
+        """
+        self.repository = ProjectRepository(self.meta, self.altern_set, self.crit_set, self.input_set)
+
+    def write_locked(self, func, *args):
+        """Calls func(*args), which writes to the DB, holding db_lock and returns its result.
+        Each thread has its own DB connection, so writes from the interface and
+        from background analysis runs must not overlap
+        """
+        self.db_lock.acquire()
+        try:
+            return func(*args)
+        finally:
+            self.db_lock.release()
+
+    def get_revision(self):
+        """Returns a number which changes whenever the alternatives, criteria or
+        input of the project change, so that reloading them can be skipped while it
+        stays the same
+        """
+        return self.repository.get_revision()
+
     ################################# Alternatives ##############################
 
     def __create_alternative_set(self, load_default_altern=False):
@@ -177,17 +226,17 @@ class Project:
         
         name (string) - name of alternative
         """
-        self.altern_set.add_alternative(name, color)
+        self.write_locked(self.repository.add_alternative, name, color)
 
     def remove_alternative_by_id(self, alternative_id):
         """Remove alternative from the project AlternativeSet given its unique alternative id
         """
-        return self.altern_set.remove_alternative(alternative_id)
+        return self.write_locked(self.repository.remove_alternative_by_id, alternative_id)
     
     def remove_alternative_by_name(self, alternative_name):
         """Remove alternative from the project AlternativeSet given its unique alternative name
         """
-        return self.altern_set.remove_alternative_by_name(alternative_name)
+        return self.write_locked(self.repository.remove_alternative_by_name, alternative_name)
         
     def get_alternatives_as_string(self):
         """Get a string representation of the projects AlternativeSet
@@ -200,30 +249,30 @@ class Project:
     def get_all_alternatives(self):
         """Returns a list of alternatives in the current project
         """
-        return self.altern_set.get_all_alternatives()
+        return self.repository.get_all_alternatives()
 
     def has_alternatives(self):
         """Returns true if the current project has alternatives loaded
         """
-        if self.altern_set.get_num() > 0:
+        if self.repository.num_alternatives() > 0:
             return True
         else:
             return False
 
     def num_alternatives(self):
         """Returns number of alternatives for project"""
-        if self.altern_set:
-            return self.altern_set.get_num()
+        if self.repository:
+            return self.repository.num_alternatives()
 
     def get_alternative_names(self):
         """Returns list of alternative names for project"""
-        if self.altern_set:
-            return self.altern_set.get_alternative_names()
+        if self.repository:
+            return self.repository.get_alternative_names()
     
     def get_alternative_id_by_name(self, name):
         """Returns alternative id given an alternative name"""
-        if self.altern_set:
-            return self.altern_set.get_alternative_id_by_name(name)
+        if self.repository:
+            return self.repository.get_alternative_id_by_name(name)
 
     def get_next_altern_color(self):
         num_alterns = self.num_alternatives()
@@ -254,20 +303,20 @@ class Project:
         
         tuple of criteria data, see CriteriaSet.add_criteria for expected strucutre
         """
-        self.crit_set.add_criteria(criteria_info)
+        self.write_locked(self.repository.add_criteria, criteria_info)
 
     def edit_criteria(self, crit_id, criteria_info):
-        self.crit_set.edit_criteria(crit_id, criteria_info)
+        self.write_locked(self.repository.edit_criteria, crit_id, criteria_info)
 
     def remove_criteria_by_id(self, criteria_id):
         """Remove criteria from the project CriteriaSet given its unique criteria id
         """
-        return self.crit_set.remove_criteria(criteria_id)
+        return self.write_locked(self.repository.remove_criteria_by_id, criteria_id)
 
     def remove_criteria_by_description(self, description):
         """Remove criteria from the project CriteriaSet given its unique description
         """
-        return self.crit_set.remove_criteria_by_description(description)
+        return self.write_locked(self.repository.remove_criteria_by_description, description)
 
     def get_criteria_as_string(self):
         """Get a string representation of the projects CriteriaSet
@@ -280,29 +329,29 @@ class Project:
     def get_all_criteria(self):
         """Returns a list of criteria in the current project
         """
-        return self.crit_set.get_all_criteria()
+        return self.repository.get_all_criteria()
 
     def has_criteria(self):
         """Returns true if the current project has criteria defined
         """
-        if self.crit_set.get_num() > 0:
+        if self.repository.num_criteria() > 0:
             return True
         else:
             return False
 
     def num_criteria(self):
         """Returns number of alternatives for project"""
-        if self.crit_set:
-            return self.crit_set.get_num()
+        if self.repository:
+            return self.repository.num_criteria()
 
     def get_criteria_id_by_name(self, desc):
         """Returns criteria id given a criteria description"""
-        if self.crit_set:
-            return self.crit_set.get_criteria_id_by_description(desc)
+        if self.repository:
+            return self.repository.get_criteria_id_by_description(desc)
     
     def get_criteria_by_name(self, name):
         if name:
-            return self.crit_set.get_criteria_by_description(name)
+            return self.repository.get_criteria_by_description(name)
 
     ################################# Input ##############################
 
@@ -314,32 +363,77 @@ class Project:
     def get_all_input(self):
         """Returns a list of input for the current project
         """
-        if self.input_set:
-            return self.input_set.get_all_input()
+        if self.repository:
+            return self.repository.get_all_input()
         else:
             return None
 
+    def get_input_matrix(self, altern_ids, crit_ids):
+        """Returns (in_matrix, missing) numpy arrays of the input of the given
+        alternatives (rows) and criteria (columns), see InputSet.get_input_matrix
+        """
+        return self.input_set.get_input_matrix(altern_ids, crit_ids)
+
     def get_input_value(self, altern_id, crit_id):
-        if self.input_set:
-            return self.input_set.get_input_value(altern_id, crit_id)
+        if self.repository:
+            return self.repository.get_input_value(altern_id, crit_id)
         else:
             return None
 
     def update_input_value(self, altern_id, crit_id, value):
         """Updates an input value in the DB"""
-        self.input_set.update(altern_id, crit_id, value)
+        self.write_locked(self.repository.update_input_value, altern_id, crit_id, value)
+
+    def update_input_values(self, input_values):
+        """Updates many input values in the DB in one transaction
+
+        input_values - list of (altern_id, crit_id, value), a value of None removes the input
+        """
+        self.write_locked(self.repository.update_input_values, input_values)
 
     def remove_input_by_alternative(self, alternative_id):
-        return self.input_set.remove_input_by_alternative(alternative_id)
+        self.write_locked(self.scenario_set.remove_input_by_alternative, alternative_id)
+        return self.write_locked(self.repository.remove_input_by_alternative, alternative_id)
 
     def remove_input_by_criteria(self, criteria_id):
-        return self.input_set.remove_input_by_criteria(criteria_id)
+        self.write_locked(self.scenario_set.remove_input_by_criteria, criteria_id)
+        return self.write_locked(self.repository.remove_input_by_criteria, criteria_id)
+
+    ################################# Scenarios ##############################
+
+    def __create_scenario_set(self):
+        self.scenario_set = ScenarioSet(self.meta, self.scenario_table_name)
+
+    def set_scenario(self, name, values):
+        """Stores a scenario, values is a list of (altern_id, crit_id, value)
+        replacing the global input of those pairs
+        """
+        self.write_locked(self.scenario_set.set_scenario, name, values)
+
+    def update_scenario_value(self, name, altern_id, crit_id, value):
+        self.write_locked(self.scenario_set.update_value, name, altern_id, crit_id, value)
+
+    def get_scenario(self, name):
+        return self.scenario_set.get_scenario(name)
+
+    def get_scenario_names(self):
+        return self.scenario_set.get_names()
+
+    def delete_scenario(self, name):
+        self.write_locked(self.scenario_set.delete_scenario, name)
 
     ################################# Analysis ##############################
     
     def __create_mca_runs_table(self):
     	self.mca_runs = McaRuns(self.meta, self.mca_runs_table_name)
 
+    def __create_mca_cache(self):
+        self.mca_cache = McaCache(self.meta, self.mca_cache_table_name, lock=self.db_lock)
+
+    def clear_mca_cache(self):
+        if self.mca_cache:
+            self.mca_cache.clear()
+
     def get_mca_runs_basic(self):
         """Returns a list with basic info about all mca analysis runs for this project
         """
@@ -351,12 +445,150 @@ class Project:
     def get_num_mca_runs(self):
         return self.mca_runs.get_num()
         
-    def run_mca(self, input_data, input_weights, selected_crit_types, selected_crit_bc):
-        evamix = Evamix()
+    def run_mca(self, input_data, input_weights, selected_crit_types, selected_crit_bc, progress=None):
+        """Runs the analysis, see Evamix.do_analysis
+        
+        progress - AnalysisProgress reporting the fraction done and allowing the
+        run to be cancelled, AnalysisCancelled is raised if it is
+        """
+        evamix = self.mca_engine()
+        evamix.hooks = list(self.mca_hooks)
+        evamix.progress = progress
+        if isinstance(evamix, ArrayEvamix):
+            #Impact and final matrices are antisymmetric, only compute and store half
+            evamix.packed = True
+            evamix.executor = self.mca_executor
+            evamix.matrix_dir = self.mca_matrix_dir
+        #Mapped matrices belong to a single run so are not cached
+        if self.mca_cache and isinstance(evamix, ArrayEvamix) and self.mca_matrix_dir is None:
+            return self.mca_cache.run_analysis(evamix, input_data, input_weights, selected_crit_types, selected_crit_bc)
         return evamix.do_analysis(input_data, input_weights, selected_crit_types, selected_crit_bc)
 
+    def get_incremental_mca(self, mca_result_id):
+        """Returns an IncrementalEvamix starting from the state of a stored analysis run
+        
+        Edits (eg. those made through update_input_value) can then be applied to it 
+        and re-scored without a full analysis
+        """
+        mca_run = self.get_mca_run_by_id(mca_result_id)
+        if not mca_run:
+            raise DelphosError, "Analysis run "+str(mca_result_id)+" not found"
+        return incremental_evamix_from_run(mca_run)
+
+    def run_criteria_sweep(self, input_data, input_weights, selected_crit_types, selected_crit_bc, subset_size=None):
+        """Ranks the alternatives with every subset of subset_size criteria (by 
+        default leaving one out).  Returns the CriteriaSweep run, see its
+        get_rank_volatility and get_criteria_influence
+        """
+        sweep = CriteriaSweep(subset_size)
+        sweep.do_analysis(input_data, input_weights, selected_crit_types, selected_crit_bc)
+        return sweep
+
+    def run_rank_reversal(self, input_data, input_weights, selected_crit_types, selected_crit_bc):
+        """Ranks the alternatives with each one left out in turn.  Returns the
+        RankReversal run, see its get_reversals and get_ranks
+        """
+        analysis = RankReversal()
+        analysis.do_analysis(input_data, input_weights, selected_crit_types, selected_crit_bc)
+        return analysis
+
+    def run_scenarios(self, altern_data, crit_data, input_data, input_weights, selected_crit_types, selected_crit_bc, scenario_names=None):
+        """Runs the analysis under each stored scenario, by default all of them.
+        altern_data and crit_data give the ids of the rows and columns of
+        input_data, scenario values for other alternatives and criteria are
+        ignored.  Returns the ScenarioBatch run, see its get_scores and get_summary
+        """
+        if scenario_names is None:
+            scenario_names = self.get_scenario_names()
+        altern_rows = {}
+        for row in range(len(altern_data)):
+            altern_rows[altern_data[row][0]] = row
+        crit_cols = {}
+        for col in range(len(crit_data)):
+            crit_cols[crit_data[col][0]] = col
+        overlays = []
+        for name in scenario_names:
+            values = self.get_scenario(name)
+            if not values:
+                raise DelphosError, "Scenario "+unicode(name)+" not found"
+            overlays.append([(altern_rows[altern_id], crit_cols[crit_id], value) for (altern_id, crit_id, value) in values
+                             if altern_id in altern_rows and crit_id in crit_cols])
+        batch = ScenarioBatch()
+        batch.do_analysis(input_data, overlays, input_weights, selected_crit_types, selected_crit_bc, scenario_names)
+        return batch
+
+    def run_weight_stability(self, mca_result_id):
+        """Computes the weight stability intervals of a stored analysis run and
+        stores them with it, returns them (see WeightStability.get_intervals)
+        """
+        mca_run = self.get_mca_run_by_id(mca_result_id)
+        if not mca_run:
+            raise DelphosError, "Analysis run "+str(mca_result_id)+" not found"
+        (run_id, name, description, altern_data, crit_data, input_data, input_weights, results, created, int_results) = mca_run
+        crit_types = [crit[2] for crit in crit_data]
+        crit_bc = [crit[4] for crit in crit_data]
+        stability = WeightStability().do_analysis(input_data, input_weights, crit_types, crit_bc)
+        self.write_locked(self.mca_runs.set_stability, mca_result_id, stability)
+        return stability
+
+    def get_weight_stability(self, mca_result_id):
+        """Returns the stored weight stability intervals of a run, None if not yet computed"""
+        return self.mca_runs.get_stability(mca_result_id)
+
+    def run_mca_batch(self, input_data, weight_sets, selected_crit_types, selected_crit_bc):
+        """Runs the analysis once per weight set, returns a list of final score lists
+        
+        Preprocessing of the input is shared by the whole batch, see ArrayEvamix.do_batch_scores
+        """
+        evamix = ArrayEvamix()
+        return evamix.do_batch_scores(input_data, weight_sets, selected_crit_types, selected_crit_bc)
+
+    def run_rank_acceptability(self, input_data, input_weights, selected_crit_types, selected_crit_bc, seed=0, weight_spread=0.25, input_spread=0.0):
+        """Runs a Monte Carlo rank acceptability analysis around the given weights
+        
+        Returns list where item [i][r] is the probability alternative i holds rank r, see RankAcceptability
+        """
+        analysis = RankAcceptability(seed, weight_spread, input_spread)
+        return analysis.do_analysis(input_data, input_weights, selected_crit_types, selected_crit_bc)
+
+    def load_weight_sets(self, filename, num_criteria):
+        """Reads a batch of weight sets from a CSV file, one weight set per row
+        and one whole number weight per criterion.  A leading row of criteria
+        names is skipped.  Raises DataImportError on missing or bad values
+        """
+        weight_sets = []
+        weight_file = open(filename, "rb")
+        try:
+            reader = csv.reader(weight_file, "CSV")
+            row_num = 0
+            for row in reader:
+                row_num += 1
+                row = [value.strip() for value in row]
+                if not [value for value in row if value]:
+                    continue
+                if row_num == 1 and not strIsInt(row[0]):
+                    continue
+                if len(row) != num_criteria:
+                    raise DataImportError, "Expected "+str(num_criteria)+" weights in row "+str(row_num)+" but found "+str(len(row))
+                for value in row:
+                    if not strIsInt(value):
+                        raise DataImportError, "Bad weight '"+value+"' in row "+str(row_num)
+                weight_sets.append([int(value) for value in row])
+        finally:
+            weight_file.close()
+        if not weight_sets:
+            raise DataImportError, "No weights found in "+filename
+        return weight_sets
+
     def save_analysis(self, name, description, altern_data, crit_data, input_data, input_weights, results, int_data):        
-        self.mca_runs.insert(name, description, altern_data, crit_data, input_data, input_weights, results, int_data)
+        """Stores an analysis run, returns its id"""
+        return self.write_locked(self.mca_runs.insert, name, description, altern_data, crit_data, input_data, input_weights, results, int_data)
 
     def delete_analysis(self, id):
-        self.mca_runs.delete(id)
\ No newline at end of file
+        mca_run = self.get_mca_run_by_id(id)
+        self.write_locked(self.mca_runs.delete, id)
+        #Remove any memory mapped matrix files of the run
+        if mca_run and mca_run[9]:
+            for matrix in mca_run[9][1:]:
+                if isinstance(matrix, MappedPackedMatrix):
+                    matrix.remove()
\ No newline at end of file
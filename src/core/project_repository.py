@@ -0,0 +1,230 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - in memory copy of the alternatives, criteria and global input of
+# a project, written through to the project DB
+#===============================================================================
+
+import copy
+import pickle
+
+class ProjectRepository(object):
+    """Holds the alternatives, criteria and global input of a project in
+    memory so that reads do not go to the DB.
+
+    The three tables are read once, in one transaction, when the repository
+    is created.  Every change is made through the repository, which writes
+    it to the DB (through the AlternativeSet, CriteriaSet and InputSet) then
+    updates its copy.  Each change increments the revision, so a GUI widget
+    or cache which remembers the revision it last loaded at can skip
+    reloading while it is unchanged.
+
+    The input matrix of an analysis is not built here, InputSet.get_input_matrix
+    pivots it in one query.
+
+    alternatives: [(altern_id, name, color), ...] by altern_id
+    criteria: [[crit_id, description, type, type_options, cost_benefit], ...] by crit_id
+    input: {(altern_id, crit_id): value}
+    """
+    def __init__(self, metadata, altern_set, crit_set, input_set):
+        """repository = ProjectRepository(BoundMetadata, AlternativeSet, CriteriaSet, InputSet)
+
+        metadata - SQLAlchemy metadata object providing access to DB engine and tables
+        """
+        self.metadata = metadata
+        self.altern_set = altern_set
+        self.crit_set = crit_set
+        self.input_set = input_set
+        self.revision = 0
+        self.load()
+
+    def load(self):
+        """Reads all alternatives, criteria and input from the DB in one transaction"""
+        conn = self.metadata.engine.connect()
+        trans = conn.begin()
+        try:
+            altern_table = self.altern_set.table
+            crit_table = self.crit_set.table
+            input_table = self.input_set.table
+            altern_rows = conn.execute(altern_table.select(order_by=[altern_table.c.alternative_id])).fetchall()
+            crit_rows = conn.execute(crit_table.select(order_by=[crit_table.c.criteria_id])).fetchall()
+            input_rows = conn.execute(input_table.select(input_table.c.value != None)).fetchall()
+            trans.commit()
+        except:
+            trans.rollback()
+            conn.close()
+            raise
+        conn.close()
+
+        self.alternatives = [tuple(row) for row in altern_rows]
+        self.criteria = [self.gen_criteria_row(row) for row in crit_rows]
+        self.input = dict([((row[0], row[1]), row[2]) for row in input_rows])
+        self.revision += 1
+
+    def gen_criteria_row(self, row):
+        crit_row = list(row)
+        #The type options are stored pickled, see CriteriaSet.add_criteria
+        crit_row[3] = pickle.loads(crit_row[3])
+        return crit_row
+
+    def get_revision(self):
+        """Returns a number which changes whenever the alternatives, criteria or input change"""
+        return self.revision
+
+    ############################ Alternatives ############################
+
+    def get_all_alternatives(self):
+        return list(self.alternatives)
+
+    def num_alternatives(self):
+        return len(self.alternatives)
+
+    def get_alternative_names(self):
+        return [(altern[1],) for altern in self.alternatives]
+
+    def get_alternative_id_by_name(self, name):
+        for altern in self.alternatives:
+            if altern[1] == name:
+                return altern[0]
+        return None
+
+    def add_alternative(self, name, color):
+        self.altern_set.add_alternative(name, color)
+        self.load_new_alternatives()
+
+    def load_new_alternatives(self):
+        """Reads the alternatives added to the DB since the last read"""
+        table = self.altern_set.table
+        sql = table.select(order_by=[table.c.alternative_id])
+        if self.alternatives:
+            sql = table.select(table.c.alternative_id > self.alternatives[-1][0], order_by=[table.c.alternative_id])
+        self.alternatives.extend([tuple(row) for row in sql.execute().fetchall()])
+        self.revision += 1
+
+    def remove_alternative_by_id(self, alternative_id):
+        result = self.altern_set.remove_alternative_by_id(alternative_id)
+        self.alternatives = [altern for altern in self.alternatives if altern[0] != alternative_id]
+        self.revision += 1
+        return result
+
+    def remove_alternative_by_name(self, alternative_name):
+        result = self.altern_set.remove_alternative_by_name(alternative_name)
+        self.alternatives = [altern for altern in self.alternatives if altern[1] != alternative_name]
+        self.revision += 1
+        return result
+
+    ############################## Criteria ##############################
+
+    def get_all_criteria(self):
+        """Returns a copy of the criteria rows, callers may change them"""
+        return [self.copy_criteria_row(crit) for crit in self.criteria]
+
+    def copy_criteria_row(self, crit):
+        """Copies a criteria row and its type options, which may be a list of [option, value] lists"""
+        crit = list(crit)
+        crit[3] = copy.deepcopy(crit[3])
+        return crit
+
+    def num_criteria(self):
+        return len(self.criteria)
+
+    def get_criteria_id_by_description(self, desc):
+        crit = self.get_criteria_by_description(desc)
+        if crit:
+            return crit[0]
+        return None
+
+    def get_criteria_by_description(self, desc):
+        for crit in self.criteria:
+            if crit[1] == desc:
+                return self.copy_criteria_row(crit)
+        return None
+
+    def add_criteria(self, criteria_info):
+        self.crit_set.add_criteria(criteria_info)
+        self.load_new_criteria()
+
+    def load_new_criteria(self):
+        """Reads the criteria added to the DB since the last read"""
+        table = self.crit_set.table
+        sql = table.select(order_by=[table.c.criteria_id])
+        if self.criteria:
+            sql = table.select(table.c.criteria_id > self.criteria[-1][0], order_by=[table.c.criteria_id])
+        self.criteria.extend([self.gen_criteria_row(row) for row in sql.execute().fetchall()])
+        self.revision += 1
+
+    def edit_criteria(self, crit_id, criteria_info):
+        self.crit_set.edit_criteria(crit_id, criteria_info)
+        (desc, type, type_options, cost_benefit) = criteria_info
+        for i in range(len(self.criteria)):
+            if self.criteria[i][0] == crit_id:
+                self.criteria[i] = [crit_id, desc, type, copy.deepcopy(type_options), cost_benefit]
+        self.revision += 1
+
+    def remove_criteria_by_id(self, criteria_id):
+        result = self.crit_set.remove_criteria(criteria_id)
+        self.criteria = [crit for crit in self.criteria if crit[0] != criteria_id]
+        self.revision += 1
+        return result
+
+    def remove_criteria_by_description(self, description):
+        result = self.crit_set.remove_criteria_by_description(description)
+        self.criteria = [crit for crit in self.criteria if crit[1] != description]
+        self.revision += 1
+        return result
+
+    ################################ Input ###############################
+
+    def get_all_input(self):
+        """Returns list of (altern_id, crit_id, value) ordered by altern_id and crit_id"""
+        keys = self.input.keys()
+        keys.sort()
+        return [(altern_id, crit_id, self.input[(altern_id, crit_id)]) for (altern_id, crit_id) in keys]
+
+    def get_input_value(self, altern_id, crit_id):
+        return self.input.get((altern_id, crit_id))
+
+    def update_input_value(self, altern_id, crit_id, value):
+        self.input_set.update(altern_id, crit_id, value)
+        self.set_input((altern_id, crit_id, value))
+        self.revision += 1
+
+    def update_input_values(self, input_values):
+        """Sets many input values in one transaction, see InputSet.update_many"""
+        self.input_set.update_many(input_values)
+        self.set_input(*input_values)
+        self.revision += 1
+
+    def set_input(self, *input_values):
+        for (altern_id, crit_id, value) in input_values:
+            if value is None:
+                self.input.pop((altern_id, crit_id), None)
+            else:
+                self.input[(altern_id, crit_id)] = value
+
+    def remove_input_by_alternative(self, altern_id):
+        result = self.input_set.remove_input_by_alternative(altern_id)
+        for key in [key for key in self.input if key[0] == altern_id]:
+            del self.input[key]
+        self.revision += 1
+        return result
+
+    def remove_input_by_criteria(self, crit_id):
+        result = self.input_set.remove_input_by_criteria(crit_id)
+        for key in [key for key in self.input if key[1] == crit_id]:
+            del self.input[key]
+        self.revision += 1
+        return result
@@ -0,0 +1,66 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+# 
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2 
+# 
+# This program is free software; you can redistribute it and/or 
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - project unit tests
+#===============================================================================
+
+import unittest
+import shutil
+import tempfile
+from testing_util import new_project
+
+class TestProjectRepository(unittest.TestCase):
+
+    def test_project_repository(self):
+        """test_project_repository - reads served from memory, changes written through to the DB with a new revision
+        """
+        project_dir = tempfile.mkdtemp()
+        try:
+            project = new_project('repository.dlp', project_dir)
+            revision = project.get_revision()
+            project.add_alternative(u'Reef', '#ff0000')
+            project.add_alternative(u'Bay', '#00ff00')
+            project.add_criteria((u'Habitat', u'Ordinal', [[u'Low', 1], [u'High', 2]], u'B'))
+            project.add_criteria((u'Cost', u'Ratio', u'Dollars', u'C'))
+            self.assert_(project.get_revision() > revision)
+            (reef, bay) = [altern[0] for altern in project.get_all_alternatives()]
+            (habitat, cost) = [crit[0] for crit in project.get_all_criteria()]
+            project.update_input_values([(reef, habitat, 2), (bay, habitat, 1), (reef, cost, 40)])
+            project.edit_criteria(cost, (u'Cost', u'Ratio', u'Pesos', u'C'))
+            project.remove_alternative_by_name(u'Bay')
+            project.remove_input_by_alternative(bay)
+
+            revision = project.get_revision()
+            self.assertEqual(project.num_alternatives(), 1)
+            self.assertEqual(project.get_alternative_id_by_name(u'Reef'), reef)
+            self.assertEqual(project.get_criteria_by_name(u'Habitat')[3], [[u'Low', 1], [u'High', 2]])
+            #Changing a returned criterion does not change the repository
+            project.get_criteria_by_name(u'Habitat')[3][0][0] = u'Changed'
+            project.get_all_criteria()[0][3].append([u'Changed', 3])
+            self.assertEqual(project.get_criteria_by_name(u'Habitat')[3], [[u'Low', 1], [u'High', 2]])
+            self.assertEqual(project.get_all_input(), [(reef, habitat, 2), (reef, cost, 40)])
+            self.assertEqual(project.get_revision(), revision)
+
+            #The DB holds the same as memory
+            reopened = new_project('repository.dlp', project_dir)
+            self.assertEqual(reopened.get_all_alternatives(), project.get_all_alternatives())
+            self.assertEqual(reopened.get_all_criteria(), project.get_all_criteria())
+            self.assertEqual(reopened.get_all_input(), project.get_all_input())
+        finally:
+            shutil.rmtree(project_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - stores named scenarios, overlays of input values on the global
+# input data of a project
+#===============================================================================
+
+from sqlalchemy import *
+from delphos_exceptions import *
+
+class ScenarioSet(object):
+    """Maintains the data scenarios of a project (eg. projected catch volumes
+    or cost estimates).
+
+    A scenario is a named set of input values, each for an altern/crit id
+    pair like the global input (see InputSet), which replace the global
+    input values of those pairs when the scenario is evaluated.  A scenario
+    exists while it has at least one value.
+    """
+    def __init__(self, metadata, db_name):
+        """scenario_set = ScenarioSet(BoundMetadata, string)
+
+        metadata - SQLAlchemy metadata object providing access to DB engine and tables
+        db_name - name to give DB table
+        """
+        self.metadata = metadata
+        self.db_name = db_name
+        self.table = None
+
+        #Load scenario table from DB if it exists otherwise create it
+        if self.metadata.engine.has_table(self.db_name):
+            self.table = Table(self.db_name, self.metadata, autoload=True)
+        else:
+            self.__create_table()
+
+    def __create_table(self):
+        """Create a new scenario table in the DB
+        """
+        self.table = self.__get_table_object()
+        self.table.create()
+
+    def __get_table_object(self):
+        """Create scenario Table object (SQLAlchemy)
+        """
+        return Table(self.db_name, self.metadata,
+            Column('scenario', Unicode(200), primary_key=True),
+            Column('altern_id', Integer, primary_key=True),
+            Column('crit_id', Integer, primary_key=True),
+            Column('value', Integer)
+        )
+
+    def set_scenario(self, name, values):
+        """Stores a scenario, replacing any of the same name
+
+        values - list of (altern_id, crit_id, value)
+        """
+        if not name:
+            raise DelphosError, "A scenario must have a name"
+        if not values:
+            raise DelphosError, "Scenario "+unicode(name)+" has no values"
+        self.delete_scenario(name)
+        rows = [{'scenario':unicode(name), 'altern_id':altern_id, 'crit_id':crit_id, 'value':value} for (altern_id, crit_id, value) in values]
+        self.table.insert().execute(*rows)
+
+    def update_value(self, name, altern_id, crit_id, value):
+        """Sets one value of a scenario, a value of None removes it"""
+        self.table.delete(and_(self.table.c.scenario==unicode(name), self.table.c.altern_id==altern_id, self.table.c.crit_id==crit_id)).execute()
+        if value is not None:
+            self.table.insert().execute({'scenario':unicode(name), 'altern_id':altern_id, 'crit_id':crit_id, 'value':value})
+
+    def get_scenario(self, name):
+        """Returns the values of a scenario as a list of (altern_id, crit_id, value),
+        empty if there is no such scenario
+        """
+        rows = self.table.select(self.table.c.scenario==unicode(name), order_by=[self.table.c.altern_id, self.table.c.crit_id]).execute().fetchall()
+        return [(row.altern_id, row.crit_id, row.value) for row in rows]
+
+    def get_names(self):
+        """Returns the list of scenario names in alphabetical order"""
+        rows = select([self.table.c.scenario], distinct=True, order_by=[self.table.c.scenario]).execute().fetchall()
+        return [row[0] for row in rows]
+
+    def delete_scenario(self, name):
+        self.table.delete(self.table.c.scenario==unicode(name)).execute()
+
+    def remove_input_by_alternative(self, altern_id):
+        """Removes the values of an alternative from every scenario"""
+        self.table.delete(self.table.c.altern_id==altern_id).execute()
+
+    def remove_input_by_criteria(self, crit_id):
+        """Removes the values of a criterion from every scenario"""
+        self.table.delete(self.table.c.crit_id==crit_id).execute()
+
+    def __unicode__(self):
+        """Description of object
+        """
+        return "Scenarios"
+
+    def __str__(self):
+        """Description of object
+        """
+        return "Scenarios"
@@ -0,0 +1,66 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+# 
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2 
+# 
+# This program is free software; you can redistribute it and/or 
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - scenario unit tests
+#===============================================================================
+
+import unittest
+import shutil
+import tempfile
+from evamix.array_evamix import ArrayEvamix
+from testing_util import new_project
+
+class TestScenarioSet(unittest.TestCase):
+
+    def test_project_scenarios(self):
+        """test_project_scenarios - scenarios stored in a project and run over its input
+        """
+        project_dir = tempfile.mkdtemp()
+        try:
+            project = new_project('scenarios.dlp', project_dir)
+            for i in range(3):
+                project.add_alternative(u'Alternative %d' % i, '#ff0000')
+            project.add_criteria((u'Catch', u'Ratio', u'Tonnes', u'B'))
+            project.add_criteria((u'Cost', u'Ratio', u'Dollars', u'C'))
+            altern_data = project.get_all_alternatives()
+            crit_data = project.get_all_criteria()
+            (a0, a1, a2) = [altern[0] for altern in altern_data]
+            (catch, cost) = [crit[0] for crit in crit_data]
+            in_matrix = [[10, 5], [20, 8], [30, 9]]
+
+            project.set_scenario(u'Low catch', [(a2, catch, 12), (a1, cost, 4)])
+            project.set_scenario(u'High cost', [(a0, cost, 20)])
+            project.update_scenario_value(u'High cost', a2, cost, 1)
+            self.assertEqual(project.get_scenario_names(), [u'High cost', u'Low catch'])
+            self.assertEqual(project.get_scenario(u'High cost'), [(a0, cost, 20), (a2, cost, 1)])
+
+            batch = project.run_scenarios(altern_data, crit_data, in_matrix, [1, 1], ["Ratio", "Ratio"], ["B", "C"])
+            expected = [ArrayEvamix().do_scores([[10, 20], [20, 8], [30, 1]], [1, 1], ["Ratio", "Ratio"], ["B", "C"]),
+                        ArrayEvamix().do_scores([[10, 5], [20, 4], [12, 9]], [1, 1], ["Ratio", "Ratio"], ["B", "C"])]
+            scores = batch.get_scores()
+            for s in range(2):
+                for i in range(3):
+                    self.assertAlmostEqual(scores[s][i], expected[s][i], 12)
+
+            project.remove_input_by_criteria(cost)
+            self.assertEqual(project.get_scenario(u'High cost'), [])
+            project.delete_scenario(u'Low catch')
+            self.assertEqual(project.get_scenario_names(), [])
+        finally:
+            shutil.rmtree(project_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+# 
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2 
+# 
+# This program is free software; you can redistribute it and/or 
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - helpers shared by the unit tests
+#===============================================================================
+
+from sqlalchemy import *
+from project import Project
+
+def new_project(name, path):
+    """Creates a Project, clearing the mappers of any earlier one as ProjectManager does"""
+    clear_mappers()
+    return Project(name, path)
@@ -34,4 +34,9 @@ class DataImportError(DelphosError):
 	Example scenario is the user imports data that is not of the right dimension, an alternative is
 	missing.
 	"""
+	pass
+
+class AnalysisCancelled(DelphosError):
+	"""Raised when an analysis run is cancelled through its AnalysisProgress
+	"""
 	pass
\ No newline at end of file
@@ -72,14 +72,14 @@ class InputGlobalTableWidget(QTableWidget):
                 column = j                   
                 
                 #Insert row headers 
-                if row is 0:
+                if row == 0:
                     header_item = QTableWidgetItem()
                     #header_item.setSizeHint(QSize(self.horizontal_header_width, header_item.sizeHint().height()))        
                     header_item.setText(altern_name)
                     header_item.setToolTip(altern_name)
                     self.setHorizontalHeaderItem(column, header_item)
                 #Insert column headers
-                if column is 0: 
+                if column == 0: 
                     header_item = QTableWidgetItem()
                     header_item.setSizeHint(QSize(self.vertical_header_width, header_item.sizeHint().height()))
                     header_item.setText(crit_name)
@@ -163,9 +163,10 @@ class InputGlobalTableWidget(QTableWidget):
         return new_input_vals
 
     def save_input_data(self, input_required=False):
-        """Validates input and signals with changed input cell values.  
+        """Validates input and signals with the input cell values.  
         
-        update_input_value signal is sent for each cell that is changed.
+        update_input_values signal is sent once with an (altern_id, crit_id, value)
+        for every cell, so that they are all saved together
         """
         if not self.crit_data or not self.altern_data:
             return False
@@ -176,7 +177,8 @@ class InputGlobalTableWidget(QTableWidget):
             QMessageBox.critical(self,self.input_error_text, unicode(e.value))
             return False
         else:
-            #Traverse again updating each cell value in DB and creating new input_set
+            #Traverse again collecting each cell value to update in DB
+            input_values = []
             for i in range(self.num_rows):
                 (crit_id, crit_name, crit_type, crit_options_units, cost_benefit) = self.crit_data[i]
                 row = i
@@ -185,7 +187,8 @@ class InputGlobalTableWidget(QTableWidget):
                     column = j
     
                     new_value = new_input_vals[row][column]
-                    self.emit(SIGNAL("update_input_value"), altern_id, crit_id, new_value)
+                    input_values.append((altern_id, crit_id, new_value))
+            self.emit(SIGNAL("update_input_values"), input_values)
         return True
         
     def get_combo_value(self, row, column):
@@ -26,6 +26,7 @@ from PyQt4.QtGui import *
 
 from util.common_functions import *
 from delphos_exceptions import *
+from core.evamix.input_validation import MISSING, NON_INTEGER, BAD_OPTION, SAME_VALUES, SAME_QUAL_VALUES
 
 class InputMcaTableWidget(QTableWidget):
     def __init__(self, parent=None):
@@ -64,14 +65,14 @@ class InputMcaTableWidget(QTableWidget):
             (crit_id, crit_name, crit_type, crit_options_units, cost_benefit) = crit_data
                         
             #Insert row headers 
-            if row is 0:
+            if row == 0:
                 header_item = QTableWidgetItem()
                 #header_item.setSizeHint(QSize(self.horizontal_header_width, header_item.sizeHint().height()))        
                 header_item.setText(altern_name)
                 header_item.setToolTip(altern_name)
                 self.setHorizontalHeaderItem(column, header_item)
             #Insert column headers
-            if column is 0: 
+            if column == 0: 
                 header_item = QTableWidgetItem()
                 header_item.setSizeHint(QSize(self.vertical_header_width, header_item.sizeHint().height()))
                 header_item.setText(crit_name)
@@ -96,7 +97,7 @@ class InputMcaTableWidget(QTableWidget):
                 try:
                     self.set_combo_value(row, column, crit_options_units, input_value)
                 except InputError, e:
-                    QMessageBox.critical(self, self.combo_error_text, unicode(e)+self.missing_invalid_text+" "+unicode(row+1)+" '"+unicode(crit_name)+"', "+self.combo_column+" "+unicode(column+1)+" '"+unicode(altern_name)+"'")
+                    QMessageBox.critical(self, self.combo_error_text, unicode(e)+", "+self.combo_row+" "+unicode(row+1)+" '"+unicode(crit_name)+"', "+self.combo_column+" "+unicode(column+1)+" '"+unicode(altern_name)+"'")
                     return False
                 
             elif crit_type == "Ratio":
@@ -109,53 +110,37 @@ class InputMcaTableWidget(QTableWidget):
         return True      
         
     def get_input_data(self, input_required, new_input_data=None):
-        """Returns a new InputDataSet with updated values
+        """Returns a new InputDataSet with updated values.  The values are not
+        checked here, missing or invalid values are left in the set for 
+        InputDataSet.check_input to report all at once
         """
         #Get and traverse input data
-        cell_data = new_input_data.get_cell_data()
-        for i in range(len(cell_data)):
-            #Unpack input data set row
-            (altern_data, crit_data, row, column, input_value) = cell_data[i]
-            #Unpack altern data
-            (altern_id, altern_name, altern_color) = altern_data       
-            #Unpack crit data
-            (crit_id, crit_name, crit_type, crit_options_units, cost_benefit) = crit_data  
-        
-            value = 0
+        for i in range(new_input_data.get_num_cells()):
+            crit_type = new_input_data.get_crit_type(i)
+            row = new_input_data.get_row(i)
+            column = new_input_data.get_col(i)
+            value = None
             if crit_type == "Ordinal" or crit_type == "Binary":
-                try:
-                    value = self.get_combo_value(row, column, input_required)
-                except InputError, e:
-                    raise DelphosError, unicode(e)+self.missing_invalid_text+unicode(row+1)+": "+unicode(crit_name)+", "+self.combo_column+" "+unicode(column+1)+": "+unicode(altern_name)+". "+self.input_required_text
-                    return False
-                
+                value = self.get_combo_value(row, column)
             elif crit_type == "Ratio":
-                try:                    
-                    value = self.get_cell_value(row, column)
-                except InputError, e:
-                    raise DelphosError, unicode(e)+self.ratio_error_text+" "+unicode(row+1)+": "+unicode(crit_name)+", "+self.combo_column+" "+unicode(column+1)+": "+unicode(altern_name)+". "+self.input_required_text
-                    return False
-                
-            if value == None and input_required:
-                raise DelphosError, self.missing_invalid_text+" "+unicode(row)+" '"+unicode(crit_name)+"', "+self.combo_column+" "+unicode(column)+" '"+unicode(altern_name)+"'"
-
+                value = self.get_cell_value(row, column)
             new_input_data.set_value(i, value)
         return new_input_data
 
-    def get_combo_value(self, row, column, input_required):
-        #Get value from combo box
+    def get_error_messages(self, input_data, errors):
+        """Returns the translated message of each error found by
+        InputDataSet.validate, naming its row and column
+        """
+        return input_data.get_error_messages(errors, self.error_templates)
+
+    def get_combo_value(self, row, column):
+        """Returns the option value selected in a combo box, None if none is"""
         cell_widget = self.cellWidget(row, column)
-        #print cell_widget
         if not cell_widget:
-            raise InputError, self.combo_access_error
+            raise DelphosError, self.combo_access_error
         (value, ok) = cell_widget.itemData(cell_widget.currentIndex()).toInt()
-        if not value and input_required:
-            raise InputError, self.missing_text+" "+unicode(row)+", "+self.combo_column+" "+unicode(column)
-        if not ok and input_required:
-            raise InputError, self.non_integer_error+" "+unicode(value)
-        #print "value: "+unicode(value)
-        #print "ok: "+unicode(ok)   
-        #Save the value from i,j to j,i
+        if not ok or not value:
+            return None
         return value
     
     def set_combo_value(self, row, column, crit_options_units, input_value):
@@ -178,24 +163,16 @@ class InputMcaTableWidget(QTableWidget):
     
     
     def get_cell_value(self, row, column):
-        #Get value from table item
+        """Returns the integer in a table item, None if it is empty or its 
+        text if it is not an integer
+        """
         table_item = self.item(row,column) 
-        #print table_item
         value = table_item.text()
         #Check for no value
         if not value:
-            #print i
-            #print j
-            #print crit_names
-            #print altern_names
             return None       
-        #Check for non-integer
         if not strIsInt(value):
-            raise InputError, self.non_integer_error+unicode(value)
-        #print "value: "+unicode(value)
-        #print "from i:"+unicode(i)+" j:"+unicode(j)
-        #Save the value from i,j to j,i
-        #print "into: i:"+unicode(j)+", j:"+unicode(i)
+            return unicode(value)
         return int(value)
 
     def set_cell_value(self, row, column, value=None):
@@ -212,13 +189,16 @@ class InputMcaTableWidget(QTableWidget):
         self.combo_row = QApplication.translate("InputMcaTableWidget", "Row", "", QApplication.UnicodeUTF8)
         self.combo_column = QApplication.translate("InputMcaTableWidget", "Column", "", QApplication.UnicodeUTF8)
         self.input_error_text = QApplication.translate("InputMcaTableWidget", "Input Error", "error name", QApplication.UnicodeUTF8)
-        self.missing_invalid_text = QApplication.translate("InputMcaTableWidget", "Missing or Invalid input in Row", "", QApplication.UnicodeUTF8)
-        self.ratio_error_text = QApplication.translate("InputMcaTableWidget", "Ratio value must be greater than zero in Row", "", QApplication.UnicodeUTF8)
-        self.missing_text = QApplication.translate("InputMcaTableWidget", "Missing input for row", "", QApplication.UnicodeUTF8)
         self.combo_access_error = QApplication.translate("InputMcaTableWidget", "Unable to access combo box", "", QApplication.UnicodeUTF8)
-        self.non_integer_error = QApplication.translate("InputMcaTableWidget", "Invalid input, expected an integer but found:", "", QApplication.UnicodeUTF8)
         self.invalid_option_text = QApplication.translate("InputMcaTableWidget", "Invalid option:", "", QApplication.UnicodeUTF8)        
-        self.input_required_text = "Input is required for each cell in order to perform analysis"
+        #Messages of the errors found by InputDataSet.validate, see input_validation.error_templates
+        self.error_templates = {
+            MISSING: QApplication.translate("InputMcaTableWidget", "Missing input in row %(crit)s, column %(altern)s", "", QApplication.UnicodeUTF8),
+            NON_INTEGER: QApplication.translate("InputMcaTableWidget", "Invalid input in row %(crit)s, column %(altern)s, expected an integer but found: %(value)s", "", QApplication.UnicodeUTF8),
+            BAD_OPTION: QApplication.translate("InputMcaTableWidget", "Invalid option in row %(crit)s, column %(altern)s: %(value)s", "", QApplication.UnicodeUTF8),
+            SAME_VALUES: QApplication.translate("InputMcaTableWidget", "The quantitative values in row %(crit)s are all the same.  This is not supported.  At least one of the values must differ from the rest for each row.", "", QApplication.UnicodeUTF8),
+            SAME_QUAL_VALUES: QApplication.translate("InputMcaTableWidget", "The criteria values are the same for each alternative.  This is not supported.  The values on at least one row must differ in their value.", "", QApplication.UnicodeUTF8),
+        }
         
 if __name__ == "__main__":
     arr = initialize_int_array(2,4)
@@ -65,14 +65,14 @@ class InputResultViewTableWidget(QTableWidget):
             (crit_id, crit_name, crit_type, crit_options_units, cost_benefit) = crit_data
                         
             #Insert row headers 
-            if row is 0:
+            if row == 0:
                 header_item = QTableWidgetItem()
                 #header_item.setSizeHint(QSize(self.horizontal_header_width, header_item.sizeHint().height()))        
                 header_item.setText(altern_name)
                 header_item.setToolTip(altern_name)
                 self.setHorizontalHeaderItem(column, header_item)
             #Insert column headers
-            if column is 0: 
+            if column == 0: 
                 header_item = QTableWidgetItem()
                 header_item.setSizeHint(QSize(self.vertical_header_width, header_item.sizeHint().height()))
                 header_item.setText(crit_name)
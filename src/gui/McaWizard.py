@@ -30,6 +30,7 @@ from mca_wizard_ui import Ui_McaWizard
 from util.common_functions import *
 from util.unicode_csv import *
 from core.input_data_set import *
+from core.evamix.input_validation import SAME_VALUES, SAME_QUAL_VALUES
 from core.input_weight_set import *
 
 class McaWizard(QDialog, Ui_McaWizard):
@@ -237,9 +238,10 @@ class McaWizard(QDialog, Ui_McaWizard):
         elif not self.input_data:
             #Create input set
             self.input_data = InputDataSet(self.selected_altern_data, self.selected_crit_data)
-            saved_input = self.project.get_all_input()
-            if saved_input:
-                self.input_data.load_values(saved_input)
+            altern_ids = [altern[0] for altern in self.selected_altern_data]
+            crit_ids = [crit[0] for crit in self.selected_crit_data]
+            (saved_input, missing) = self.project.get_input_matrix(altern_ids, crit_ids)
+            self.input_data.load_mca_input(saved_input, missing)
         else:
             #Update input set with any changes in criteria/alternatives
             self.input_data.update_headings(self.selected_altern_data, self.selected_crit_data)
@@ -263,38 +265,27 @@ class McaWizard(QDialog, Ui_McaWizard):
         except DelphosError, e:
             QMessageBox.critical(self,self.input_error, unicode(e.value))
         else:
+            #Check the whole grid at once, rows with one value only matter going forward
+            if not self.input_data_checks(new_input_data, input_required, direction == "forward"):
+                return False
             #Replace old input data with latest known good input data
             self.input_data = new_input_data
         
             if direction == "forward":  
-                #Get lists describing which columns (criteria) in in_matrix are quantitative and which are qualitative
-                #(quant_cols, qual_cols) = self.gen_crit_type_lists(self.selected_crit_types)
-                #num_qual_criteria = len(qual_cols)
-                #num_quant_criteria = len(quant_cols)
-                
-                if self.input_data:
-                        success = self.input_data_checks()
-                        if success:
-                            #for row in self.input_data
-                            #    print row
-                            self.next_click()
+                self.next_click()
             else:
                 return True
 
-    def input_data_checks(self):
-        try:
-            self.input_data.check_quant_rows()
-        except InputError, e:
-            QMessageBox.critical(self,self.input_error, self.all_same_error+". "+unicode(e.value))
-            return False
-
-        try:
-            self.input_data.check_qual_rows()
-        except InputError, e:
-            QMessageBox.critical(self,self.input_error, self.all_same_error+". "+unicode(e.value))
-            return False
-
-        return True
+    def input_data_checks(self, input_data, input_required, check_same):
+        """Validates input_data in one pass, showing every error found.  Returns True if valid"""
+        errors = input_data.validate(input_required, check_same)
+        if not errors:
+            return True
+        message = "\n".join(self.input_table.get_error_messages(input_data, errors))
+        if [error for error in errors if error[0] in (SAME_VALUES, SAME_QUAL_VALUES)]:
+            message = self.all_same_error+".\n"+message
+        QMessageBox.critical(self,self.input_error, message)
+        return False
         
     ########################## Input Weights #########################
 
@@ -374,11 +365,11 @@ class McaWizard(QDialog, Ui_McaWizard):
         """
         ok = False
         if self.cur_index < index:
-            if index is 2:
+            if index == 2:
                 self.setup_data_input()
-            elif index is 3:
+            elif index == 3:
                 self.setup_weight_input()
-            elif index is 4:
+            elif index == 4:
                 self.setup_run()
                 
         self.cur_index = index
@@ -113,8 +113,16 @@ class GuiManager(QObject):
         sys.exit(self.qapp.exec_())
 
     def stop_gui(self):
+        self.stop_project_analyses()
         self.qapp.closeAllWindows()
 
+    def stop_project_analyses(self):
+        """Cancels the background analyses of the project displayed and waits
+        for them to stop, before the project is closed
+        """
+        if getattr(self, 'project_view', None) is not None:
+            self.project_view.mca_queue.wait_all()
+
     def get_started(self):
         """Loads dialog allowing user to select overall project type (eg. Fisheries, MPAs)
         """
@@ -240,6 +248,7 @@ class GuiManager(QObject):
         project_filename, project_path, project_type, load_default_altern, load_default_crit = args
         try:
             self.set_status_bar(self.create_str)
+            self.stop_project_analyses()
             self.project_manager.create_project(project_filename, project_path, project_type, load_default_altern, load_default_crit, self.config_manager.get_language())
         except (DelphosError, exceptions.DBAPIError), e:
             self.clear_status_bar()
@@ -263,6 +272,7 @@ class GuiManager(QObject):
         project_filename, project_path = args
         try:
             self.clear_status_bar()
+            self.stop_project_analyses()
             self.project_manager.open_project(project_filename, project_path)
         except DelphosError, e:
             self.clear_status_bar()
@@ -0,0 +1,189 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - runs analyses in background threads so the interface stays
+# responsive, reporting progress and results through signals
+#===============================================================================
+
+import copy
+
+from PyQt4.QtCore import *
+
+from core.evamix.analysis_pipeline import AnalysisProgress
+from delphos_exceptions import *
+
+class McaRunJob(object):
+    """One analysis run waiting for or running in a McaWorker.  Holds the
+    wizard input and, once finished, the results or the error message
+    """
+    def __init__(self, name, description, altern_data, crit_data, input_data, input_weights, selected_crit_types, selected_crit_bc, wizard=None):
+        self.name = name
+        self.description = description
+        self.altern_data = altern_data
+        self.crit_data = crit_data
+        self.input_data = input_data
+        self.input_weights = input_weights
+        self.selected_crit_types = selected_crit_types
+        self.selected_crit_bc = selected_crit_bc
+        self.wizard = wizard
+
+        self.progress = None
+        self.fraction = 0.0
+        self.eta = None
+        self.final_scores = None
+        self.int_data = None
+        self.error = None
+
+    def cancel(self):
+        if self.progress is not None:
+            self.progress.cancel()
+
+class McaWorker(QThread):
+    """Runs one McaRunJob through Project.run_mca in its own thread.
+
+    Emits (with the job as first argument):
+    mca_run_progress(job, fraction, eta) - as the run progresses
+    mca_run_finished(job, run_id) - the results are saved as run run_id,
+    None if the run gave no scores
+    mca_run_failed(job, message)
+    mca_run_cancelled(job)
+
+    Signals cross to the receiver's thread so the slots may use the interface.
+    The results are saved here too, pickling and storing the matrices of a
+    large run would otherwise hold up the interface.
+    """
+    def __init__(self, project, job, parent=None):
+        QThread.__init__(self, parent)
+        self.project = project
+        self.job = job
+        job.progress = AnalysisProgress(self.report_progress)
+
+    def report_progress(self, fraction, eta):
+        #Only signal steps of a tenth of a percent, the engine reports every row or tile
+        step = int(fraction*1000)
+        if step == int(self.job.fraction*1000):
+            return
+        self.job.fraction = fraction
+        self.job.eta = eta
+        self.emit(SIGNAL("mca_run_progress"), self.job, fraction, eta)
+
+    def run(self):
+        job = self.job
+        try:
+            input_weights_copy = copy.deepcopy(job.input_weights)
+            [job.final_scores, job.int_data] = self.project.run_mca(job.input_data, input_weights_copy, job.selected_crit_types, job.selected_crit_bc, job.progress)
+            run_id = None
+            if job.final_scores:
+                #save_analysis holds the project's db_lock
+                run_id = self.project.save_analysis(job.name, job.description, job.altern_data, job.crit_data, job.input_data, job.input_weights, job.final_scores, job.int_data)
+        except AnalysisCancelled:
+            self.emit(SIGNAL("mca_run_cancelled"), job)
+        except DelphosError, e:
+            job.error = e
+            self.emit(SIGNAL("mca_run_failed"), job, unicode(e.value))
+        except Exception, e:
+            #Any other error must still reach the receiver, the thread would
+            #otherwise end with the job neither finished nor failed
+            job.error = e
+            self.emit(SIGNAL("mca_run_failed"), job, unicode(e))
+        else:
+            self.emit(SIGNAL("mca_run_finished"), job, run_id)
+
+class McaRunQueue(QObject):
+    """Queue of analysis runs, up to max_workers of them run at once each in
+    a McaWorker and the rest wait their turn.
+
+    Runs share the project and its DB, the McaCache is read and written
+    during a run and the results are saved at its end.  The project's
+    db_lock serializes those writes so several runs can go at once.
+
+    Passes on the signals of its workers (see McaWorker) and emits
+    mca_queue_changed() when runs are added, started or done
+    """
+    def __init__(self, project, max_workers=2, parent=None):
+        QObject.__init__(self, parent)
+        self.project = project
+        self.max_workers = max_workers
+        self.waiting = []
+        self.workers = []
+
+    def add_run(self, job):
+        self.waiting.append(job)
+        self.start_waiting()
+        self.emit(SIGNAL("mca_queue_changed"))
+
+    def start_waiting(self):
+        while self.waiting and len(self.workers) < self.max_workers:
+            job = self.waiting.pop(0)
+            worker = McaWorker(self.project, job, self)
+            self.connect(worker, SIGNAL("mca_run_progress"), self.pass_progress)
+            self.connect(worker, SIGNAL("mca_run_finished"), self.pass_finished)
+            self.connect(worker, SIGNAL("mca_run_failed"), self.pass_failed)
+            self.connect(worker, SIGNAL("mca_run_cancelled"), self.pass_cancelled)
+            self.connect(worker, SIGNAL("finished()"), self.worker_done)
+            self.workers.append(worker)
+            worker.start()
+
+    def worker_done(self):
+        for worker in list(self.workers):
+            if worker.isFinished():
+                self.workers.remove(worker)
+                worker.deleteLater()
+        self.start_waiting()
+        self.emit(SIGNAL("mca_queue_changed"))
+
+    def pass_progress(self, job, fraction, eta):
+        self.emit(SIGNAL("mca_run_progress"), job, fraction, eta)
+
+    def pass_finished(self, job, run_id):
+        self.emit(SIGNAL("mca_run_finished"), job, run_id)
+
+    def pass_failed(self, job, message):
+        self.emit(SIGNAL("mca_run_failed"), job, message)
+
+    def pass_cancelled(self, job):
+        self.emit(SIGNAL("mca_run_cancelled"), job)
+
+    def get_running(self):
+        return [worker.job for worker in self.workers]
+
+    def get_num_runs(self):
+        """Number of runs waiting or running"""
+        return len(self.waiting) + len(self.workers)
+
+    def get_fraction(self):
+        """Fraction of the waiting and running runs complete, each run counting equally"""
+        num_runs = self.get_num_runs()
+        if num_runs == 0:
+            return 1.0
+        return sum([job.fraction for job in self.get_running()]) / num_runs
+
+    def cancel_all(self):
+        """Drops the waiting runs and cancels those running, which emit
+        mca_run_cancelled once they have stopped
+        """
+        for job in self.waiting:
+            self.emit(SIGNAL("mca_run_cancelled"), job)
+        self.waiting = []
+        for job in self.get_running():
+            job.cancel()
+        self.emit(SIGNAL("mca_queue_changed"))
+
+    def wait_all(self):
+        """Cancels all runs and blocks until their threads have stopped"""
+        self.cancel_all()
+        for worker in self.workers:
+            worker.wait()
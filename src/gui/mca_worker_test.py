@@ -0,0 +1,94 @@
+#===============================================================================
+# Delphos - a decision-making tool for community-based marine conservation.
+#
+# @copyright	2007 Ecotrust
+# @author		Tim Welch
+# @contact		twelch at ecotrust dot org
+# @license		GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.  The full license for this distribution
+# has been made available in the file LICENSE.txt
+#
+# $Id$
+#
+# @summary - background analysis run unit tests
+#===============================================================================
+
+import sys
+import threading
+import unittest
+
+from PyQt4.QtCore import *
+
+from mca_worker import McaRunJob, McaRunQueue
+
+class OverlapProject(object):
+    """Stands in for a Project, each run waits until num_runs runs are in
+    run_mca at once (or the wait times out) and records how many were
+    """
+    def __init__(self, num_runs):
+        self.num_runs = num_runs
+        self.db_lock = threading.RLock()
+        self.lock = threading.Lock()
+        self.all_running = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        self.saved = []
+
+    def run_mca(self, input_data, input_weights, selected_crit_types, selected_crit_bc, progress=None):
+        self.lock.acquire()
+        try:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            if self.running == self.num_runs:
+                self.all_running.set()
+        finally:
+            self.lock.release()
+        self.all_running.wait(5)
+        self.lock.acquire()
+        try:
+            self.running -= 1
+        finally:
+            self.lock.release()
+        return [[1.0], None]
+
+    def save_analysis(self, name, description, altern_data, crit_data, input_data, input_weights, results, int_data):
+        self.db_lock.acquire()
+        try:
+            self.saved.append(name)
+            return len(self.saved)
+        finally:
+            self.db_lock.release()
+
+class TestMcaRunQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+    def test_runs_overlap(self):
+        """test_runs_overlap - two queued runs are in run_mca at the same time and both are saved by their workers
+        """
+        project = OverlapProject(2)
+        queue = McaRunQueue(project)
+        finished = []
+        def run_finished(job, run_id):
+            finished.append((job.name, run_id))
+        def queue_changed():
+            if queue.get_num_runs() == 0:
+                self.app.quit()
+        QObject.connect(queue, SIGNAL("mca_run_finished"), run_finished)
+        QObject.connect(queue, SIGNAL("mca_queue_changed"), queue_changed)
+        for name in [u'First', u'Second']:
+            queue.add_run(McaRunJob(name, u'', [], [], [], [], [], []))
+        QTimer.singleShot(10000, self.app.quit)
+        self.app.exec_()
+
+        self.assertEqual(project.max_running, 2)
+        self.assertEqual(sorted(project.saved), [u'First', u'Second'])
+        self.assertEqual(sorted([run_id for (name, run_id) in finished]), [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,6 +28,7 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
 from core.input_data_set import InputDataSet
+from core.evamix.packed_matrix import get_matrix_column
 
 from util.unicode_csv import *
 from util.common_functions import *
@@ -41,6 +42,7 @@ from McaResultView import McaResultView
 from yes_no_dialog import YesNoDialog
 from mca_rerun_dialog import McaRerunDialog
 from export_analysis_dialog import ExportAnalysisDialog
+from mca_worker import McaRunJob, McaRunQueue
 
 class ProjectViewDialog(QDialog, Ui_ProjectView):
     """Manages interaction with the project interface and the underlying DB
@@ -56,9 +58,11 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         self.input_data = None
 
         self.cur_tab = 0
+        self.input_revision = None    #Project revision the input table was loaded at
 
         self.default_template_extension = "csv"
         self.output_encoding = 'latin-1'
+        self.max_analysis_runs = 2    #Analyses run at once, the rest wait in the queue
         
         QObject.connect(self.add_altern_button,QtCore.SIGNAL("clicked()"), self.start_add_alternative)
         QObject.connect(self.remove_altern_button,QtCore.SIGNAL("clicked()"), self.start_remove_alternative)
@@ -70,6 +74,17 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         QObject.connect(self.export_analysis_button,QtCore.SIGNAL("clicked()"), self.start_export_analysis)
         QObject.connect(self.delete_analysis_button,QtCore.SIGNAL("clicked()"), self.start_delete_analysis)
         QObject.connect(self.new_analysis_button,QtCore.SIGNAL("clicked()"), self.start_new_analysis)
+        QObject.connect(self.cancel_analysis_button,QtCore.SIGNAL("clicked()"), self.cancel_analyses)
+
+        #Analyses run in the background, see McaRunQueue
+        self.mca_queue = McaRunQueue(self.project, max_workers=self.max_analysis_runs, parent=self)
+        self.connect(self.mca_queue, SIGNAL("mca_run_progress"), self.update_analysis_progress)
+        self.connect(self.mca_queue, SIGNAL("mca_run_finished"), self.finish_analysis_run)
+        self.connect(self.mca_queue, SIGNAL("mca_run_failed"), self.fail_analysis_run)
+        self.connect(self.mca_queue, SIGNAL("mca_run_cancelled"), self.cancel_analysis_run)
+        self.connect(self.mca_queue, SIGNAL("mca_queue_changed"), self.update_analysis_queue)
+        self.analysis_progress_bar.hide()
+        self.cancel_analysis_button.hide()
 
         QObject.connect(self.help_test,QtCore.SIGNAL("clicked()"), self.help_test_click)        
         self.connect(self.help_define_alternatives, SIGNAL("help_button_clicked"), self.gui_manager.win.process_help_click)
@@ -78,7 +93,7 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         self.connect(self.help_8_run_analysis, SIGNAL("help_button_clicked"), self.gui_manager.win.process_help_click)
         self.connect(self.help_run_the_program, SIGNAL("help_button_clicked"), self.gui_manager.win.process_help_click)
 
-        self.connect(self.input_table, SIGNAL("update_input_value"), self.project.update_input_value)
+        self.connect(self.input_table, SIGNAL("update_input_values"), self.project.update_input_values)
         self.connect(self.input_table, SIGNAL("update_input_complete"), self.load_data_input)
         self.connect(self.input_table, SIGNAL("input_changed"), self.enable_input_save)
 
@@ -235,6 +250,7 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         success = self.input_table.save_input_data()
         if success:
             self.save_button.setDisabled(True)
+            self.input_revision = self.project.get_revision()
         self.gui_manager.clear_status_bar()
 
     def load_data_input(self):
@@ -243,6 +259,8 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         all_criteria = self.project.get_all_criteria()
         all_input = self.project.get_all_input()
         self.input_table.load(all_alternatives, all_criteria, all_input)
+        #Project revision the input table shows
+        self.input_revision = self.project.get_revision()
         #Loading of input will trigger enabling of save button, needs to default to diabled
         self.disable_input_save()
         self.gui_manager.clear_status_bar()
@@ -390,7 +408,7 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
                 except csv.Error, e:
                     QMessageBox.critical(self,self.import_error, self.import_error_msg)                    
                 else:
-                    if i is not 0:
+                    if i != 0:
                         #append all but first two columns to end of existing list
                         import_list.append(row[2:])
                       
@@ -414,7 +432,14 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
             #Reload the input_table
             success = self.input_table.load(altern_data, crit_data, self.input_data)
             if success:
-                QMessageBox.information(self,self.import_success, self.import_success_msg)
+                #Validate and save the whole import at once, as the save button does
+                if self.input_table.save_input_data():
+                    self.disable_input_save()
+                    self.input_revision = self.project.get_revision()
+                    QMessageBox.information(self,self.import_success, self.import_success_msg)
+                else:
+                    #Imported values stay in the table to be corrected and saved
+                    self.enable_input_save()
             else :
                 QMessageBox.critical(self,self.import_error, self.import_error_msg)
 
@@ -468,28 +493,52 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         self.gui_manager.clear_status_bar()
             
     def finish_new_analysis(self, altern_data, crit_data, input_data, input_weights, selected_crit_types, selected_crit_bc):
-        try:
-            input_weights_copy = copy.deepcopy(input_weights)
-            self.gui_manager.set_status_bar(self.process_str)
-            [final_scores, int_data] = self.project.run_mca(input_data, input_weights_copy, selected_crit_types, selected_crit_bc)
-        except DelphosError, e:
-            self.gui_manager.clear_status_bar()
-            QMessageBox.critical(self,self.analysis_error, str(e))
-        except ZeroDivisionError, e:
-            self.gui_manager.clear_status_bar()
-            QMessageBox.critical(self,self.analysis_error, self.div_zero_error+": "+str(e))
+        """Queues the analysis collected by the wizard to run in the background,
+        the wizard is hidden until the run is done and shown again if it fails
+        """
+        job = McaRunJob(self.analysis_name, self.analysis_description, altern_data, crit_data, input_data, input_weights,
+                        selected_crit_types, selected_crit_bc, self.mca_wizard)
+        self.mca_wizard.hide()
+        self.mca_queue.add_run(job)
+
+    def finish_analysis_run(self, job, run_id):
+        """Adds a finished run, already saved by its worker, to the runs table"""
+        if run_id is not None:
+            job.wizard.deleteLater()
+            self.mca_runs_table.load(self.project.get_mca_runs_basic())
+            self.num_runs_label.setText(unicode(self.project.get_num_mca_runs()))
+            self.show_analysis_results(job.name, job.description, job.altern_data, job.crit_data, job.input_data, job.input_weights, job.final_scores)
         else:
-            if final_scores:
-                self.mca_wizard.hide()
-                self.mca_wizard.deleteLater()       
-                self.project.save_analysis(self.analysis_name, self.analysis_description, altern_data, crit_data, input_data, input_weights, final_scores, int_data)
-                self.mca_runs_table.load(self.project.get_mca_runs_basic())
-                self.gui_manager.clear_status_bar()
-                self.show_analysis_results(self.analysis_name, self.analysis_description, altern_data, crit_data, input_data, input_weights, final_scores)
-            else:
-                QMessageBox.critical(self,self.analysis_error, self.analysis_error_str)
-            
-
+            job.wizard.show()
+            QMessageBox.critical(job.wizard, self.analysis_error, self.analysis_error_str)
+
+    def fail_analysis_run(self, job, message):
+        if isinstance(job.error, ZeroDivisionError):
+            message = self.div_zero_error+": "+message
+        job.wizard.show()
+        QMessageBox.critical(job.wizard, self.analysis_error, job.name+": "+message)
+
+    def cancel_analysis_run(self, job):
+        job.wizard.deleteLater()
+
+    def cancel_analyses(self):
+        self.mca_queue.cancel_all()
+
+    def update_analysis_progress(self, job, fraction, eta):
+        self.analysis_progress_bar.setValue(int(self.mca_queue.get_fraction()*1000))
+
+    def update_analysis_queue(self):
+        """Shows the progress bar and cancel button while there are runs"""
+        num_runs = self.mca_queue.get_num_runs()
+        if num_runs:
+            self.gui_manager.win.statusbar.showMessage(self.process_str+" "+unicode(num_runs)+" "+self.runs_left_str)
+            self.analysis_progress_bar.setValue(int(self.mca_queue.get_fraction()*1000))
+            self.analysis_progress_bar.show()
+            self.cancel_analysis_button.show()
+        else:
+            self.gui_manager.clear_status_bar()
+            self.analysis_progress_bar.hide()
+            self.cancel_analysis_button.hide()
 
     def start_view_analysis(self):
         try:
@@ -584,52 +633,21 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
             #Add standardized weight 
             input_arr[i+1][-1] = unicode(int_results[0][i])
 
-        #quantitative impact matrix
-        quant_impact_arr = initialize_str_array(num_alterns+1, cols)
-        quant_impact_arr[0] = [""]+altern_names+["","",""]
-        
-        #qualitative impact matrix
-        qual_impact_arr = initialize_str_array(num_alterns+1, cols)
-        qual_impact_arr[0] = [""]+altern_names+["","",""]  
-        
-        #final impact matrix
-        final_arr = initialize_str_array(num_alterns+1, cols)
-        final_arr[0] = [""]+altern_names+["","",""] 
-        
         #final_score matrix
         final_score_arr = initialize_str_array(num_alterns+1, cols)
         final_score_arr[0] = [self.altern_str, self.score_str]
 
         for i in range(num_alterns):
-            #Add altern name to first column
-            quant_impact_arr[i+1][0] = altern_names[i]
-            #Fill in values
-            for j in range(num_alterns):
-                #data is transposed in the DB
-                quant_impact_arr[i+1][j+1] = unicode(int_results[1][j][i])
-            
-            #Add altern name to first column
-            qual_impact_arr[i+1][0] = altern_names[i]
-            #Fill in values
-            for j in range(num_alterns):
-                #data is transposed in the DB
-                qual_impact_arr[i+1][j+1] = unicode(int_results[2][j][i])
-                
-            #Add altern name to first column
-            final_arr[i+1][0] = altern_names[i]
-            #Fill in values
-            for j in range(num_alterns):
-                #data is transposed in the DB
-                final_arr[i+1][j+1] = unicode(int_results[3][j][i])
-
             #Add altern name to first column
             final_score_arr[i+1][0] = altern_names[i]
             #Fill in score
             final_score_arr[i+1][1] = unicode(results[i]) 
         
-        #Output lists to CSV
+        #Output lists to CSV, the n x n matrices are written a row at a time
+        #as they are read so that no full copy of them is built
         #writer = csv.writer(open(filename, "wb"), csv.excel)
-        writer = UnicodeWriter(open(filename, "wb"), csv.excel, 'utf-8')
+        out_file = open(filename, "wb")
+        writer = UnicodeWriter(out_file, csv.excel, 'utf-8')
         writer.writerows(header_arr)
         writer.writerows(blank_row)
         writer.writerows(build_header_row(cols, self.orig_data_str))
@@ -638,24 +656,36 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         writer.writerows(blank_row)
         writer.writerows(build_header_row(cols, self.quant_str))
         writer.writerows(blank_row)
-        writer.writerows(quant_impact_arr)
+        self.write_matrix_rows(writer, int_results[1], altern_names, cols)
         writer.writerows(blank_row)
         writer.writerows(build_header_row(cols, self.qual_str))
         writer.writerows(blank_row)
-        writer.writerows(qual_impact_arr)
+        self.write_matrix_rows(writer, int_results[2], altern_names, cols)
         writer.writerows(blank_row)
         writer.writerows(build_header_row(cols, self.final_str))
         writer.writerows(blank_row)
-        writer.writerows(final_arr)
+        self.write_matrix_rows(writer, int_results[3], altern_names, cols)
         writer.writerows(blank_row)
         writer.writerows(build_header_row(cols, self.final_alt_str))
         writer.writerows(blank_row)
         writer.writerows(final_score_arr)
         #writer.writerows(comments)
+        out_file.close()
         
         self.export_analysis_dialog.hide()
         self.export_analysis_dialog.deleteLater()
         QMessageBox.information(self,self.tpl_export_str, self.export_success+": "+filename)
+
+    def write_matrix_rows(self, writer, matrix, altern_names, cols):
+        """Writes an impact or final matrix to the CSV writer one row at a time,
+        a heading row of alternative names then a row per alternative
+        """
+        num_alterns = len(altern_names)
+        writer.writerow([""]+altern_names+["","",""])
+        for i in range(num_alterns):
+            #data is transposed in the DB, matrices may be stored packed or mapped
+            col = get_matrix_column(matrix, i)
+            writer.writerow([altern_names[i]]+[unicode(value) for value in col]+[""]*(cols-num_alterns-1))
     
     def start_delete_analysis(self):
         try:
@@ -698,33 +728,32 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
                     self.save_input()
 
         #if new tab is 3
-        if index is 3:
+        if index == 3:
             #If there are no alternatives then user should not be able to input data
-            num_alterns = len(self.project.get_all_alternatives())
+            num_alterns = self.project.num_alternatives()
             if num_alterns == 0:
                 self.tabProject.setCurrentIndex(self.cur_tab)
                 QMessageBox.critical(self,self.no_altern_error, self.no_altern_error_msg)
                 return
-            num_crits = len(self.project.get_all_criteria())
+            num_crits = self.project.num_criteria()
             if num_crits == 0:
                 self.tabProject.setCurrentIndex(self.cur_tab)
                 QMessageBox.critical(self,self.no_crits_error, self.no_crits_error_msg)
                 return                
 
-            #Make sure data input tab is loaded
-            if self.cur_tab > 3 and not self.input_table.loaded:
-                self.load_data_input()
-            if self.cur_tab < 3:
+            #Make sure data input tab is loaded, reloading only if the project
+            #changed since or there are unsaved edits to discard
+            if not self.input_table.loaded or self.input_revision != self.project.get_revision() or (self.cur_tab < 3 and self.save_button.isEnabled()):
                 self.load_data_input()
 
-        if index is 4:
+        if index == 4:
             #Must have at least two alternatives and one criterion to do analysis
-            num_alterns = len(self.project.get_all_alternatives())
+            num_alterns = self.project.num_alternatives()
             if num_alterns < 2:
                 self.tabProject.setCurrentIndex(self.cur_tab)
                 QMessageBox.critical(self,self.anal_altern_error, self.anal_altern_error_msg)
                 return
-            num_crits = len(self.project.get_all_criteria())
+            num_crits = self.project.num_criteria()
             if num_crits == 0:
                 self.tabProject.setCurrentIndex(self.cur_tab)
                 QMessageBox.critical(self,self.anal_crit_error, self.anal_crit_error_msg)
@@ -777,7 +806,7 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         self.not_csv_file = QApplication.translate("ProjectViewDialog", "You did not select a CSV file", "", QApplication.UnicodeUTF8)        
         self.import_error = QApplication.translate("ProjectViewDialog", "Import Error", "", QApplication.UnicodeUTF8)        
         self.import_error_msg = QApplication.translate("ProjectViewDialog", "Missing or malformed values in CSV file, check all cells where input values are expected.  Make sure you are providing option *numbers* instead of option names.  See column B for option numbers", "", QApplication.UnicodeUTF8)        
-        self.import_succes = QApplication.translate("ProjectViewDialog", "Import Successful", "", QApplication.UnicodeUTF8)        
+        self.import_success = QApplication.translate("ProjectViewDialog", "Import Successful", "", QApplication.UnicodeUTF8)        
         self.import_success_msg = QApplication.translate("ProjectViewDialog", "CSV loaded successfully", "", QApplication.UnicodeUTF8)        
         self.bad_value = QApplication.translate("ProjectViewDialog", "A bad value was found in the imported CSV file. ", "", QApplication.UnicodeUTF8)        
         self.value_str = QApplication.translate("ProjectViewDialog", "Value", "", QApplication.UnicodeUTF8)        
@@ -789,6 +818,7 @@ class ProjectViewDialog(QDialog, Ui_ProjectView):
         self.process_str = QApplication.translate("ProjectViewDialog", "Processing...", "", QApplication.UnicodeUTF8)        
         self.analysis_error = QApplication.translate("ProjectViewDialog", "Analysis Error", "", QApplication.UnicodeUTF8)        
         self.div_zero_error = QApplication.translate("ProjectViewDialog", "Division by zero", "", QApplication.UnicodeUTF8)        
+        self.runs_left_str = QApplication.translate("ProjectViewDialog", "analyses left", "", QApplication.UnicodeUTF8)        
         self.view_error = QApplication.translate("ProjectViewDialog", "View Error", "", QApplication.UnicodeUTF8)        
         self.analysis_error_str = QApplication.translate("ProjectViewDialog", "The analysis failed for unknown reasons", "", QApplication.UnicodeUTF8)        
 